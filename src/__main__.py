@@ -9,75 +9,134 @@ sys.path.insert(0, str(str(Path(__file__).parent.parent)))
 
 from typing import TYPE_CHECKING
 
-from src.agents import GCKeyRatesAgent, GCKeyRatesAgentClean, GeminiKeyRatesAgent
+from src import pipeline
+from src.agents import AGENTS, load_agent
+from src.agents.router import AgentRouter, BackendSpec
 from src.config import config
+from src.core import deadline, metrics, pdf, usage
+from src.core.classifier import DocumentClassifier
 from src.core.logger import init_logger
+from src.dao import leases
+from src.dao.jobs import init_jobs
+from src.dao.ledger import init_ledger
 from src.dao.mail import Mailer
+from src.dao.warm_start import init_warm_cache
+from src.pipeline import Pipeline
 
 if TYPE_CHECKING:
     from src.core.intrfaces import KeyRatesAgentInterface
 
 loggger = init_logger(config.APP_NAME, config.LOG_LEVEL)
 
+MAIL_CURSOR = "mail"  # Позиция чтения почты в хранилище заданий
 
-def main(mode: str) -> None:  # noqa: D103, PLR0912
-    agent: KeyRatesAgentInterface
-    if mode == "SL":
-        agent = GCKeyRatesAgent(
+
+def build_agent(spec: BackendSpec) -> KeyRatesAgentInterface:
+    """Создать агента для модели из настроек."""
+    model = {"model": spec.model} if spec.model else {}
+    if spec.mode == "SL":
+        return load_agent(spec.mode)(
             config.GIGACHAT_KEY,
             config.URL_KEY_RATES,
             config.URL_KEY_RATES_ATTRS,
             config.URL_KEY_RATES_NAMES,
+            alias_path=config.ALIASES_PATH,
+            **model,
         )
-    elif mode == "G":
-        agent = GeminiKeyRatesAgent(
+    if spec.mode == "G":
+        return load_agent(spec.mode)(
             config.GEMINI_KEY,
             config.URL_KEY_RATES,
             config.URL_KEY_RATES_ATTRS,
             config.URL_KEY_RATES_NAMES,
+            **model,
         )
-    elif mode == "S":
-        agent = GCKeyRatesAgentClean(
+    if spec.mode == "S":
+        return load_agent(spec.mode)(
             config.GIGACHAT_KEY,
             config.URL_KEY_RATES,
             config.URL_KEY_RATES_ATTRS,
             config.URL_KEY_RATES_NAMES,
+            alias_path=config.ALIASES_PATH,
+            **model,
         )
-    else:
-        raise ValueError("Unknown mode")
+    raise ValueError("Unknown mode")
+
+
+def configure() -> None:
+    """Перенести настройки из конфигурации в модули и запустить сервер метрик."""
+    leases.settings.owner = config.INSTANCE_ID or leases.settings.owner
+    leases.settings.ttl = config.LEASE_SECONDS
+    pdf.settings.workers = config.PDF_WORKERS
+    pdf.settings.prefilter = config.PDF_PREFILTER
+    deadline.settings.document = config.DOC_DEADLINE_SECONDS
+    deadline.settings.upload = config.UPLOAD_TIMEOUT_SECONDS
+    deadline.settings.step = config.STEP_TIMEOUT_SECONDS
+    deadline.settings.tool = config.TOOL_TIMEOUT_SECONDS
+    deadline.settings.delete = config.DELETE_TIMEOUT_SECONDS
+    pipeline.settings.depth = config.PIPELINE_DEPTH
+    usage.settings.document_tokens = config.DOC_TOKEN_BUDGET
+    usage.settings.document_cost = config.DOC_COST_BUDGET
+    usage.settings.prices |= usage.parse_prices(config.MODEL_PRICES)
+    if config.METRICS_PORT:
+        metrics.serve(config.METRICS_PORT, config.METRICS_HOST)
+
+
+def main(mode: str) -> None:  # noqa: D103
+    config.LEDGER_PATH.parent.mkdir(parents=True, exist_ok=True)
+    init_ledger(config.LEDGER_PATH, config.LEDGER_RETENTION_HOURS)
+    config.JOBS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    jobs = init_jobs(config.JOBS_PATH, config.JOBS_RETENTION_HOURS)
+    init_warm_cache(config.WARM_CACHE_PATH, config.WARM_CACHE_TTL_HOURS)
+    configure()
+    classifier = DocumentClassifier.from_config(config.CLASSIFIER_MODEL, config.CLASSIFIER_THRESHOLD)
+
+    specs = BackendSpec.parse(config.ROUTE_BACKENDS) or [BackendSpec(mode)]
+    agent = AgentRouter.from_specs(specs, build_agent, config.ROUTE_POLICY)
+    loggger.info("Модели: %s, политика: %s", ", ".join(spec.name for spec in specs), config.ROUTE_POLICY)
+    conveyor = Pipeline(agent, classifier)
 
     start_time = dt.datetime.now(tz=dt.UTC) - dt.timedelta(days=12)
     m = Mailer(host=config.MAIL_HOST, port=config.MAIL_PORT, username=config.MAIL_BOX, password=config.MAIL_PASSWORD)
     while True:
         try:
+            # Прерванные задания, в том числе брошенные остановившимися экземплярами
+            conveyor.resume()
+            # Чтение почты продолжается от последнего письма, обработанного любым экземпляром
+            cursor = jobs.cursor(MAIL_CURSOR)
+            if cursor:
+                start_time = max(start_time, dt.datetime.fromisoformat(cursor))
             emails = m.read_new_messages(start_time)
             if not emails:
                 loggger.info("No new messages")
             else:
-                start_time = emails[-1].recived_at + dt.timedelta(seconds=1)
                 loggger.info("Found %d new messages", len(emails))
                 for email in emails:
                     loggger.info("Processing email: %s", email.subject)
-                    if email.attachments:
-                        for attachment in email.attachments:
-                            if attachment.type_ == "pdf":
-                                err, file_id = agent.load_file(attachment)
-                                if file_id:
-                                    agent.process_file(file_id)
-                                    agent.delete_file(file_id)
+                    conveyor.submit_email(email)
+                    start_time = email.recived_at + dt.timedelta(seconds=1)
+                    jobs.set_cursor(MAIL_CURSOR, start_time.isoformat())
                     sleep(30)
+            depths = conveyor.depths()
+            for stage, depth in depths.items():
+                metrics.QUEUE_DEPTH.set(depth, stage=stage)
+            loggger.info("Очереди конвейера: %s", depths)
             sleep(60)
         except KeyboardInterrupt:
             break
         except Exception as e:
             loggger.error(e.__class__, exc_info=True)
+    conveyor.close()
+    agent.close()
 
 
 if __name__ == "__main__":
     try:
         mode = ""
-        while mode not in ["G", "SL", "S"]:
-            mode = input("Select mode: G (Gemini), SL (Gigachat + LC), S (Gigachat)\n>>> ").upper()
+        modes = ", ".join(f"{key} ({title})" for key, (_, title) in AGENTS.items())
+        # Без списка моделей для маршрутизации режим выбирается при запуске
+        while not config.ROUTE_BACKENDS and mode not in AGENTS:
+            mode = input(f"Select mode: {modes}\n>>> ").upper()
 
         main(mode)
 
@@ -1,7 +1,45 @@
-"""ИИ-Агенты."""
+"""ИИ-Агенты.
+
+Модули агентов импортируются только при обращении к ним: каждый тянет за собой SDK своей модели,
+а в работе используется только один.
+"""  # noqa: RUF002
 
 from __future__ import annotations
 
-from ._gemini.assistants import KeyRatesAgent as GeminiKeyRatesAgent
-from ._gigachat.assistants import KeyRatesAgent as GCKeyRatesAgent
-from ._gigachat.assistants_clean import KeyRatesAgent as GCKeyRatesAgentClean
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from src.core.intrfaces import KeyRatesAgentInterface
+
+# Режим запуска -> (модуль агента, описание)
+AGENTS = {
+    "G": ("src.agents._gemini.assistants", "Gemini"),
+    "SL": ("src.agents._gigachat.assistants", "Gigachat + LC"),
+    "S": ("src.agents._gigachat.assistants_clean", "Gigachat"),
+}
+# Прежние имена классов -> режим
+_ALIASES = {
+    "GeminiKeyRatesAgent": "G",
+    "GCKeyRatesAgent": "SL",
+    "GCKeyRatesAgentClean": "S",
+}
+
+__all__ = ["AGENTS", "GCKeyRatesAgent", "GCKeyRatesAgentClean", "GeminiKeyRatesAgent", "load_agent"]
+
+
+def load_agent(mode: str) -> type[KeyRatesAgentInterface]:
+    """Импортировать модуль агента для режима и вернуть класс агента."""
+    if mode not in AGENTS:
+        msg = f"Unknown mode: {mode}"
+        raise ValueError(msg)
+
+    return import_module(AGENTS[mode][0]).KeyRatesAgent
+
+
+def __getattr__(name: str) -> type[KeyRatesAgentInterface]:
+    if name in _ALIASES:
+        return load_agent(_ALIASES[name])
+
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
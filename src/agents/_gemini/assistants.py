@@ -2,35 +2,70 @@
 
 from __future__ import annotations
 
+import asyncio
+import json
+from collections import Counter
+from dataclasses import dataclass, field
+from enum import StrEnum
+from http import HTTPStatus
 from io import BytesIO
 from time import sleep
-from typing import TYPE_CHECKING, Self
+from typing import TYPE_CHECKING, Any, Self
 
 from google import genai
 from google.genai import types as gtypes
 from google.genai.errors import ClientError as GClientError
 from google.genai.errors import ServerError as GServerError
 
-from src.core.intrfaces import KeyRatesAgentInterface
+from src.core.deadline import DeadlineExceededError, arun_stage, run_stage
+from src.core.intrfaces import (
+    AsyncKeyRatesAgentInterface,
+    BackendUnavailableError,
+    KeyRatesAgentInterface,
+    QuotaExceededError,
+)
 from src.core.logger import logger as log
+from src.core.openapi import openapi_slice
+from src.core.prompt import estimate_tokens
+from src.core.usage import Usage, record
+from src.dao import jobs
 
-from .tools import http_request, url_tool
+from .tools import registry, tool_declarations
+from .uploads import UploadCache
 
 if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from src.core.tools import ToolResult
     from src.dto import FileDTO
 
+BACKEND = "gemini"
 ERROR_WORD = "ERROR"
 STOP_WORD = "STOP"
-FUNC_MAP = {http_request.__name__: http_request}
+OPENAPI_FILE = "openapi.json"
 
 END_QUOTA = "429 RESOURCE_EXHAUSTED."
+STEP_PAUSE = 5  # Секунд между шагами
+WRITE_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+HEAD_PARTS = 2  # Инструкция и файл в начале диалога: не сохраняются, при продолжении файл загружен заново
+
+
+@dataclass(frozen=True)
+class ModelTier:
+    """Ступень каскада: модель и предел шагов диалога на один файл."""
 
-# Самая быстрая, но при длинной цепи вызовов начинает ошибаться.
-# Может быть несколько чатов спасёт её.
-# USE_MODEL = "gemini-2.5-flash-lite-preview-06-17"
-USE_MODEL = "gemini-2.5-flash"
-# Самая умная
-# USE_MODEL = "gemini-2.5-pro"
+    model: str
+    max_steps: int
+
+
+# Каскад моделей: документ обрабатывает самая дешёвая, более сильная - только если она не справилась.
+MODEL_TIERS = (
+    # Самая быстрая, но при длинной цепи вызовов начинает ошибаться.
+    ModelTier("gemini-2.5-flash-lite-preview-06-17", max_steps=10),
+    ModelTier("gemini-2.5-flash", max_steps=15),
+    # Самая умная
+    ModelTier("gemini-2.5-pro", max_steps=20),
+)
 
 LOAD_KEY_RATES_PROMPT = f"""
 # Задача по работе с API
@@ -99,8 +134,105 @@ LOAD_KEY_RATES_PROMPT = f"""
 "{ERROR_WORD}: не найдено подходящего атрибута для X".
 """
 
+ESCALATION_PROMPT = """
+Предыдущая модель (%s) не справилась с задачей, итог: %s.
+Ниже приведены уже выполненные ею успешные запросы на чтение и ответы сервера: не повторяй их.
+Проверь, какие данные уже загружены на сервер, и доведи загрузку до конца.
+"""
+
+
+class Outcome(StrEnum):
+    """Итог обработки файла одной моделью."""
+
+    DONE = "done"  # Модель завершила работу, последняя запись на сервер успешна
+    INVALID = "invalid"  # Модель завершила работу, но данные на сервер не загружены
+    ERROR = "error"  # Модель ответила словом ERROR_WORD
+    BUDGET = "budget"  # Исчерпан предел шагов
+    NO_DATA = "no_data"  # Ответ модели не удалось разобрать
+
+
+@dataclass
+class Dialog:
+    """Диалог с моделью по одному файлу."""  # noqa: RUF002
+
+    contents: list[gtypes.Part]
+    model: str = ""
+    steps: int = 0
+    spent_tokens: int = 0
+    outcome: Outcome | None = None
+    writes: list[bool] = field(default_factory=list)  # Успешность запросов, изменяющих данные на сервере
+    facts: list[gtypes.Part] = field(default_factory=list)  # Успешные запросы на чтение и ответы на них
+
+    def finish(self: Self) -> None:
+        """Модель закончила работу: проверить, что данные загружены."""
+        self.outcome = Outcome.DONE if self.writes and self.writes[-1] else Outcome.INVALID
+
+    def state(self: Self) -> dict[str, Any]:
+        """Контрольная точка диалога для хранилища заданий."""
+        return {
+            "model": self.model,
+            "steps": self.steps,
+            "spent_tokens": self.spent_tokens,
+            "outcome": self.outcome,
+            "writes": self.writes,
+            "contents": [_dump(part) for part in self.contents[HEAD_PARTS:]],
+            "facts": [_dump(part) for part in self.facts],
+        }
+
+    @classmethod
+    def from_state(cls: type[Self], head: list[gtypes.Part], state: dict[str, Any]) -> Self:
+        """Восстановить диалог из контрольной точки с новыми инструкцией и файлом."""  # noqa: RUF002
+        return cls(
+            contents=[*head, *map(gtypes.Part.model_validate, state["contents"])],
+            model=state["model"],
+            steps=state["steps"],
+            spent_tokens=state["spent_tokens"],
+            outcome=None if state["outcome"] is None else Outcome(state["outcome"]),
+            writes=list(state["writes"]),
+            facts=list(map(gtypes.Part.model_validate, state["facts"])),
+        )
+
+
+def _dump(part: gtypes.Part) -> dict[str, Any]:
+    return part.model_dump(mode="json", exclude_none=True)
 
-class KeyRatesAgent(KeyRatesAgentInterface):
+
+def _method(call: gtypes.FunctionCall) -> str:
+    """HTTP-метод вызова функции в верхнем регистре."""
+    return str((call.args or {}).get("method", "")).upper()
+
+
+def _usage(metadata: gtypes.GenerateContentResponseUsageMetadata, contents: list[gtypes.Part]) -> Usage:
+    """Токены шага: ответы функций модель не считает отдельно, они оцениваются по тексту запроса."""
+    tool_prompt = metadata.tool_use_prompt_token_count or 0
+    prompt = (metadata.prompt_token_count or 0) + tool_prompt
+    responses = sum(
+        estimate_tokens(json.dumps(part.function_response.response, ensure_ascii=False))
+        for part in contents
+        if part.function_response is not None
+    )
+    return Usage(
+        input=prompt,
+        cached=metadata.cached_content_token_count or 0,
+        tool=min(tool_prompt + responses, prompt),
+        output=(metadata.candidates_token_count or 0) + (metadata.thoughts_token_count or 0),
+    )
+
+
+@dataclass
+class TierStats:
+    """Статистика ступени каскада."""
+
+    attempts: int = 0
+    outcomes: Counter[Outcome] = field(default_factory=Counter)
+
+    @property
+    def success_rate(self: Self) -> float:
+        """Доля файлов, обработанных без перехода к следующей модели."""
+        return self.outcomes[Outcome.DONE] / self.attempts if self.attempts else 0.0
+
+
+class KeyRatesAgent(KeyRatesAgentInterface, AsyncKeyRatesAgentInterface):
     """Агент загружает файл в формате PDF, вытаскивает из него нужную информацию и отправляет на сервер."""
 
     name = "KeyRatesPDF"
@@ -111,10 +243,13 @@ class KeyRatesAgent(KeyRatesAgentInterface):
         doc_url: str,
         doc_attrs_url: str,  # noqa: ARG002
         key_rate_doc_names_url: str,  # noqa: ARG002
+        model: str | None = None,
     ) -> None:
-        tools = gtypes.Tool(function_declarations=[url_tool])
+        tools = gtypes.Tool(function_declarations=tool_declarations)
 
         self._doc_url = doc_url
+        # Указанная модель обрабатывает файлы одна, без каскада
+        self._tiers = MODEL_TIERS if model is None else (ModelTier(model, MODEL_TIERS[-1].max_steps),)
         self._model = genai.Client(api_key=api_key)
         self._config = gtypes.GenerateContentConfig(
             temperature=0,
@@ -122,100 +257,307 @@ class KeyRatesAgent(KeyRatesAgentInterface):
             thinking_config=gtypes.ThinkingConfig(include_thoughts=False),
         )
         self._sys_prompt = LOAD_KEY_RATES_PROMPT % self._doc_url
+        self.tier_stats = {tier.model: TierStats() for tier in self._tiers}
+        # Одинаковые файлы загружаются один раз, удаление идёт в фоне
+        self._uploads = UploadCache(self._delete_upload, self._uploaded_uris)
         return None
 
     def load_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
+        uri = self._uploads.acquire(file_dto.content)
+        if uri is not None:
+            return None, uri
+
         try:
-            up_file = self._model.files.upload(
+            up_file = run_stage(
+                "upload",
+                self._model.files.upload,
                 file=BytesIO(file_dto.content),
-                config=gtypes.UploadFileConfig(mime_type=f"application/{file_dto.type_}"),
+                config=self._upload_config(file_dto),
+                on_late=self._release_late,
             )
+        except DeadlineExceededError:
+            raise
         except Exception as e:
-            log.info("%s: %s", e.__class__.__name__, e.args)
-            return "Не удалось загрузить файл. Проверьте формат и попробуйте снова.", None
+            return self._upload_failed(e), None
 
-        log.info("Файл загружен. ID: %s", up_file.uri)
-        return (
-            None,
-            up_file.uri,
-        )
+        return None, self._uploaded(file_dto, up_file)
+
+    async def aload_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
+        uri = self._uploads.acquire(file_dto.content)
+        if uri is not None:
+            return None, uri
 
-    def delete_file(self: Self, file_id: str) -> None:  # noqa: D102
-        self._model.files.delete(name=file_id)
         try:
-            self._model.files.get(name=file_id)
-        except GClientError:
-            log.info("Файл удален.")
-        else:
-            log.info("Файл не удален. %s", file_id)
+            up_file = await arun_stage(
+                "upload",
+                self._model.aio.files.upload(file=BytesIO(file_dto.content), config=self._upload_config(file_dto)),
+            )
+        except DeadlineExceededError:
+            raise
+        except Exception as e:
+            return self._upload_failed(e), None
 
-        return None
+        return None, self._uploaded(file_dto, up_file)
 
-    def process_file(self: Self, file_id: str) -> None:  # noqa: D102
-        spent_tokens = 0
-        contents_parts = [gtypes.Part(text=self._sys_prompt), gtypes.Part(file_data=gtypes.FileData(file_uri=file_id))]
-        for step in range(1, 21):
+    def _uploaded(self: Self, file_dto: FileDTO, up_file: gtypes.File) -> str | None:
+        log.info("Файл загружен. ID: %s", up_file.uri)
+        if up_file.uri:
+            self._uploads.add(file_dto.content, up_file.uri)
+        return up_file.uri
+
+    def _release_late(self: Self, up_file: gtypes.File) -> None:
+        """Файл, загруженный после истечения времени этапа, никто не использует: он удаляется в фоне."""
+        if up_file.uri:
+            self._uploads.release(up_file.uri)
+
+    @staticmethod
+    def _upload_config(file_dto: FileDTO) -> gtypes.UploadFileConfig:
+        return gtypes.UploadFileConfig(mime_type=f"application/{file_dto.type_}")
+
+    @staticmethod
+    def _upload_failed(e: Exception) -> str:
+        log.info("%s: %s", e.__class__.__name__, e.args)
+        return "Не удалось загрузить файл. Проверьте формат и попробуйте снова."
+
+    def delete_file(self: Self, file_id: str) -> None:
+        """Освободить файл: он удаляется в фоне, если не понадобится для повтора или такого же вложения."""
+        self._uploads.release(file_id)
+
+    async def adelete_file(self: Self, file_id: str) -> None:  # noqa: D102
+        self.delete_file(file_id)
+
+    def close(self: Self) -> None:
+        """Удалить из модели все освобождённые файлы."""
+        self._uploads.close()
+
+    def _delete_upload(self: Self, uri: str) -> None:
+        run_stage("delete", self._model.files.delete, name=uri)
+
+    def _uploaded_uris(self: Self) -> Iterator[str]:
+        return (file.uri for file in self._model.files.list() if file.uri)
+
+    def _head(self: Self, file_id: str) -> list[gtypes.Part]:
+        return [gtypes.Part(text=self._sys_prompt), gtypes.Part(file_data=gtypes.FileData(file_uri=file_id))]
+
+    def _dialog(self: Self, file_id: str, tier: ModelTier, previous: Dialog | None = None) -> Dialog:
+        """Диалог для файла, при переходе к следующей модели - с уже полученными данными."""  # noqa: RUF002
+        contents = self._head(file_id)
+        if previous is None or previous.outcome is None:
+            return Dialog(contents, tier.model)
+
+        contents.append(gtypes.Part(text=ESCALATION_PROMPT % (previous.model, previous.outcome)))
+        return Dialog([*contents, *previous.facts], tier.model, facts=list(previous.facts))
+
+    def _restore(self: Self, file_id: str) -> tuple[int, Dialog | None]:
+        """Продолжить диалог с контрольной точки задания, если она есть.
+
+        Returns:
+            tuple[int, Dialog | None]: Номер ступени каскада, с которой продолжается обработка, и диалог.
+                Если модель из контрольной точки уже закончила работу, обработка продолжается со следующей.
+        """  # noqa: RUF002
+        state = jobs.restore()
+        models = [tier.model for tier in self._tiers]
+        if state is None or state.get("model") not in models:
+            return 0, None
+
+        dialog = Dialog.from_state(self._head(file_id), state)
+        log.info("%s: диалог продолжается после %d шагов", dialog.model, dialog.steps)
+        index = models.index(dialog.model)
+        return (index if dialog.outcome is None else index + 1), dialog
+
+    def _checkpoint(self: Self, dialog: Dialog) -> None:
+        jobs.checkpoint(dialog.state(), steps=dialog.steps, tool_calls=sum(dialog.writes))
+
+    def _request_failed(self: Self, model: str, e: GClientError | GServerError) -> None:
+        """Ошибки квоты и сервера передаются вызывающему: файл можно отправить в другую модель."""
+        log.error(e.args[0])
+        if isinstance(e, GServerError):
+            raise BackendUnavailableError(str(e.args[0])) from e
+
+        if e.code == HTTPStatus.TOO_MANY_REQUESTS or e.args[0].startswith(END_QUOTA):
+            log.critical("Достигнут лимит токенов %s. Повторите запрос позже.", model)
+            raise QuotaExceededError(str(e.args[0])) from e
+
+    @staticmethod
+    def _read_response(
+        response: gtypes.GenerateContentResponse,
+        dialog: Dialog,
+    ) -> list[gtypes.FunctionCall]:
+        """Добавить ответ модели в контекст.
+
+        Returns:
+            list[gtypes.FunctionCall]: Вызовы функций, которые нужно выполнить.
+                Если обработка закончилась, её итог записывается в `dialog.outcome`.
+        """
+        if (
+            response.candidates is None
+            or not response.candidates
+            or response.candidates[0].content is None
+            or not response.candidates[0].content.parts
+            or response.usage_metadata is None
+            or response.usage_metadata.total_token_count is None
+        ):
+            log.error("Не удалось получить данные от модели")
+            log.info(response)
+            dialog.outcome = Outcome.NO_DATA
+            return []
+
+        dialog.spent_tokens += response.usage_metadata.total_token_count
+        record(BACKEND, dialog.model, _usage(response.usage_metadata, dialog.contents))
+        calls = []
+        for part in response.candidates[0].content.parts:
+            if part.text:
+                log.info("Got text: %s", part.text[:33])
+                if part.text.strip() == STOP_WORD:
+                    dialog.finish()
+                    return []
+
+                if part.text.startswith(ERROR_WORD):
+                    log.error(part.text)
+                    dialog.outcome = Outcome.ERROR
+                    return []
+
+            dialog.contents.append(part)
+            if part.function_call:
+                log.info("Вызываем функцию: %s", part.function_call.name)
+                calls.append(part.function_call)
+
+            if not part.text and not part.function_call:
+                log.warning(response)
+        return calls
+
+    @staticmethod
+    def _function_response(dialog: Dialog, call: gtypes.FunctionCall, result: ToolResult) -> None:
+        """Добавить в диалог результат вызова функции."""
+        args = call.args or {}
+        method = _method(call)
+        if result.ok:
+            status, server_text = result.value
+            url = str(args.get("url", ""))
+            if status == HTTPStatus.OK and url.endswith(OPENAPI_FILE):
+                # Только операции, нужные для загрузки ставок, попадают в контекст
+                server_text = openapi_slice(server_text) or server_text
+            response_data = {"status": status, "data": server_text}
+            log.info("%d: %s", status, server_text[:111])
+        else:
+            # Модель получает описание ошибки и может исправить вызов
+            status, response_data = 0, result.error_response()
+
+        response = gtypes.Part(function_response=gtypes.FunctionResponse(name=call.name, response=response_data))
+        dialog.contents.append(response)
+        if method in WRITE_METHODS:
+            dialog.writes.append(HTTPStatus.OK <= status < HTTPStatus.MULTIPLE_CHOICES)
+        elif status == HTTPStatus.OK:
+            dialog.facts.extend((gtypes.Part(function_call=call), response))
+
+    def _record(self: Self, tier: ModelTier, dialog: Dialog) -> None:
+        if dialog.outcome is None:
+            dialog.outcome = Outcome.BUDGET
+        self._checkpoint(dialog)
+        stats = self.tier_stats[tier.model]
+        stats.attempts += 1
+        stats.outcomes[dialog.outcome] += 1
+        log.info(
+            "%s: %s за %d шагов, токенов: %d, успешно %.0f%% файлов",
+            tier.model,
+            dialog.outcome,
+            dialog.steps,
+            dialog.spent_tokens,
+            stats.success_rate * 100,
+        )
+
+    def _run(self: Self, tier: ModelTier, dialog: Dialog) -> None:
+        """Обработать файл одной моделью."""
+        for step in range(dialog.steps + 1, tier.max_steps + 1):
             log.info("Step %d", step)
+            dialog.steps = step
             try:
-                response = self._model.models.generate_content(
-                    model=USE_MODEL,
-                    contents=contents_parts,  # type: ignore[union-attr]
+                response = run_stage(
+                    "step",
+                    self._model.models.generate_content,
+                    model=tier.model,
+                    contents=dialog.contents,
                     config=self._config,
                 )
-            except GClientError as gce:
-                if gce.args[0].startswith(END_QUOTA):
-                    log.critical("Достигнут лимит токенов. Повторите запрос позже.")
+            except (GClientError, GServerError) as e:
+                self._request_failed(tier.model, e)
+                dialog.outcome = Outcome.NO_DATA
+                break
+
+            calls = self._read_response(response, dialog)
+            if dialog.outcome is not None:
+                break
+
+            for call in calls:
+                self._function_response(dialog, call, registry.call(call.name or "", call.args))
+            self._checkpoint(dialog)
+            sleep(STEP_PAUSE)
+        self._record(tier, dialog)
+
+    async def _arun(self: Self, tier: ModelTier, dialog: Dialog) -> None:
+        """Асинхронный вариант `_run`."""
+        for step in range(dialog.steps + 1, tier.max_steps + 1):
+            log.info("Step %d", step)
+            dialog.steps = step
+            try:
+                response = await arun_stage(
+                    "step",
+                    self._model.aio.models.generate_content(
+                        model=tier.model,
+                        contents=dialog.contents,  # type: ignore[arg-type]
+                        config=self._config,
+                    ),
+                )
+            except (GClientError, GServerError) as e:
+                self._request_failed(tier.model, e)
+                dialog.outcome = Outcome.NO_DATA
+                break
+
+            calls = self._read_response(response, dialog)
+            if dialog.outcome is not None:
+                break
+
+            if any(_method(call) in WRITE_METHODS for call in calls):
+                # Записи выполняются по очереди, в порядке, заданном моделью
+                results = [await registry.acall(call.name or "", call.args) for call in calls]
+            else:
+                # Чтения одного шага независимы и выполняются одновременно
+                results = await asyncio.gather(*(registry.acall(call.name or "", call.args) for call in calls))
+            for call, result in zip(calls, results, strict=True):
+                self._function_response(dialog, call, result)
+            self._checkpoint(dialog)
+            await asyncio.sleep(STEP_PAUSE)
+        self._record(tier, dialog)
 
-                log.error(gce.args[0])
-                return None
-            except GServerError as gse:
-                log.error(gse.args[0])
+    def process_file(self: Self, file_id: str) -> None:  # noqa: D102
+        start, dialog = self._restore(file_id)
+        if dialog is not None and dialog.outcome == Outcome.DONE:
+            return None
+
+        for tier in self._tiers[start:]:
+            if dialog is None or dialog.outcome is not None:
+                dialog = self._dialog(file_id, tier, dialog)
+            self._run(tier, dialog)
+            if dialog.outcome == Outcome.DONE:
                 return None
 
-            if (
-                response.candidates is None
-                or not response.candidates
-                or response.candidates[0].content is None
-                or not response.candidates[0].content.parts
-                or response.usage_metadata is None
-                or response.usage_metadata.total_token_count is None
-            ):
-                log.error("Не удалось получить данные от: %s", USE_MODEL)
-                log.info(response)
+        return self._exhausted(file_id)
+
+    @staticmethod
+    def _exhausted(file_id: str) -> None:
+        log.error("Ни одна модель не обработала файл %s", file_id)
+        jobs.fail("no model processed the file")
+
+    async def aprocess_file(self: Self, file_id: str) -> None:  # noqa: D102
+        start, dialog = self._restore(file_id)
+        if dialog is not None and dialog.outcome == Outcome.DONE:
+            return None
+
+        for tier in self._tiers[start:]:
+            if dialog is None or dialog.outcome is not None:
+                dialog = self._dialog(file_id, tier, dialog)
+            await self._arun(tier, dialog)
+            if dialog.outcome == Outcome.DONE:
                 return None
 
-            spent_tokens += response.usage_metadata.total_token_count
-            for part in response.candidates[0].content.parts:
-                if part.text:
-                    log.info("Got text: %s", part.text[:33])
-                    if part.text.strip() == STOP_WORD:
-                        log.info("Обработка файла завершена за %d шагов. Использовано токенов: %d", step, spent_tokens)
-                        return None
-
-                    if part.text.startswith(ERROR_WORD):
-                        log.error(part.text)
-                        return None
-
-                contents_parts.append(part)
-                if part.function_call:
-                    log.info("Вызываем функцию: %s", part.function_call.name)
-                    # TODO: Возможны функции не требующие аргументов? Добавить в маппинг флаг?
-                    if part.function_call.name not in FUNC_MAP or part.function_call.args is None:
-                        log.error("Модель не предоставила данные для вызова функции.")
-                        continue
-
-                    status, server_text = FUNC_MAP[part.function_call.name](**part.function_call.args)
-                    contents_parts.append(
-                        gtypes.Part(
-                            function_response=gtypes.FunctionResponse(
-                                name=part.function_call.name,
-                                response={"status": status, "data": server_text},
-                            ),
-                        ),
-                    )
-                    log.info("%d: %s", status, server_text[:111])
-
-                if not part.text and not part.function_call:
-                    log.warning(response)
-            sleep(5)
-        return None
+        return self._exhausted(file_id)
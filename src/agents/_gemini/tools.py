@@ -1,18 +1,33 @@
 from __future__ import annotations
 
+import time
 from http import HTTPMethod  # noqa: TC003
 from typing import Annotated
 
 import httpx
-from pydantic import Field
+from pydantic import BeforeValidator, Field
 
+from src.core.deadline import stage_timeout
 from src.core.logger import logger as log
+from src.core.metrics import observe_tool
+from src.core.tools import ToolRegistry
+from src.dao.ledger import ledger
 
 from .utils import func_to_gemi
 
+REQUEST_TIMEOUT = 30.0  # Секунд на HTTP-запрос
 
+registry = ToolRegistry()
+
+
+def _upper(value: object) -> object:
+    """Метод в любом регистре, как принимал `httpx`."""
+    return value.upper() if isinstance(value, str) else value
+
+
+@registry.tool(timeout=REQUEST_TIMEOUT + 5)
 def http_request(
-    method: Annotated[HTTPMethod, Field(description="Метод HTTP-запроса")],
+    method: Annotated[HTTPMethod, Field(description="Метод HTTP-запроса"), BeforeValidator(_upper)],
     url: Annotated[str, Field(description="URL-адрес сервера, куда нужно отправить HTTP-запрос")],
     data: Annotated[dict | None, Field(description="Данные для отправки в теле запроса")] = None,
 ) -> tuple[int, str]:
@@ -22,12 +37,21 @@ def http_request(
         tuple[int, str]: Статус выполнения запроса и тело ответа.
     """
     log.info("%s %s", method, url)
+    started = time.perf_counter()
+    prior = ledger.lookup(method, url, data)
+    if prior is not None:
+        observe_tool(method, url, "ledger", started)
+        return prior
+
     try:
-        response = httpx.request(method, url, json=data)
+        response = httpx.request(method, url, json=data, timeout=stage_timeout("tool", REQUEST_TIMEOUT))
     except Exception as e:
+        observe_tool(method, url, e.__class__.__name__, started)
         return 0, str(e)
 
+    observe_tool(method, url, response.status_code, started)
+    ledger.record(method, url, data, response.status_code, response.text)
     return response.status_code, response.text
 
 
-url_tool = func_to_gemi(http_request)
+tool_declarations = registry.declarations(func_to_gemi)
@@ -0,0 +1,194 @@
+"""Повторное использование загруженных в Gemini файлов и их удаление в фоне.
+
+Файл с тем же содержимым не загружается повторно, пока модель его хранит: повторная обработка
+и одинаковые вложения используют уже загруженный файл. Освобождённые файлы удаляются
+фоновым потоком пачками, а удаление проверяется одним запросом списка файлов при следующем проходе.
+"""  # noqa: RUF002
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Self
+
+from src.core.logger import logger as log
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+
+RETENTION = 48 * 60 * 60.0  # Секунд, которые Gemini хранит загруженный файл
+RETENTION_MARGIN = 60 * 60.0  # Запас до удаления файла моделью: файл перестаёт использоваться раньше
+KEEP_AFTER_USE = 10 * 60.0  # Секунд, которые освобождённый файл ждёт повторного использования
+REAP_INTERVAL = 30.0  # Секунд между проходами фонового удаления
+MAX_DELETE_ATTEMPTS = 3  # Попыток удалить файл, после которых файл остаётся до истечения срока хранения
+
+
+def content_hash(content: bytes) -> str:
+    """Ключ файла по содержимому."""
+    return hashlib.sha256(content).hexdigest()
+
+
+@dataclass
+class Upload:
+    """Загруженный в модель файл."""
+
+    uri: str
+    digest: str
+    uploaded_at: float
+    users: int = 1  # Документов, которые сейчас используют этот файл
+    released_at: float | None = None  # Когда файл освободился, None - пока используется
+    delete_attempts: int = 0
+
+
+class UploadCache:
+    """Загруженные файлы по хешу содержимого и фоновое удаление освобождённых файлов."""
+
+    def __init__(
+        self: Self,
+        delete: Callable[[str], object],
+        list_uris: Callable[[], Iterable[str]],
+        keep: float = KEEP_AFTER_USE,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Кэш загрузок.
+
+        Args:
+            delete (Callable[[str], object]): Удалить файл из модели.
+            list_uris (Callable[[], Iterable[str]]): Адреса файлов, которые модель сейчас хранит.
+            keep (float): Секунд, которые освобождённый файл ждёт повторного использования.
+            clock (Callable[[], float]): Источник времени.
+        """
+        self._delete = delete
+        self._list_uris = list_uris
+        self._keep = keep
+        self._clock = clock
+        self._by_digest: dict[str, Upload] = {}
+        self._uploads: dict[str, Upload] = {}
+        self._deleted: dict[str, Upload] = {}  # Удалены, но удаление ещё не проверено
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reaper: threading.Thread | None = None
+
+    def acquire(self: Self, content: bytes) -> str | None:
+        """Адрес уже загруженного файла с тем же содержимым, None - если файл нужно загрузить."""  # noqa: RUF002
+        digest = content_hash(content)
+        with self._lock:
+            upload = self._by_digest.get(digest)
+            if upload is None or self._expired(upload):
+                return None
+
+            upload.users += 1
+            upload.released_at = None
+        log.info("Файл уже загружен, используется повторно. ID: %s", upload.uri)
+        return upload.uri
+
+    def add(self: Self, content: bytes, uri: str) -> None:
+        """Запомнить загруженный файл."""
+        upload = Upload(uri, content_hash(content), self._clock())
+        with self._lock:
+            self._by_digest[upload.digest] = upload
+            self._uploads[uri] = upload
+
+    def release(self: Self, uri: str) -> None:
+        """Документ больше не использует файл: файл будет удалён в фоне, если не понадобится снова."""
+        with self._lock:
+            upload = self._uploads.get(uri)
+            if upload is None:
+                # Файл загружен не через кэш: удаляется при следующем проходе
+                upload = self._uploads[uri] = Upload(uri, "", self._clock(), users=0)
+            upload.users = max(upload.users - 1, 0)
+            if upload.users == 0:
+                upload.released_at = self._clock()
+        self._start()
+
+    def reap(self: Self, *, everything: bool = False) -> int:
+        """Удалить освобождённые файлы, которые не использовались `keep` секунд или скоро истекут.
+
+        Args:
+            everything (bool): Удалить все освобождённые файлы, не дожидаясь срока.
+
+        Returns:
+            int: Количество удалённых файлов.
+        """
+        self._verify()
+        now = self._clock()
+        with self._lock:
+            batch = [
+                upload
+                for upload in self._uploads.values()
+                if upload.released_at is not None
+                and (everything or now - upload.released_at >= self._keep or self._expired(upload))
+            ]
+            for upload in batch:
+                self._forget(upload)
+
+        deleted = 0
+        for upload in batch:
+            upload.delete_attempts += 1
+            try:
+                self._delete(upload.uri)
+            except Exception as e:
+                log.warning("Файл %s не удалён: %s", upload.uri, e)
+                self._retry(upload)
+                continue
+            deleted += 1
+            with self._lock:
+                self._deleted[upload.uri] = upload
+        if batch:
+            log.info("Удалено файлов из модели: %d из %d", deleted, len(batch))
+        return deleted
+
+    def close(self: Self) -> None:
+        """Остановить фоновое удаление и удалить все освобождённые файлы."""
+        self._stop.set()
+        if self._reaper is not None:
+            self._reaper.join()
+        self.reap(everything=True)
+
+    def _verify(self: Self) -> None:
+        """Проверить удаление файлов прошлого прохода одним запросом списка файлов."""
+        with self._lock:
+            deleted, self._deleted = self._deleted, {}
+        if not deleted:
+            return
+
+        try:
+            remaining = deleted.keys() & set(self._list_uris())
+        except Exception as e:
+            log.warning("Не удалось проверить удаление файлов: %s", e)
+            return
+
+        for uri in remaining:
+            log.info("Файл не удален. %s", uri)
+            self._retry(deleted[uri])
+
+    def _retry(self: Self, upload: Upload) -> None:
+        if upload.delete_attempts >= MAX_DELETE_ATTEMPTS:
+            log.error("Файл %s не удалён за %d попыток", upload.uri, upload.delete_attempts)
+            return
+        with self._lock:
+            self._uploads.setdefault(upload.uri, upload)
+
+    def _forget(self: Self, upload: Upload) -> None:
+        self._uploads.pop(upload.uri, None)
+        if self._by_digest.get(upload.digest) is upload:
+            del self._by_digest[upload.digest]
+
+    def _expired(self: Self, upload: Upload) -> bool:
+        return self._clock() - upload.uploaded_at >= RETENTION - RETENTION_MARGIN
+
+    def _start(self: Self) -> None:
+        with self._lock:
+            if self._reaper is not None or self._stop.is_set():
+                return
+            self._reaper = threading.Thread(target=self._run, name="gemini-reaper", daemon=True)
+        self._reaper.start()
+
+    def _run(self: Self) -> None:
+        while not self._stop.wait(REAP_INTERVAL):
+            try:
+                self.reap()
+            except Exception:
+                log.exception("Ошибка фонового удаления файлов")
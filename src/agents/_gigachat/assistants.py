@@ -2,28 +2,56 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
-from functools import cache
-from http import HTTPMethod, HTTPStatus
-from pathlib import Path
-from pprint import pprint
-from typing import TYPE_CHECKING, Self
+from functools import cached_property
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Any, Self
+from uuid import uuid4
 
+import httpx
 from gigachat.exceptions import ResponseError
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import (
+    AIMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+    messages_from_dict,
+    messages_to_dict,
+)
 from langchain_gigachat.chat_models import GigaChat
 from langchain_gigachat.tools.giga_tool import giga_tool
+from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.prebuilt import create_react_agent
 
-from src.core.intrfaces import KeyRatesAgentInterface
+from src.core.deadline import DeadlineExceededError, arun_stage, run_stage
+from src.core.intrfaces import AsyncKeyRatesAgentInterface, KeyRatesAgentInterface
 from src.core.logger import logger as log
+from src.core.matching import ReferenceContext, learn_confirmed, mapping_hints, written_names
+from src.core.openapi import openapi_slice
+from src.core.pdf import pdf_to_dict
+from src.core.prompt import estimate_tokens, pdf_to_prompt
+from src.core.usage import record
+from src.dao import jobs
+from src.dao.ledger import MUTATING_METHODS
+from src.dao.warm_start import Bootstrap
 
-from .tools import http_request, http_request_s
-from .utils import pdf_to_dict
+from .auth import SharedTokenGigaChat
+from .tools import fetch_text, http_request_s
+from .utils import BACKEND, backend_error, message_usage
 
 if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Iterator, Sequence
+    from pathlib import Path
+
+    from gigachat.models import DeletedFile, UploadedFile
+    from langchain_core.language_models import LanguageModelLike
     from langchain_core.messages import BaseMessage
+    from langchain_core.runnables import RunnableConfig
+    from langchain_core.tools import BaseTool
+    from langgraph.graph.graph import CompiledGraph
 
+    from src.core.prompt import PromptData
     from src.dto import FileDTO
 
 # Дешёвая, но не читает файлы
@@ -52,99 +80,361 @@ LOAD_KEY_RATES_PROMPT = """
 Отправь данные на сервер.
 """
 
+MAPPING_PROMPT = """
+Сопоставление столбцов из данных с атрибутами (столбец -> атрибут или кандидаты с оценкой сходства):
+%s
+Сопоставление заголовков из данных с видами данных:
+%s
+"""
+
+# Постоянная часть промта: передаётся перед сообщениями диалога при каждом вызове модели
+SYSTEM_PROMPT = SystemMessage(
+    content="Твоя задача разбирать входные данные из следующих запросов и формировать json`ы. "
+    "Никаких дополнений не делай. В ответах должны быть только json`ы.",
+)
+
 http_tool = giga_tool(http_request_s)
 
 
-class KeyRatesAgent(KeyRatesAgentInterface):
+class SharedTokenChat(GigaChat):
+    """Модель LangChain, клиент которой получает токен через общий `TokenManager`."""
+
+    @cached_property
+    def _client(self: Self) -> SharedTokenGigaChat:
+        return SharedTokenGigaChat.from_settings(super()._client._settings)  # noqa: SLF001
+
+    def delete_file(self: Self, file_id: str) -> DeletedFile:
+        """Удалить файл из хранилища GigaChat."""
+        return self._client.delete_file(file_id)
+
+
+class KeyRatesAgent(KeyRatesAgentInterface, AsyncKeyRatesAgentInterface):
     """Агент загружает файл в формате PDF и вытаскивает из него нужную информацию."""
 
     name = "KeyRatesPDF"
 
-    def __init__(  # noqa: D107
+    def __init__(  # noqa: D107, PLR0913
         self: Self,
         api_key: str,
         doc_url: str,
         doc_attrs_url: str,
         key_rate_doc_names_url: str,
+        alias_path: Path | None = None,
+        model: str = USE_MODEL,
     ) -> None:
         self._doc_url = doc_url
+        self._model_name = model
+        self._files: dict[str, bytes] = {}  # Содержимое PDF до обработки (только для модели "GigaChat")
+        self._documents: dict[str, PromptData] = {}  # Данные файла по потоку графа: для обучения сопоставлений
         self._doc_attrs_url = doc_attrs_url
         self._key_rate_doc_names_url = key_rate_doc_names_url
-        self._sys_prompt = LOAD_KEY_RATES_PROMPT % (self._api_doc(), self._doc_url, self._attrs(), self._doc_names())
-        self._model = GigaChat(
+        self._alias_path = alias_path
+        # Справочные данные берутся из кэша, недостающие запрашиваются параллельно
+        self._meta = Bootstrap(
+            {
+                "api_doc": f"{doc_url}/openapi.json",
+                "attrs": doc_attrs_url,
+                "doc_names": key_rate_doc_names_url,
+            },
+            fetch_text,
+        )
+        self._build_context()
+        self._model = SharedTokenChat(
             credentials=api_key,
             scope="GIGACHAT_API_PERS",
-            model=USE_MODEL,
+            model=model,
             verify_ssl_certs=False,
             # temperature=0.1
         )
 
         tools = [http_tool]
-        bind_model = self._model.bind_functions(tools)
-        self._agent = create_react_agent(bind_model, tools)
+        # Граф собирается один раз, состояние диалогов хранится по идентификатору потока
+        self._checkpointer = InMemorySaver()
+        self._agent = self._graph(self._model.bind_functions(tools), tools)
+        self._meta.refresh_in_background(self._build_context)
         return None
 
-    @cache  # noqa: B019
-    def _api_doc(self: Self) -> str | None:
-        result = http_request(HTTPMethod.GET, f"{self._doc_url}/openapi.json")
-        return None if result.status != HTTPStatus.OK or not result.text else result.text
-
-    @cache  # noqa: B019
-    def _attrs(self: Self) -> str | None:
-        result = http_request(HTTPMethod.GET, self._doc_attrs_url)
-        return None if result.status != HTTPStatus.OK or not result.text else result.text
+    def _graph(self: Self, model: LanguageModelLike, tools: Sequence[BaseTool]) -> CompiledGraph:
+        return create_react_agent(model, tools, prompt=SYSTEM_PROMPT, checkpointer=self._checkpointer)
 
-    @cache  # noqa: B019
-    def _doc_names(self: Self) -> str | None:
-        result = http_request(HTTPMethod.GET, self._key_rate_doc_names_url)
-        return None if result.status != HTTPStatus.OK or not result.text else result.text
+    def _build_context(self: Self, changed: list[str] | None = None) -> None:
+        """Собрать справочные данные и индексы сопоставления и подменить их одним присваиванием."""
+        if changed:
+            log.info("Справочные данные DocAPI изменились: %s", ", ".join(changed))
+        # Только операции, нужные для загрузки ставок, попадают в промт
+        self._context = ReferenceContext.build(
+            openapi_slice(self._meta["api_doc"]),
+            self._meta["attrs"],
+            self._meta["doc_names"],
+            self._alias_path,
+        )
 
-        return None
+    def _doc_prompt(self: Self, file_data: PromptData) -> str:
+        """Промт для документа: вместо полных списков - только кандидаты для заголовков из файла."""
+        context = self._context
+        attr_hints, attrs = mapping_hints(context.attrs_index, file_data.headers)
+        name_hints, names = mapping_hints(context.names_index, file_data.titles)
+        prompt = LOAD_KEY_RATES_PROMPT % (
+            context.api_doc,
+            self._doc_url,
+            ", ".join(attrs) if attrs else context.attrs,
+            ", ".join(names) if names else context.doc_names,
+        )
+        return prompt + MAPPING_PROMPT % (attr_hints or "-", name_hints or "-")
 
     def load_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
-        if USE_MODEL == "GigaChat":
-            with open(file_dto.name, "wb") as f:  # noqa: PTH123
-                f.write(file_dto.content)
-            return None, file_dto.name
+        if self._model_name == "GigaChat":
+            return None, self._keep_file(file_dto)
 
         try:
-            up_file = self._model.upload_file(file=(file_dto.name, file_dto.content, f"application/{file_dto.type_}"))
-        except ResponseError as re:
-            details = json.loads(re.args[2]) if len(re.args) > 2 else {}  # noqa: PLR2004
-            log.error(details)
-            return "Некорректный формат файла", None
+            up_file = run_stage(
+                "upload",
+                self._model.upload_file,
+                file=(file_dto.name, file_dto.content, f"application/{file_dto.type_}"),
+                on_late=self._delete_late,
+            )
+        except DeadlineExceededError:
+            raise
+        except Exception as e:
+            return _upload_failed(e), None
+
+        log.info(f"Файл загружен. ID: {up_file.id_}")
+        return None, up_file.id_
+
+    async def aload_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
+        if self._model_name == "GigaChat":
+            return None, self._keep_file(file_dto)
+
+        try:
+            up_file = await arun_stage(
+                "upload",
+                self._model.aupload_file(file=(file_dto.name, file_dto.content, f"application/{file_dto.type_}")),
+            )
+        except DeadlineExceededError:
+            raise
         except Exception as e:
-            log.info("%s: %s", e.__class__.__name__, e.args)
-            return "Не удалось загрузить файл. Проверьте формат и попробуйте снова.", None
+            return _upload_failed(e), None
 
         log.info(f"Файл загружен. ID: {up_file.id_}")
         return None, up_file.id_
 
+    def _delete_late(self: Self, up_file: UploadedFile) -> None:
+        """Удалить файл, загрузка которого завершилась после истечения времени этапа."""
+        run_stage("delete", self._model.delete_file, up_file.id_)
+
+    def _keep_file(self: Self, file_dto: FileDTO) -> str:
+        # Модель не читает файлы: PDF хранится в памяти и разбирается при обработке
+        file_id = uuid4().hex
+        self._files[file_id] = file_dto.content
+        return file_id
+
     def delete_file(self: Self, file_id: str) -> None:  # noqa: D102
-        pass
+        self._files.pop(file_id, None)
 
-    def process_file(self: Self, file_id: str) -> None:  # noqa: D102
-        messages: list[BaseMessage] = [
-            SystemMessage(
-                content="Твоя задача разбирать входные данные из следующих запросов и формировать json`ы. "
-                "Никаких дополнений не делай. В ответах должны быть только json`ы.",
-            ),
+    async def adelete_file(self: Self, file_id: str) -> None:  # noqa: D102
+        self._files.pop(file_id, None)
+
+    def _file_message(self: Self, file_id: str) -> tuple[HumanMessage, PromptData | None]:
+        """Сообщение и данные файла, если он разобран локально; разбор PDF занимает процессор."""
+        if self._model_name == "GigaChat":
+            file_data = pdf_to_prompt(pdf_to_dict(self._files.pop(file_id)))
+            log.info("Данные файла: таблиц %d, ~%d токенов", file_data.tables, file_data.tokens)
+            return HumanMessage(content=self._doc_prompt(file_data) + file_data.text), file_data
+
+        context = self._context
+        prompt = LOAD_KEY_RATES_PROMPT % (context.api_doc, self._doc_url, context.attrs, context.doc_names)
+        return HumanMessage(content=prompt, attachments=[file_id]), None
+
+    def _start(self: Self, file_id: str) -> tuple[RunnableConfig, dict[str, Any] | None]:
+        """Начать диалог по файлу или продолжить его с контрольной точки задания.
+
+        Returns:
+            tuple[RunnableConfig, dict[str, Any] | None]: Настройки потока графа и входные данные,
+                None - диалог продолжается с восстановленного состояния.
+        """  # noqa: RUF002
+        thread_id = uuid4().hex
+        config: RunnableConfig = {"configurable": {"thread_id": thread_id}}
+        message, file_data = self._file_message(file_id)
+        if file_data is not None:
+            self._documents[thread_id] = file_data
+        messages: list[BaseMessage] = [message]
+        state = jobs.restore()
+        if not state or len(state.get("messages", ())) < 2:  # noqa: PLR2004
+            return config, {"messages": messages}
+
+        # Первое сообщение заменяется новым: после перезапуска файл загружен заново
+        messages += messages_from_dict(state["messages"])[1:]
+        log.info("Диалог продолжается после %d сообщений", len(messages))
+        # Следующий шаг графа определяется последним сохранённым шагом: вызов инструмента или ответ модели
+        as_node = "tools" if isinstance(messages[-1], ToolMessage) else "agent"
+        self._agent.update_state(config, {"messages": messages}, as_node=as_node)
+        return config, None
+
+    def _checkpoint(self: Self, config: RunnableConfig) -> None:
+        if jobs.current() is None:
+            return
+
+        messages = self._agent.get_state(config).values["messages"]
+        jobs.checkpoint(
+            {"messages": messages_to_dict(messages)},
+            steps=sum(isinstance(message, AIMessage) for message in messages),
+            tool_calls=sum(isinstance(message, ToolMessage) and message.status == "success" for message in messages),
+        )
+
+    def _record_usage(self: Self, config: RunnableConfig, update: dict[str, Any]) -> None:
+        """Учесть токены ответов модели; ответы инструментов в запросе оцениваются по тексту."""
+        answers = [
+            message for message in (update.get("agent") or {}).get("messages", ()) if isinstance(message, AIMessage)
+        ]
+        if not answers:
+            return
+
+        history = self._agent.get_state(config).values["messages"]
+        tool = sum(estimate_tokens(str(message.content)) for message in history if isinstance(message, ToolMessage))
+        for answer in answers:
+            record(BACKEND, self._model_name, message_usage(answer.usage_metadata, tool))
+
+    def _learn_mappings(self: Self, config: RunnableConfig, update: dict[str, Any]) -> None:
+        """Выучить сопоставления заголовков файла, подтверждённые успешной записью на сервер."""
+        file_data = self._documents.get(config["configurable"]["thread_id"])
+        results = [
+            message
+            for message in (update.get("tools") or {}).get("messages", ())
+            if isinstance(message, ToolMessage) and message.status == "success" and _written(message)
         ]
+        if file_data is None or not results:
+            return
+
+        calls = {
+            call["id"]: call["args"]
+            for message in self._agent.get_state(config).values["messages"]
+            if isinstance(message, AIMessage)
+            for call in message.tool_calls
+        }
+        written: set[str] = set()
+        for result in results:
+            args = calls.get(result.tool_call_id) or {}
+            if str(args.get("method", "")).upper() in MUTATING_METHODS:
+                written |= written_names(args.get("data"))
+        if not written:
+            return
+
+        context = self._context
+        learned = learn_confirmed(context.attrs_index, file_data.headers, written)
+        learned += learn_confirmed(context.names_index, file_data.titles, written)
+        if learned:
+            log.info("Выучены сопоставления: %s", ", ".join(learned))
+
+    def _finish(self: Self, config: RunnableConfig) -> None:
+        self._documents.pop(config["configurable"]["thread_id"], None)
+        self._checkpointer.delete_thread(config["configurable"]["thread_id"])
+
+    def _step(self: Self, updates: Iterator[dict[str, Any]]) -> dict[str, Any] | None:
+        try:
+            return run_stage("step", next, updates, None)
+        except (ResponseError, httpx.TransportError) as e:
+            if (error := backend_error(e)) is not None:
+                raise error from e
+            raise
+
+    async def _astep(self: Self, updates: AsyncIterator[dict[str, Any]]) -> dict[str, Any] | None:
+        try:
+            return await arun_stage("step", anext(updates, None))
+        except (ResponseError, httpx.TransportError) as e:
+            if (error := backend_error(e)) is not None:
+                raise error from e
+            raise
+
+    def stream_file(self: Self, file_id: str) -> Iterator[dict[str, Any]]:
+        """Обработать файл по шагам графа.
 
-        response = self._agent.invoke({"messages": messages})
-        messages = response["messages"]
-        log.info(messages[-1].content)
-        if USE_MODEL == "GigaChat":
-            file_data = pdf_to_dict(file_id)
-            Path(file_id).unlink()
-            messages.append(HumanMessage(content=self._sys_prompt + json.dumps(file_data)))
-        else:
-            messages.append(HumanMessage(content=self._sys_prompt, attachments=[file_id]))
+        Каждый шаг - ответ модели или выполнение инструментов - выдаётся сразу после завершения
+        и сохраняется в контрольную точку задания.
 
+        Yields:
+            dict[str, Any]: Обновление состояния по имени узла графа (`agent` или `tools`).
+        """
+        config, payload = self._start(file_id)
+        updates = self._agent.stream(payload, config, stream_mode="updates")
         try:
-            response = self._agent.invoke({"messages": messages})
-            pprint(response["messages"][-1].content)  # noqa: T203
+            while (update := self._step(updates)) is not None:
+                _log_update(update)
+                self._record_usage(config, update)
+                self._learn_mappings(config, update)
+                self._checkpoint(config)
+                yield update
+        finally:
+            self._finish(config)
+
+    async def astream_file(self: Self, file_id: str) -> AsyncIterator[dict[str, Any]]:
+        """Асинхронно обработать файл по шагам графа, см. `stream_file`."""
+        config, payload = await asyncio.to_thread(self._start, file_id)
+        updates = self._agent.astream(payload, config, stream_mode="updates")
+        try:
+            while (update := await self._astep(updates)) is not None:
+                _log_update(update)
+                self._record_usage(config, update)
+                self._learn_mappings(config, update)
+                self._checkpoint(config)
+                yield update
+        finally:
+            self._finish(config)
+
+    def process_file(self: Self, file_id: str) -> None:  # noqa: D102
+        answer = None
+        try:
+            for update in self.stream_file(file_id):
+                answer = _last_message(update) or answer
+        except ResponseError as re:
+            log.error("Ошибка GigaChat: %s", json.loads(re.args[2])["message"])
+
+        if answer is not None:
+            log.info("Ответ модели: %s", answer.content)
+        return None
+
+    async def aprocess_file(self: Self, file_id: str) -> None:  # noqa: D102
+        answer = None
+        try:
+            async for update in self.astream_file(file_id):
+                answer = _last_message(update) or answer
         except ResponseError as re:
-            pprint(json.loads(re.args[2])["message"])  # noqa: T203
+            log.error("Ошибка GigaChat: %s", json.loads(re.args[2])["message"])
 
+        if answer is not None:
+            log.info("Ответ модели: %s", answer.content)
         return None
+
+
+def _last_message(update: dict[str, Any]) -> BaseMessage | None:
+    """Последний ответ модели в обновлении графа."""
+    messages = (update.get("agent") or {}).get("messages") or ()
+    return messages[-1] if messages else None
+
+
+def _written(message: ToolMessage) -> bool:
+    """Инструмент вернул успешный статус HTTP: ответ `http_request_s` - `[статус, тело]`."""
+    try:
+        status = json.loads(str(message.content))[0]
+    except (ValueError, IndexError, KeyError, TypeError):
+        return False
+    return isinstance(status, int) and HTTPStatus.OK <= status < HTTPStatus.MULTIPLE_CHOICES
+
+
+def _log_update(update: dict[str, Any]) -> None:
+    for node, values in update.items():
+        for message in (values or {}).get("messages", ()):
+            if isinstance(message, ToolMessage):
+                log.info("Инструмент %s: %s", message.name, message.status)
+            elif calls := getattr(message, "tool_calls", None):
+                log.info("Шаг %s: вызов %s", node, ", ".join(call["name"] for call in calls))
+
+
+def _upload_failed(e: Exception) -> str:
+    """Сообщение пользователю об ошибке загрузки файла в модель."""  # noqa: RUF002
+    if isinstance(e, ResponseError):
+        details = json.loads(e.args[2]) if len(e.args) > 2 else {}  # noqa: PLR2004
+        log.error(details)
+        return "Некорректный формат файла"
+
+    log.info("%s: %s", e.__class__.__name__, e.args)
+    return "Не удалось загрузить файл. Проверьте формат и попробуйте снова."
@@ -4,33 +4,47 @@
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
-from functools import cache
-from http import HTTPMethod, HTTPStatus
-from pathlib import Path
-from pprint import pprint
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
 from typing import TYPE_CHECKING, Self
+from uuid import uuid4
 
 import httpx
-from gigachat import GigaChat
 from gigachat.api.utils import build_headers
 from gigachat.assistants import AssistantsSyncClient
 from gigachat.exceptions import ResponseError
 from gigachat.models import Chat, Messages, MessagesRole
 
-from src.core.intrfaces import KeyRatesAgentInterface
+from src.core.deadline import DeadlineExceededError, arun_stage, run_stage
+from src.core.intrfaces import AsyncKeyRatesAgentInterface, KeyRatesAgentInterface
 from src.core.logger import logger as log
+from src.core.matching import ReferenceContext, mapping_hints
+from src.core.openapi import openapi_slice
+from src.core.pdf import pdf_to_dict
+from src.core.prompt import pdf_to_prompt
+from src.core.usage import record
+from src.dao.warm_start import Bootstrap, warm_cache
 
-from .tools import http_request
-from .utils import func_to_giga, pdf_to_dict
+from .auth import SharedTokenGigaChat
+from .tools import fetch_text, http_request
+from .utils import BACKEND, backend_error, completion_usage, func_to_giga
 
 if TYPE_CHECKING:
+    from pathlib import Path
+
+    from gigachat.models import ChatCompletion, UploadedFile
+
+    from src.core.prompt import PromptData
     from src.dto import FileDTO
 
 # Дешёвая, но не читает файлы
 USE_MODEL = "GigaChat"
 # Дорогая, но всё равно не работает как надо
 # USE_MODEL = "GigaChat-2-Max"
+MAX_ATTEMPTS = 3  # Попыток получить от модели вызов функции
 
 LOAD_KEY_RATES_PROMPT = """
 Документация  OpenAPI: %s
@@ -53,57 +67,93 @@ LOAD_KEY_RATES_PROMPT = """
 Отправь данные на сервер.
 """
 
+MAPPING_PROMPT = """
+Сопоставление столбцов из данных с атрибутами (столбец -> атрибут или кандидаты с оценкой сходства):
+%s
+Сопоставление заголовков из данных с видами данных:
+%s
+"""
+
 http_tool = func_to_giga(http_request)
 
 
-class KeyRatesAgent(KeyRatesAgentInterface):
+class KeyRatesAgent(KeyRatesAgentInterface, AsyncKeyRatesAgentInterface):
     """Агент загружает файл в формате PDF и вытаскивает из него нужную информацию."""
 
     name = "KeyRatesPDF"
     _func_validate_url = "https://gigachat.devices.sberbank.ru/api/v1/functions/validate"
 
-    def __init__(  # noqa: D107
+    def __init__(  # noqa: D107, PLR0913
         self: Self,
         api_key: str,
         doc_url: str,
         doc_attrs_url: str,
         key_rate_doc_names_url: str,
+        alias_path: Path | None = None,
+        model: str = USE_MODEL,
     ) -> None:
-        self._model = GigaChat(
+        self._model = SharedTokenGigaChat(
             credentials=api_key,
             scope="GIGACHAT_API_PERS",
-            model=USE_MODEL,
+            model=model,
             verify_ssl_certs=False,
         )
         self._doc_url = doc_url
+        self._model_name = model
+        self._files: dict[str, bytes] = {}  # Содержимое PDF до обработки (только для модели "GigaChat")
         self._doc_attrs_url = doc_attrs_url
         self._key_rate_doc_names_url = key_rate_doc_names_url
         self._tools = [http_tool]
-        self._sys_prompt = LOAD_KEY_RATES_PROMPT % (self._api_doc(), self._doc_url, self._attrs(), self._doc_names())
+        self._alias_path = alias_path
+        # Справочные данные берутся из кэша, недостающие запрашиваются во время проверки инструментов
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            tools_checked = executor.submit(self._check_tools_once)
+            self._meta = Bootstrap(
+                {
+                    "api_doc": f"{doc_url}/openapi.json",
+                    "attrs": doc_attrs_url,
+                    "doc_names": key_rate_doc_names_url,
+                },
+                fetch_text,
+            )
+        self._build_context()
         self._assistant = AssistantsSyncClient(self._model)
-        if not self.check_tools():
+        if not tools_checked.result():
             raise KeyboardInterrupt("Не удалось загрузить инструменты")
+        self._meta.refresh_in_background(self._build_context)
         return None
 
-    @cache  # noqa: B019
-    def _api_doc(self: Self) -> str | None:
-        result = http_request(HTTPMethod.GET, f"{self._doc_url}/openapi.json")
-        return None if result.status != HTTPStatus.OK or not result.text else result.text
+    def _build_context(self: Self, changed: list[str] | None = None) -> None:
+        """Собрать справочные данные и индексы сопоставления и подменить их одним присваиванием."""
+        if changed:
+            log.info("Справочные данные DocAPI изменились: %s", ", ".join(changed))
+        # Только операции, нужные для загрузки ставок, попадают в промт
+        self._context = ReferenceContext.build(
+            openapi_slice(self._meta["api_doc"]),
+            self._meta["attrs"],
+            self._meta["doc_names"],
+            self._alias_path,
+        )
+
+    def _check_tools_once(self: Self) -> bool:
+        """Проверить инструменты, если их описание изменилось или срок последней успешной проверки истёк."""
+        schema = json.dumps([tool.dict(exclude_none=True, by_alias=True) for tool in self._tools], sort_keys=True)
+        key = f"gigachat-tools:{hashlib.sha256(schema.encode()).hexdigest()}"
+        if warm_cache.get(key) is not None:
+            return True
 
-    @cache  # noqa: B019
-    def _attrs(self: Self) -> str | None:
-        result = http_request(HTTPMethod.GET, self._doc_attrs_url)
-        return None if result.status != HTTPStatus.OK or not result.text else result.text
+        if not self.check_tools():
+            return False
 
-    @cache  # noqa: B019
-    def _doc_names(self: Self) -> str | None:
-        result = http_request(HTTPMethod.GET, self._key_rate_doc_names_url)
-        return None if result.status != HTTPStatus.OK or not result.text else result.text
+        warm_cache.put(key, "ok")
+        return True
 
     def check_tools(self: Self) -> bool:
         """Проверка инструментов через GigaChat-API."""
-        self._model._update_token()  # noqa: SLF001
-        headers = build_headers(self._model.token)
+        token = self._model.get_token()
+        if self._model.tokens is not None:
+            log.debug("Токен GigaChat действует ещё %.0f с", self._model.tokens.time_left())
+        headers = build_headers(token.access_token)
         headers["Content-Type"] = "application/json"
         for tool in self._tools:
             response = httpx.post(
@@ -125,62 +175,165 @@ class KeyRatesAgent(KeyRatesAgentInterface):
                 log.warning(data["warnings"])
         return True
 
+    def _doc_prompt(self: Self, file_data: PromptData) -> str:
+        """Промт для документа: вместо полных списков - только кандидаты для заголовков из файла."""
+        context = self._context
+        attr_hints, attrs = mapping_hints(context.attrs_index, file_data.headers)
+        name_hints, names = mapping_hints(context.names_index, file_data.titles)
+        prompt = LOAD_KEY_RATES_PROMPT % (
+            context.api_doc,
+            self._doc_url,
+            ", ".join(attrs) if attrs else context.attrs,
+            ", ".join(names) if names else context.doc_names,
+        )
+        return prompt + MAPPING_PROMPT % (attr_hints or "-", name_hints or "-")
+
     def load_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
-        if USE_MODEL == "GigaChat":
-            with open(file_dto.name, "wb") as f:  # noqa: PTH123
-                f.write(file_dto.content)
-            return None, file_dto.name
+        if self._model_name == "GigaChat":
+            return None, self._keep_file(file_dto)
 
         try:
-            up_file = self._model.upload_file(file=(file_dto.name, file_dto.content, f"application/{file_dto.type_}"))
-        except ResponseError as re:
-            details = json.loads(re.args[2]) if len(re.args) > 2 else {}  # noqa: PLR2004
-            log.error(details)
-            return "Некорректный формат файла", None
+            up_file = run_stage(
+                "upload",
+                self._model.upload_file,
+                file=self._upload_payload(file_dto),
+                on_late=self._delete_late,
+            )
+        except DeadlineExceededError:
+            raise
+        except Exception as e:
+            return _upload_failed(e), None
+
+        log.info(f"Файл загружен. ID: {up_file.id_}")
+        return None, up_file.id_
+
+    async def aload_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
+        if self._model_name == "GigaChat":
+            return None, self._keep_file(file_dto)
+
+        try:
+            up_file = await arun_stage("upload", self._model.aupload_file(file=self._upload_payload(file_dto)))
+        except DeadlineExceededError:
+            raise
         except Exception as e:
-            log.info("%s: %s", e.__class__.__name__, e.args)
-            return "Не удалось загрузить файл. Проверьте формат и попробуйте снова.", None
+            return _upload_failed(e), None
 
         log.info(f"Файл загружен. ID: {up_file.id_}")
         return None, up_file.id_
 
+    def _delete_late(self: Self, up_file: UploadedFile) -> None:
+        """Удалить файл, загрузка которого завершилась после истечения времени этапа."""
+        run_stage("delete", self._model.delete_file, up_file.id_)
+
+    def _keep_file(self: Self, file_dto: FileDTO) -> str:
+        # Модель не читает файлы: PDF хранится в памяти и разбирается при обработке
+        file_id = uuid4().hex
+        self._files[file_id] = file_dto.content
+        return file_id
+
+    @staticmethod
+    def _upload_payload(file_dto: FileDTO) -> tuple[str, bytes, str]:
+        return file_dto.name, file_dto.content, f"application/{file_dto.type_}"
+
     def delete_file(self: Self, file_id: str) -> None:  # noqa: D102
-        pass
+        self._files.pop(file_id, None)
 
-    def process_file(self: Self, file_id: str) -> None:  # noqa: D102
-        messages = [
+    async def adelete_file(self: Self, file_id: str) -> None:  # noqa: D102
+        self._files.pop(file_id, None)
+
+    @staticmethod
+    def _system_messages() -> list[Messages]:
+        return [
             Messages(
                 role=MessagesRole.SYSTEM,
                 content="Твоя задача разбирать входные данные из следующих запросов и формировать json`ы. "
                 "Никаких дополнений не делай. В ответах должны быть только json`ы.",
             ),
         ]
-        response = self._model.chat(Chat(messages=messages))
-        messages.append(response.choices[0].message)
-        pprint(response.choices[0].message.content)  # noqa: T203
-        file_data = pdf_to_dict(file_id)
-        Path(file_id).unlink()
-        messages.append(
-            Messages(
-                role=MessagesRole.USER,
-                content=self._sys_prompt,
-                data_for_context=[Messages(role=MessagesRole.USER, content=json.dumps(file_data))],
-            ),
+
+    def _file_message(self: Self, file_id: str) -> Messages:
+        """Сообщение с данными файла, разбор PDF занимает процессор."""  # noqa: RUF002
+        file_data = pdf_to_prompt(pdf_to_dict(self._files.pop(file_id)))
+        log.info("Данные файла: таблиц %d, ~%d токенов", file_data.tables, file_data.tokens)
+        return Messages(
+            role=MessagesRole.USER,
+            content=self._doc_prompt(file_data),
+            data_for_context=[Messages(role=MessagesRole.USER, content=file_data.text)],
         )
+
+    @staticmethod
+    def _read_response(response: ChatCompletion, payload: Chat) -> bool:
+        """Проверить ответ модели, если вызова функции нет - попросить повторить.
+
+        Returns:
+            bool: Модель вернула вызов функции.
+        """
+        log.debug("Ответ модели: %s", response.choices[0].message.content)
+        if response.choices[0].message.function_call:
+            function_call = response.choices[0].message.function_call
+            log.info("Вызов функции %s: %s", function_call.name, function_call.arguments)
+            return True
+
+        prompt = "Не предоставлены функция и аргументы. Попробуй снова."
+        payload.messages.append(response.choices[0].message)
+        payload.messages.append(Messages(role=MessagesRole.USER, content=prompt))
+        return False
+
+    def _chat(self: Self, payload: Chat) -> ChatCompletion:
+        try:
+            response = run_stage("step", self._model.chat, payload)
+        except (ResponseError, httpx.TransportError) as e:
+            if (error := backend_error(e)) is not None:
+                raise error from e
+            raise
+        record(BACKEND, response.model or self._model_name, completion_usage(response.usage))
+        return response
+
+    async def _achat(self: Self, payload: Chat) -> ChatCompletion:
+        try:
+            response = await arun_stage("step", self._model.achat(payload))
+        except (ResponseError, httpx.TransportError) as e:
+            if (error := backend_error(e)) is not None:
+                raise error from e
+            raise
+        record(BACKEND, response.model or self._model_name, completion_usage(response.usage))
+        return response
+
+    def process_file(self: Self, file_id: str) -> None:  # noqa: D102
+        messages = self._system_messages()
+        response = self._chat(Chat(messages=messages))
+        messages.append(response.choices[0].message)
+        log.debug("Ответ модели: %s", response.choices[0].message.content)
+        messages.append(self._file_message(file_id))
         payload = Chat(messages=messages, functions=self._tools)
-        for _ in range(3):
-            response = self._model.chat(payload)
-            pprint(response.choices[0].message.content)  # noqa: T203
-            print(response.choices[0].message.function_call)  # noqa: T201
-            if response.choices[0].message.function_call:
-                function_call = response.choices[0].message.function_call
-                print(f"Function to call: {function_call.name}")  # noqa: T201
-                print(f"Arguments: {function_call.arguments}")  # noqa: T201
+        for _ in range(MAX_ATTEMPTS):
+            if self._read_response(self._chat(payload), payload):
                 return
 
-            prompt = "Не предоставлены функция и аргументы. Попробуй снова."
-            payload.messages.append(response.choices[0].message)
-            payload.messages.append(Messages(role=MessagesRole.USER, content=prompt))
+        log.error("Не удалось получить данные от модели.")
+        return None
+
+    async def aprocess_file(self: Self, file_id: str) -> None:  # noqa: D102
+        messages = self._system_messages()
+        response = await self._achat(Chat(messages=messages))
+        messages.append(response.choices[0].message)
+        log.debug("Ответ модели: %s", response.choices[0].message.content)
+        messages.append(await asyncio.to_thread(self._file_message, file_id))
+        payload = Chat(messages=messages, functions=self._tools)
+        for _ in range(MAX_ATTEMPTS):
+            if self._read_response(await self._achat(payload), payload):
+                return
 
         log.error("Не удалось получить данные от модели.")
         return None
+
+
+def _upload_failed(e: Exception) -> str:
+    """Сообщение пользователю об ошибке загрузки файла в модель."""  # noqa: RUF002
+    if isinstance(e, ResponseError):
+        details = json.loads(e.args[2]) if len(e.args) > 2 else {}  # noqa: PLR2004
+        log.error(details)
+        return "Некорректный формат файла"
+
+    log.info("%s: %s", e.__class__.__name__, e.args)
+    return "Не удалось загрузить файл. Проверьте формат и попробуйте снова."
@@ -0,0 +1,178 @@
+"""Общий токен доступа GigaChat для всех клиентов процесса."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Self
+
+import httpx
+from gigachat import GigaChat
+from gigachat.api import post_auth
+from gigachat.client import _get_auth_kwargs
+
+from src.core.logger import logger as log
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from gigachat.models import AccessToken
+    from gigachat.settings import Settings
+
+REFRESH_MARGIN = 120.0  # Запас до истечения токена в секундах, после которого он обновляется заранее
+
+
+class TokenManager:
+    """Токен доступа с заблаговременным обновлением.
+
+    Токен обновляется, когда до его истечения остаётся меньше `margin` секунд.
+    Пока токен ещё действует, обновляет его только один поток, остальные продолжают работать со старым.
+    Если токена нет или он истёк, все потоки ждут одно общее обновление.
+    """  # noqa: RUF002
+
+    def __init__(self: Self, fetch: Callable[[], AccessToken], margin: float = REFRESH_MARGIN) -> None:
+        """Создать менеджер.
+
+        Args:
+            fetch (Callable[[], AccessToken]): Запрос нового токена у сервера авторизации.
+            margin (float): За сколько секунд до истечения обновлять токен.
+        """  # noqa: RUF002
+        self._fetch = fetch
+        self._margin = margin
+        self._token: AccessToken | None = None
+        self._lock = threading.Lock()
+        self.refreshes = 0  # Количество запросов токена
+
+    def time_left(self: Self) -> float:
+        """Сколько секунд ещё действует текущий токен, 0 - если токена нет."""
+        token = self._token
+        return max(token.expires_at / 1000 - time.time(), 0.0) if token else 0.0
+
+    def _refresh(self: Self, stale: str | None) -> AccessToken:
+        """Обновить токен под блокировкой, если его ещё не обновил другой поток."""  # noqa: RUF002
+        token = self._token
+        if token is not None and token.access_token != stale and self.time_left() > self._margin:
+            return token
+
+        token = self._fetch()
+        self._token = token
+        self.refreshes += 1
+        log.debug("Токен GigaChat обновлён, действует %.0f с", self.time_left())
+        return token
+
+    def get(self: Self) -> AccessToken:
+        """Действующий токен."""
+        token = self._token
+        time_left = self.time_left()
+        if token is not None and time_left > self._margin:
+            return token
+
+        if token is not None and time_left > 0:
+            # Токен ещё действует: обновляет тот, кто первым взял блокировку, остальные не ждут
+            if not self._lock.acquire(blocking=False):
+                return token
+            try:
+                return self._refresh(None)
+            finally:
+                self._lock.release()
+
+        with self._lock:
+            return self._refresh(None)
+
+    def invalidate(self: Self, stale: str | None) -> AccessToken:
+        """Получить новый токен взамен отклонённого сервером.
+
+        Если токен уже обновил другой поток, новый запрос не выполняется.
+        """
+        with self._lock:
+            return self._refresh(stale)
+
+
+_managers: dict[tuple[Any, ...], TokenManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_token_manager(settings: Settings) -> TokenManager:
+    """Общий менеджер токена для учётных данных из настроек клиента."""
+    key = (settings.auth_url, settings.credentials, settings.scope, settings.verify_ssl_certs)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            auth_client = httpx.Client(**_get_auth_kwargs(settings))
+
+            def fetch() -> AccessToken:
+                return post_auth.sync(
+                    auth_client,
+                    url=settings.auth_url,
+                    credentials=settings.credentials,  # type: ignore[arg-type]
+                    scope=settings.scope,
+                )
+
+            manager = _managers[key] = TokenManager(fetch)
+        return manager
+
+
+class SharedTokenGigaChat(GigaChat):
+    """Клиент GigaChat, получающий токен через общий `TokenManager`.
+
+    Без `credentials` (вход по логину и паролю или готовый токен) работает как обычный клиент.
+    """
+
+    def __init__(self: Self, **kwargs: Any) -> None:  # noqa: D107
+        super().__init__(**kwargs)
+        self._tokens = get_token_manager(self._settings) if self._settings.credentials else None
+        self._rejected: str | None = None  # Токен, отклонённый сервером, до замены через `invalidate`
+
+    @classmethod
+    def from_settings(cls: type[Self], settings: Settings) -> Self:
+        """Клиент с теми же настройками, что и у другого клиента."""  # noqa: RUF002
+        return cls(**{k: v for k, v in settings.dict().items() if v is not None})
+
+    @property
+    def tokens(self: Self) -> TokenManager | None:
+        """Общий менеджер токена."""
+        return self._tokens
+
+    def get_token(self: Self) -> AccessToken:
+        """Действующий токен, без лишних запросов к серверу авторизации."""
+        if self._tokens is None:
+            return super().get_token()
+
+        return self._tokens.get()
+
+    def _check_validity_token(self: Self) -> bool:
+        if self._tokens is None:
+            return super()._check_validity_token()
+
+        self._access_token = self._tokens.get()
+        return True
+
+    def _reset_token(self: Self) -> None:
+        # SDK сбрасывает токен после ответа 401 до вызова `_update_token`: отклонённый токен нужен для замены
+        self._rejected = self.token
+        super()._reset_token()
+
+    def _stale_token(self: Self) -> str | None:
+        stale, self._rejected = self._rejected or self.token, None
+        return stale
+
+    def _update_token(self: Self) -> None:
+        if self._tokens is None:
+            return super()._update_token()
+
+        self._access_token = self._tokens.invalidate(self._stale_token())
+        return None
+
+    async def _adecorator[T](self: Self, acall: Callable[..., Awaitable[T]]) -> T:
+        if self._tokens is not None:
+            # Обновление токена - синхронный запрос, он не должен останавливать цикл событий
+            self._access_token = await asyncio.to_thread(self._tokens.get)
+        return await super()._adecorator(acall)
+
+    async def _aupdate_token(self: Self) -> None:
+        if self._tokens is None:
+            return await super()._aupdate_token()
+
+        self._access_token = await asyncio.to_thread(self._tokens.invalidate, self._stale_token())
+        return None
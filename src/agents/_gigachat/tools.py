@@ -1,11 +1,19 @@
 from __future__ import annotations
 
+import time
+from http import HTTPMethod, HTTPStatus
 from typing import Annotated
+from urllib.parse import urlsplit
 
 import httpx
 from pydantic import BaseModel, Field
 
+from src.core.deadline import stage_timeout
 from src.core.logger import logger as log
+from src.core.metrics import observe_tool, register_endpoints
+from src.dao.ledger import ledger
+
+REQUEST_TIMEOUT = 30.0  # Секунд на HTTP-запрос
 
 
 class HttpResult(BaseModel):
@@ -22,9 +30,8 @@ def http_request(
 ) -> HttpResult:
     """Выполнить HTTP-запрос."""
     log.debug(f"! {method} {url} {data}")
-    response = httpx.request(method, url, json=data)
-
-    return HttpResult(status=response.status_code, text=response.text)
+    status, text = _request(method, url, data)
+    return HttpResult(status=status, text=text)
 
 
 def http_request_s(
@@ -45,6 +52,35 @@ def http_request_s(
         tuple[int, str]: Статус выполнения запроса и тело ответа
     """
     log.debug(f"! {method} {url} {data}")
-    response = httpx.request(method, url, json=data)
+    return _request(method, url, data)
+
+
+def _request(method: str, url: str, data: dict | str | None) -> tuple[int, str]:
+    """Запрос с учётом журнала изменений и метрик инструментов."""  # noqa: RUF002
+    started = time.perf_counter()
+    prior = ledger.lookup(method, url, data)
+    if prior is not None:
+        observe_tool(method, url, "ledger", started)
+        return prior
 
+    try:
+        response = httpx.request(method, url, json=data, timeout=stage_timeout("tool", REQUEST_TIMEOUT))
+    except Exception as e:
+        observe_tool(method, url, e.__class__.__name__, started)
+        raise
+
+    observe_tool(method, url, response.status_code, started)
+    ledger.record(method, url, data, response.status_code, response.text)
     return response.status_code, response.text
+
+
+def fetch_text(url: str) -> str | None:
+    """Получить текст ответа на GET-запрос, None - если сервер недоступен или ответ пустой."""
+    # Справочные адреса заданы настройками: их пути - известные метки метрик
+    register_endpoints([urlsplit(url).path])
+    try:
+        result = http_request(HTTPMethod.GET, url)
+    except httpx.HTTPError as e:
+        log.warning("Не удалось получить %s: %s", url, e)
+        return None
+    return result.text if result.status == HTTPStatus.OK and result.text else None
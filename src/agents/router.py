@@ -0,0 +1,397 @@
+"""Распределение документов между несколькими моделями.
+
+Маршрутизатор хранит настроенные модели, следит за их задержкой, долей ошибок и остатком квоты,
+отправляет документ в лучшую по выбранной политике модель и переключается на следующую,
+если модель исчерпала квоту или недоступна.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Protocol, Self
+from uuid import uuid4
+
+from src.core.async_agent import as_async, as_sync
+from src.core.deadline import DeadlineExceededError, document_deadline
+from src.core.intrfaces import (
+    AsyncKeyRatesAgentInterface,
+    BackendError,
+    KeyRatesAgentInterface,
+    QuotaExceededError,
+)
+from src.core.logger import logger as log
+from src.dao import jobs
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from src.core.deadline import Deadline
+    from src.dto import FileDTO
+
+WINDOW = 20  # Последних обработок, по которым считаются задержка и доля ошибок
+QUOTA_COOLDOWN = 15 * 60.0  # Секунд без запросов после ошибки квоты, если модель не сообщила срок
+ERROR_PENALTY = 4.0  # Штраф к оценке задержки: при 100% ошибок оценка растёт в 1 + ERROR_PENALTY раз
+
+
+@dataclass(frozen=True)
+class BackendSpec:
+    """Настройка модели: режим агента, название модели и суточная квота документов."""
+
+    mode: str
+    model: str | None = None  # None - модель агента по умолчанию
+    daily_quota: int | None = None  # None - без ограничения
+
+    @property
+    def name(self: Self) -> str:
+        """Имя для журналов и статистики."""
+        return f"{self.mode}:{self.model}" if self.model else self.mode
+
+    @classmethod
+    def parse(cls: type[Self], text: str) -> list[Self]:
+        """Разобрать список моделей вида `G:gemini-2.5-flash:250, G:gemini-2.5-pro, S`."""
+        specs = []
+        for item in text.split(","):
+            if not item.strip():
+                continue
+
+            mode, model, quota, *rest = [*item.strip().split(":"), "", ""]
+            if rest != [""] * len(rest) or (quota and not quota.isdigit()):
+                msg = f"Invalid backend spec: {item.strip()!r}"
+                raise ValueError(msg)
+            specs.append(cls(mode.upper(), model or None, int(quota) if quota else None))
+        return specs
+
+
+@dataclass
+class BackendStats:
+    """Скользящая статистика модели."""
+
+    daily_quota: int | None = None
+    window: deque[tuple[float, bool]] = field(default_factory=lambda: deque(maxlen=WINDOW))  # (секунды, успех)
+    used: int = 0  # Документов за текущие сутки
+    day: dt.date = field(default_factory=lambda: dt.datetime.now(tz=dt.UTC).date())
+    blocked_until: float = 0.0  # Время (monotonic), до которого квота исчерпана
+
+    def record(self: Self, elapsed: float, *, ok: bool) -> None:
+        """Учесть обработку документа."""
+        self.window.append((elapsed, ok))
+
+    def use(self: Self) -> None:
+        """Учесть расход квоты на документ."""
+        self._roll_day()
+        self.used += 1
+
+    def exhaust(self: Self, retry_after: float | None) -> None:
+        """Отметить, что модель исчерпала квоту."""
+        self.blocked_until = time.monotonic() + (retry_after or QUOTA_COOLDOWN)
+
+    @property
+    def latency(self: Self) -> float | None:
+        """Средняя длительность успешной обработки, None - если успешных ещё не было."""
+        times = [elapsed for elapsed, ok in self.window if ok]
+        return sum(times) / len(times) if times else None
+
+    @property
+    def error_rate(self: Self) -> float:
+        """Доля ошибок среди последних обработок."""
+        return sum(not ok for _, ok in self.window) / len(self.window) if self.window else 0.0
+
+    @property
+    def remaining(self: Self) -> int | None:
+        """Остаток квоты на сегодня, None - без ограничения."""
+        if time.monotonic() < self.blocked_until:
+            return 0
+
+        self._roll_day()
+        return None if self.daily_quota is None else max(self.daily_quota - self.used, 0)
+
+    @property
+    def available(self: Self) -> bool:
+        """Модели можно отправить документ."""
+        return self.remaining != 0
+
+    def _roll_day(self: Self) -> None:
+        today = dt.datetime.now(tz=dt.UTC).date()
+        if today != self.day:
+            self.day, self.used = today, 0
+
+
+@dataclass
+class Backend:
+    """Модель, доступная маршрутизатору."""
+
+    spec: BackendSpec
+    agent: KeyRatesAgentInterface | AsyncKeyRatesAgentInterface
+    stats: BackendStats = field(init=False)
+
+    def __post_init__(self: Self) -> None:  # noqa: D105
+        self.stats = BackendStats(self.spec.daily_quota)
+
+    @property
+    def name(self: Self) -> str:  # noqa: D102
+        return self.spec.name
+
+
+class RoutingPolicy(Protocol):
+    """Политика выбора модели."""
+
+    def rank(self: Self, backends: list[Backend]) -> list[Backend]:
+        """Упорядочить доступные модели от лучшей к худшей."""
+        raise NotImplementedError
+
+
+class PriorityPolicy:
+    """Модели в порядке настройки: следующая используется, только если предыдущие недоступны."""
+
+    def rank(self: Self, backends: list[Backend]) -> list[Backend]:  # noqa: D102
+        return list(backends)
+
+
+class LatencyPolicy:
+    """Сначала самая быстрая модель с учётом доли ошибок, ещё не опробованные - первыми."""  # noqa: RUF002
+
+    def rank(self: Self, backends: list[Backend]) -> list[Backend]:  # noqa: D102
+        def score(backend: Backend) -> float:
+            latency = backend.stats.latency
+            if latency is None:
+                return 0.0
+            return latency * (1 + ERROR_PENALTY * backend.stats.error_rate)
+
+        return sorted(backends, key=score)
+
+
+class QuotaPolicy:
+    """Сначала модель с наибольшим остатком квоты, при равенстве - более быстрая."""  # noqa: RUF002
+
+    def rank(self: Self, backends: list[Backend]) -> list[Backend]:  # noqa: D102
+        def score(backend: Backend) -> tuple[float, float]:
+            remaining = backend.stats.remaining
+            return -(float("inf") if remaining is None else remaining), backend.stats.latency or 0.0
+
+        return sorted(backends, key=score)
+
+
+# Название политики -> класс
+POLICIES: dict[str, type[RoutingPolicy]] = {
+    "priority": PriorityPolicy,
+    "latency": LatencyPolicy,
+    "quota": QuotaPolicy,
+}
+
+
+class AgentRouter(KeyRatesAgentInterface, AsyncKeyRatesAgentInterface):
+    """Агент, распределяющий документы между несколькими моделями.
+
+    Документ хранится в маршрутизаторе до удаления. При загрузке файл сразу отправляется в лучшую
+    на этот момент модель, чтобы загрузка шла, пока обрабатывается предыдущий документ.
+    При переключении файл загружается в следующую модель заново.
+    """
+
+    name = "Router"
+
+    def __init__(self: Self, backends: list[Backend], policy: RoutingPolicy | None = None) -> None:  # noqa: D107
+        if not backends:
+            msg = "Router needs at least one backend"
+            raise ValueError(msg)
+
+        self._backends = backends
+        self._policy = policy or LatencyPolicy()
+        self._files: dict[str, FileDTO] = {}
+        self._prefetched: dict[str, tuple[Backend, str]] = {}  # Файл маршрутизатора -> модель и файл в ней
+
+    @classmethod
+    def from_specs(
+        cls: type[Self],
+        specs: list[BackendSpec],
+        factory: Callable[[BackendSpec], KeyRatesAgentInterface | AsyncKeyRatesAgentInterface],
+        policy: str = "latency",
+    ) -> Self:
+        """Создать агентов для моделей из настроек."""
+        if policy not in POLICIES:
+            msg = f"Unknown routing policy: {policy}"
+            raise ValueError(msg)
+
+        return cls([Backend(spec, factory(spec)) for spec in specs], POLICIES[policy]())
+
+    @property
+    def backends(self: Self) -> list[Backend]:
+        """Модели маршрутизатора."""
+        return self._backends
+
+    def candidates(self: Self) -> list[Backend]:
+        """Модели, которым можно отправить документ, в порядке политики."""
+        return self._policy.rank([backend for backend in self._backends if backend.stats.available])
+
+    def load_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
+        file_id = uuid4().hex
+        self._files[file_id] = file_dto
+        candidates = self.candidates()
+        if candidates:
+            try:
+                self._prefetch(file_id, candidates[0], as_sync(candidates[0].agent).load_file(file_dto))
+            except Exception as e:
+                self._prefetch_failed(candidates[0], e)
+        return None, file_id
+
+    async def aload_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
+        file_id = uuid4().hex
+        self._files[file_id] = file_dto
+        candidates = self.candidates()
+        if candidates:
+            try:
+                self._prefetch(file_id, candidates[0], await as_async(candidates[0].agent).aload_file(file_dto))
+            except Exception as e:
+                self._prefetch_failed(candidates[0], e)
+        return None, file_id
+
+    def delete_file(self: Self, file_id: str) -> None:  # noqa: D102
+        self._files.pop(file_id, None)
+        prefetched = self._prefetched.pop(file_id, None)
+        if prefetched is not None:
+            backend, backend_file_id = prefetched
+            as_sync(backend.agent).delete_file(backend_file_id)
+
+    async def adelete_file(self: Self, file_id: str) -> None:  # noqa: D102
+        self._files.pop(file_id, None)
+        prefetched = self._prefetched.pop(file_id, None)
+        if prefetched is not None:
+            backend, backend_file_id = prefetched
+            await as_async(backend.agent).adelete_file(backend_file_id)
+
+    def _prefetch(self: Self, file_id: str, backend: Backend, loaded: tuple[str | None, str | None]) -> None:
+        err, backend_file_id = loaded
+        if backend_file_id:
+            self._prefetched[file_id] = (backend, backend_file_id)
+        else:
+            log.warning("%s: %s, загрузка повторится при обработке", backend.name, err)
+
+    @staticmethod
+    def _prefetch_failed(backend: Backend, error: Exception) -> None:
+        log.warning("%s: предварительная загрузка не удалась: %s", backend.name, error)
+
+    def _uploaded(self: Self, file_id: str, backend: Backend) -> str | None:
+        """Файл, заранее загруженный в модель, None - если его нужно загрузить."""  # noqa: RUF002
+        prefetched = self._prefetched.get(file_id)
+        if prefetched is None or prefetched[0] is not backend:
+            return None
+        del self._prefetched[file_id]
+        return prefetched[1]
+
+    def close(self: Self) -> None:
+        """Освободить ресурсы моделей, например удалить из них оставшиеся файлы."""
+        for backend in self._backends:
+            close = getattr(backend.agent, "close", None)
+            if callable(close):
+                close()
+
+    def process_file(self: Self, file_id: str) -> None:
+        """Обработать документ с ограничением времени на весь путь: загрузку, шаги модели, инструменты и удаление."""  # noqa: RUF002
+        file_dto = self._files[file_id]
+        with document_deadline() as deadline:
+            try:
+                return self._process(file_id, file_dto)
+            except DeadlineExceededError as e:
+                return self._expired(file_dto, deadline, e)
+
+    async def aprocess_file(self: Self, file_id: str) -> None:
+        """Асинхронный вариант `process_file`: по истечении срока текущий этап отменяется."""
+        file_dto = self._files[file_id]
+        with document_deadline() as deadline:
+            try:
+                return await self._aprocess(file_id, file_dto)
+            except DeadlineExceededError as e:
+                return self._expired(file_dto, deadline, e)
+
+    def _process(self: Self, file_id: str, file_dto: FileDTO) -> None:
+        errors: list[str] = []
+        for backend in self.candidates():
+            agent = as_sync(backend.agent)
+            err, backend_file_id = None, self._uploaded(file_id, backend)
+            start = time.monotonic()
+            if backend_file_id is None:
+                err, backend_file_id = agent.load_file(file_dto)
+            if not backend_file_id:
+                errors.append(self._upload_failed(backend, err, start))
+                continue
+
+            start = time.monotonic()
+            try:
+                agent.process_file(backend_file_id)
+            except BackendError as e:
+                self._failed(backend, e, start)
+                continue
+            except Exception:
+                backend.stats.record(time.monotonic() - start, ok=False)
+                raise
+            finally:
+                agent.delete_file(backend_file_id)
+            return self._done(backend, start)
+
+        return self._unavailable(file_dto, errors)
+
+    async def _aprocess(self: Self, file_id: str, file_dto: FileDTO) -> None:
+        errors: list[str] = []
+        for backend in self.candidates():
+            agent = as_async(backend.agent)
+            err, backend_file_id = None, self._uploaded(file_id, backend)
+            start = time.monotonic()
+            if backend_file_id is None:
+                err, backend_file_id = await agent.aload_file(file_dto)
+            if not backend_file_id:
+                errors.append(self._upload_failed(backend, err, start))
+                continue
+
+            start = time.monotonic()
+            try:
+                await agent.aprocess_file(backend_file_id)
+            except BackendError as e:
+                self._failed(backend, e, start)
+                continue
+            except Exception:
+                backend.stats.record(time.monotonic() - start, ok=False)
+                raise
+            finally:
+                await agent.adelete_file(backend_file_id)
+            return self._done(backend, start)
+
+        return self._unavailable(file_dto, errors)
+
+    @staticmethod
+    def _unavailable(file_dto: FileDTO, errors: list[str]) -> None:
+        log.critical("Нет доступных моделей для обработки %s", file_dto.name)
+        jobs.postpone("; ".join(errors) or "no backend available")
+
+    @staticmethod
+    def _expired(file_dto: FileDTO, deadline: Deadline, error: DeadlineExceededError) -> None:
+        jobs.postpone(str(error))
+        log.error(
+            "Обработка %s прервана через %.1f с на этапе %s: %s",
+            file_dto.name,
+            deadline.elapsed(),
+            error.stage,
+            error.reason,
+        )
+
+    @staticmethod
+    def _done(backend: Backend, start: float) -> None:
+        elapsed = time.monotonic() - start
+        backend.stats.record(elapsed, ok=True)
+        backend.stats.use()
+        log.info("%s обработал документ за %.1f с", backend.name, elapsed)
+
+    @staticmethod
+    def _upload_failed(backend: Backend, error: str | None, start: float) -> str:
+        """Учесть неудачную загрузку: квота или ошибка сервера модели не должны останавливать документ."""
+        backend.stats.record(time.monotonic() - start, ok=False)
+        log.warning("%s: загрузка не удалась: %s, документ передаётся следующей модели", backend.name, error)
+        return f"{backend.name}: {error}"
+
+    @staticmethod
+    def _failed(backend: Backend, error: BackendError, start: float) -> None:
+        backend.stats.record(time.monotonic() - start, ok=False)
+        if isinstance(error, QuotaExceededError):
+            backend.stats.exhaust(error.retry_after)
+        log.warning("%s: %s, документ передаётся следующей модели", backend.name, error)
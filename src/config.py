@@ -10,6 +10,7 @@ from dotenv import load_dotenv
 APP_DIR = Path(__file__).parent
 BASE_DIR = APP_DIR.parent
 ENV_FILE = BASE_DIR / ".env"
+DATA_DIR = BASE_DIR / ".data"
 
 
 @dataclass
@@ -29,6 +30,42 @@ class Config:
     URL_KEY_RATES_ATTRS: str
     URL_KEY_RATES_NAMES: str
 
+    LEDGER_PATH: Path  # Журнал успешных изменяющих запросов к DocAPI
+    LEDGER_RETENTION_HOURS: float  # Время хранения записей журнала
+
+    JOBS_PATH: Path  # Задания на обработку вложений и их контрольные точки
+    JOBS_RETENTION_HOURS: float  # Время хранения завершённых заданий
+    INSTANCE_ID: str  # Имя экземпляра сервиса для аренды заданий, пусто - хост и процесс
+    LEASE_SECONDS: float  # Срок аренды задания, продлевается во время обработки
+    PIPELINE_DEPTH: int  # Заданий в очереди перед каждым этапом конвейера: загрузкой, обработкой, удалением
+
+    PDF_WORKERS: int  # Количество процессов для разбора больших PDF
+    PDF_PREFILTER: bool  # Искать таблицы только на страницах-кандидатах, текст разбирается всегда
+
+    CLASSIFIER_MODEL: Path | None  # Веса модели отбора документов, без них работают только правила  # noqa: RUF003
+    CLASSIFIER_THRESHOLD: float  # Порог оценки, ниже которого документ пропускается
+
+    ALIASES_PATH: Path  # Выученные сопоставления заголовков из документов с атрибутами DocAPI  # noqa: RUF003
+
+    WARM_CACHE_PATH: Path  # Справочные данные DocAPI для быстрого старта
+    WARM_CACHE_TTL_HOURS: float  # Через сколько часов справочные данные обновляются в фоне
+
+    ROUTE_BACKENDS: str  # Модели для маршрутизации: "G:gemini-2.5-flash:250, S", пусто - выбор режима при запуске
+    ROUTE_POLICY: str  # Политика выбора модели: priority, latency или quota
+
+    DOC_DEADLINE_SECONDS: float  # Срок обработки одного документа целиком
+    UPLOAD_TIMEOUT_SECONDS: float  # Загрузка файла в модель
+    STEP_TIMEOUT_SECONDS: float  # Один запрос к модели
+    TOOL_TIMEOUT_SECONDS: float  # Один вызов инструмента
+    DELETE_TIMEOUT_SECONDS: float  # Удаление файла из модели
+
+    DOC_TOKEN_BUDGET: int  # Токенов на документ за все запуски, 0 - без ограничения
+    DOC_COST_BUDGET: float  # Оценка стоимости документа в долларах, 0 - без ограничения
+    MODEL_PRICES: str  # Цены моделей за миллион токенов в долларах: "модель=вход/кэш/ответ, ..."
+
+    METRICS_HOST: str  # Адрес сервера метрик OpenMetrics
+    METRICS_PORT: int  # Порт сервера метрик, 0 - не запускать
+
 
 def get_config() -> Config:
     """Load configuration from environment file (.env) if it exists, else from system environment.
@@ -55,6 +92,32 @@ def get_config() -> Config:
         URL_KEY_RATES_NAMES=os.getenv("URL_KEY_RATES_NAMES", "http://127.0.0.1:23232/api/v1/docs/known-names").strip(
             "/",
         ),
+        LEDGER_PATH=Path(os.getenv("LEDGER_PATH", str(DATA_DIR / "ledger.sqlite3"))),
+        LEDGER_RETENTION_HOURS=float(os.getenv("LEDGER_RETENTION_HOURS", "72")),
+        JOBS_PATH=Path(os.getenv("JOBS_PATH", str(DATA_DIR / "jobs.sqlite3"))),
+        JOBS_RETENTION_HOURS=float(os.getenv("JOBS_RETENTION_HOURS", "720")),
+        INSTANCE_ID=os.getenv("INSTANCE_ID", ""),
+        LEASE_SECONDS=float(os.getenv("LEASE_SECONDS", "60")),
+        PIPELINE_DEPTH=int(os.getenv("PIPELINE_DEPTH", "1")),
+        PDF_WORKERS=int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1))),
+        PDF_PREFILTER=os.getenv("PDF_PREFILTER", "0").lower() in {"1", "true", "yes"},
+        CLASSIFIER_MODEL=Path(os.environ["CLASSIFIER_MODEL"]) if os.getenv("CLASSIFIER_MODEL") else None,
+        CLASSIFIER_THRESHOLD=float(os.getenv("CLASSIFIER_THRESHOLD", "0.5")),
+        ALIASES_PATH=Path(os.getenv("ALIASES_PATH", str(DATA_DIR / "aliases.json"))),
+        WARM_CACHE_PATH=Path(os.getenv("WARM_CACHE_PATH", str(DATA_DIR / "warm_cache.json"))),
+        WARM_CACHE_TTL_HOURS=float(os.getenv("WARM_CACHE_TTL_HOURS", "24")),
+        ROUTE_BACKENDS=os.getenv("ROUTE_BACKENDS", ""),
+        ROUTE_POLICY=os.getenv("ROUTE_POLICY", "latency"),
+        DOC_DEADLINE_SECONDS=float(os.getenv("DOC_DEADLINE_SECONDS", "600")),
+        UPLOAD_TIMEOUT_SECONDS=float(os.getenv("UPLOAD_TIMEOUT_SECONDS", "60")),
+        STEP_TIMEOUT_SECONDS=float(os.getenv("STEP_TIMEOUT_SECONDS", "120")),
+        TOOL_TIMEOUT_SECONDS=float(os.getenv("TOOL_TIMEOUT_SECONDS", "35")),
+        DELETE_TIMEOUT_SECONDS=float(os.getenv("DELETE_TIMEOUT_SECONDS", "30")),
+        DOC_TOKEN_BUDGET=int(os.getenv("DOC_TOKEN_BUDGET", "0")),
+        DOC_COST_BUDGET=float(os.getenv("DOC_COST_BUDGET", "0")),
+        MODEL_PRICES=os.getenv("MODEL_PRICES", ""),
+        METRICS_HOST=os.getenv("METRICS_HOST", "127.0.0.1"),
+        METRICS_PORT=int(os.getenv("METRICS_PORT", "9108")),
     )
 
 
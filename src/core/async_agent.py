@@ -0,0 +1,135 @@
+"""Взаимозаменяемое использование синхронных и асинхронных агентов."""
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import threading
+from typing import TYPE_CHECKING, Any, Self
+
+from src.core.logger import logger as log
+
+if TYPE_CHECKING:
+    from collections.abc import Coroutine
+
+    from src.core.intrfaces import AsyncKeyRatesAgentInterface, KeyRatesAgentInterface
+    from src.dto import FileDTO
+
+ASYNC_METHODS = ("aload_file", "aprocess_file", "adelete_file")
+SYNC_METHODS = ("load_file", "process_file", "delete_file")
+
+
+def is_async_agent(agent: object) -> bool:
+    """Агент реализует асинхронный интерфейс."""
+    return all(inspect.iscoroutinefunction(getattr(agent, name, None)) for name in ASYNC_METHODS)
+
+
+def is_sync_agent(agent: object) -> bool:
+    """Агент реализует синхронный интерфейс."""
+    return all(callable(getattr(agent, name, None)) for name in SYNC_METHODS)
+
+
+class _AgentProxy:
+    """Общая часть адаптеров: остальные атрибуты берутся у исходного агента."""  # noqa: RUF002
+
+    def __init__(self: Self, agent: Any) -> None:  # noqa: ANN401
+        self.agent = agent
+
+    def __getattr__(self: Self, name: str) -> Any:  # noqa: ANN401
+        return getattr(self.agent, name)
+
+    def __repr__(self: Self) -> str:
+        return repr(self.agent)
+
+
+class ThreadedAgent(_AgentProxy):
+    """Синхронный агент с асинхронным интерфейсом: методы выполняются в отдельном потоке."""  # noqa: RUF002
+
+    agent: KeyRatesAgentInterface
+
+    async def aload_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
+        return await asyncio.to_thread(self.agent.load_file, file_dto)
+
+    async def aprocess_file(self: Self, file_id: str) -> None:  # noqa: D102
+        return await asyncio.to_thread(self.agent.process_file, file_id)
+
+    async def adelete_file(self: Self, file_id: str) -> None:  # noqa: D102
+        return await asyncio.to_thread(self.agent.delete_file, file_id)
+
+
+class BlockingAgent(_AgentProxy):
+    """Асинхронный агент с синхронным интерфейсом.
+
+    Корутины выполняются в собственном цикле событий адаптера в отдельном потоке,
+    поэтому методы можно вызывать из любого потока, в том числе из нескольких сразу.
+    """  # noqa: RUF002
+
+    agent: AsyncKeyRatesAgentInterface
+
+    def __init__(self: Self, agent: AsyncKeyRatesAgentInterface) -> None:  # noqa: D107
+        super().__init__(agent)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock = threading.Lock()
+
+    def _run[T](self: Self, coro: Coroutine[Any, Any, T]) -> T:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="agent-loop", daemon=True).start()
+                log.debug("Запущен цикл событий для агента %s", self.agent)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def load_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
+        return self._run(self.agent.aload_file(file_dto))
+
+    def process_file(self: Self, file_id: str) -> None:  # noqa: D102
+        return self._run(self.agent.aprocess_file(file_id))
+
+    def delete_file(self: Self, file_id: str) -> None:  # noqa: D102
+        return self._run(self.agent.adelete_file(file_id))
+
+    def close(self: Self) -> None:
+        """Остановить цикл событий адаптера."""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+
+
+def as_async(agent: KeyRatesAgentInterface | AsyncKeyRatesAgentInterface) -> AsyncKeyRatesAgentInterface:
+    """Агент с асинхронным интерфейсом: сам агент, если он его реализует, иначе адаптер."""  # noqa: RUF002
+    if is_async_agent(agent):
+        return agent  # type: ignore[return-value]
+    if not is_sync_agent(agent):
+        msg = f"Agent {agent!r} implements neither sync nor async interface"
+        raise TypeError(msg)
+
+    return ThreadedAgent(agent)  # type: ignore[return-value]
+
+
+def as_sync(agent: KeyRatesAgentInterface | AsyncKeyRatesAgentInterface) -> KeyRatesAgentInterface:
+    """Агент с синхронным интерфейсом: сам агент, если он его реализует, иначе адаптер."""  # noqa: RUF002
+    if is_sync_agent(agent):
+        return agent  # type: ignore[return-value]
+    if not is_async_agent(agent):
+        msg = f"Agent {agent!r} implements neither sync nor async interface"
+        raise TypeError(msg)
+
+    return BlockingAgent(agent)  # type: ignore[arg-type, return-value]
+
+
+async def handle_document(agent: AsyncKeyRatesAgentInterface, file_dto: FileDTO) -> str | None:
+    """Загрузить, обработать и удалить документ.
+
+    Returns:
+        str | None: Сообщение об ошибке загрузки.
+    """  # noqa: RUF002
+    err, file_id = await agent.aload_file(file_dto)
+    if not file_id:
+        return err
+
+    try:
+        await agent.aprocess_file(file_id)
+    finally:
+        await agent.adelete_file(file_id)
+    return None
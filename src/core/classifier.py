@@ -0,0 +1,175 @@
+"""Локальная проверка, что PDF похож на документ с ключевыми ставками."""  # noqa: RUF002
+
+from __future__ import annotations
+
+import json
+import math
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Self
+
+from src.core.pdf import pdf_to_dict
+
+if TYPE_CHECKING:
+    from src.core.pdf import PDFSource
+
+KEYWORDS = ("ключев", "ставк", "rate", "процент", "срок", "term", "%")
+# Только признаки счетов и актов: "договор" и "подпись" встречаются и в банковских уведомлениях про ставки
+NEGATIVE_KEYWORDS = ("счет на оплату", "счёт на оплату", "invoice", "акт выполненных")
+_NUMBER_RE = re.compile(r"^[-+]?\d+(?:[.,]\d+)?\s?%?$")
+_DATE_RE = re.compile(r"\b\d{1,2}[./]\d{1,2}[./]\d{2,4}\b|\b\d{4}-\d{2}-\d{2}\b")
+
+# Веса правил: сумма весов положительных признаков равна 1  # noqa: RUF003
+RULE_WEIGHTS = {
+    "keyword_hits": 0.4,
+    "tables": 0.3,
+    "numeric_ratio": 0.2,
+    "has_date": 0.1,
+}
+
+
+@dataclass
+class Verdict:
+    """Результат проверки документа."""
+
+    relevant: bool  # Документ похож на документ с ключевыми ставками  # noqa: RUF003
+    score: float  # Оценка от 0 до 1
+    reasons: list[str] = field(default_factory=list)  # Причины решения для журнала
+
+    def __str__(self: Self) -> str:  # noqa: D105
+        return f"{self.score:.2f}: {'; '.join(self.reasons)}"
+
+
+@dataclass
+class LinearModel:
+    """Логистическая регрессия по признакам документа."""
+
+    weights: dict[str, float]
+    bias: float = 0.0
+
+    @classmethod
+    def load(cls: type[Self], path: Path | str) -> Self:
+        """Загрузить веса из JSON-файла вида `{"bias": 0.0, "weights": {"tables": 1.0}}`."""
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        return cls(weights={k: float(v) for k, v in data["weights"].items()}, bias=float(data.get("bias", 0.0)))
+
+    def save(self: Self, path: Path | str) -> None:
+        """Сохранить веса в JSON-файл."""
+        Path(path).write_text(json.dumps({"bias": self.bias, "weights": self.weights}, indent=2), encoding="utf-8")
+
+    def predict(self: Self, features: dict[str, float]) -> float:
+        """Вероятность того, что документ нужный."""
+        z = self.bias + sum(w * features.get(name, 0.0) for name, w in self.weights.items())
+        return 1 / (1 + math.exp(-max(min(z, 50.0), -50.0)))
+
+    @classmethod
+    def fit(
+        cls: type[Self],
+        samples: list[tuple[dict[str, float], bool]],
+        epochs: int = 500,
+        learning_rate: float = 0.5,
+    ) -> Self:
+        """Обучить модель градиентным спуском на размеченных признаках документов."""
+        names = sorted({name for features, _ in samples for name in features})
+        model = cls(weights=dict.fromkeys(names, 0.0))
+        for _ in range(epochs):
+            grad_w = dict.fromkeys(names, 0.0)
+            grad_b = 0.0
+            for features, label in samples:
+                error = model.predict(features) - float(label)
+                grad_b += error
+                for name in names:
+                    grad_w[name] += error * features.get(name, 0.0)
+            model.bias -= learning_rate * grad_b / len(samples)
+            for name in names:
+                model.weights[name] -= learning_rate * grad_w[name] / len(samples)
+        return model
+
+
+def extract_features(data: dict[str, Any]) -> dict[str, float]:
+    """Признаки документа по результату `pdf_to_dict`.
+
+    Счётчики приведены к небольшим значениям (логарифм, доли), чтобы их можно было подавать в `LinearModel`.
+    """
+    pages = data["pages"]
+    total_pages = data.get("stats", {}).get("total_pages", len(pages)) or 1
+    text = "\n".join(page["text"] or "" for page in pages).lower()
+    cells = [
+        value
+        for table in data["tables"]
+        for value in [*table["columns"], *(v for row in table["data"] for v in row.values())]
+        if value and value.strip()
+    ]
+    header_text = " ".join(str(c).lower() for table in data["tables"] for c in table["columns"] if c)
+    haystack = f"{text}\n{header_text}"
+    numeric = sum(1 for value in cells if _NUMBER_RE.match(value.strip()))
+    return {
+        "pages": math.log1p(total_pages),
+        "text_chars": math.log1p(len(text.strip())),
+        "tables": float(len(data["tables"])),
+        "numeric_ratio": numeric / len(cells) if cells else 0.0,
+        "keyword_hits": float(sum(1 for keyword in KEYWORDS if keyword in haystack)),
+        "negative_hits": float(sum(1 for keyword in NEGATIVE_KEYWORDS if keyword in haystack)),
+        "has_date": 1.0 if _DATE_RE.search(haystack) else 0.0,
+        "images_per_page": sum(page["images"] for page in pages) / total_pages,
+    }
+
+
+class DocumentClassifier:
+    """Отбор PDF с ключевыми ставками до загрузки в модель.
+
+    По умолчанию используются правила по ключевым словам и таблицам.
+    Если задана обученная модель (`LinearModel`), решение принимает она, а правила только поясняют его в журнале.
+    """  # noqa: RUF002
+
+    def __init__(self: Self, model: LinearModel | None = None, threshold: float = 0.5) -> None:  # noqa: D107
+        self._model = model
+        self._threshold = threshold
+
+    @classmethod
+    def from_config(cls: type[Self], model_path: Path | str | None, threshold: float) -> Self:
+        """Создать классификатор, модель загружается, только если указан путь к ней."""
+        return cls(LinearModel.load(model_path) if model_path else None, threshold)
+
+    def _rules(self: Self, features: dict[str, float]) -> tuple[float, list[str]]:
+        reasons: list[str] = []
+        if not features["text_chars"]:
+            reasons.append("нет текстового слоя (скан или изображение)")
+            return 0.0, reasons
+
+        score = (
+            RULE_WEIGHTS["keyword_hits"] * min(features["keyword_hits"] / 2, 1.0)
+            + RULE_WEIGHTS["tables"] * min(features["tables"], 1.0)
+            + RULE_WEIGHTS["numeric_ratio"] * min(features["numeric_ratio"] * 2, 1.0)
+            + RULE_WEIGHTS["has_date"] * features["has_date"]
+        )
+        if features["negative_hits"]:
+            score /= 1 + features["negative_hits"]
+            reasons.append(f"стоп-слов: {int(features['negative_hits'])}")
+        if not features["keyword_hits"]:
+            reasons.append("нет ключевых слов")
+        if not features["tables"]:
+            reasons.append("нет таблиц")
+        elif features["numeric_ratio"] < 0.25:  # noqa: PLR2004
+            reasons.append(f"мало чисел в таблицах ({features['numeric_ratio']:.0%})")
+        if not features["has_date"]:
+            reasons.append("нет даты")
+        return score, reasons
+
+    def check(self: Self, data: dict[str, Any]) -> Verdict:
+        """Проверить документ по результату `pdf_to_dict`."""
+        features = extract_features(data)
+        score, reasons = self._rules(features)
+        if self._model is not None and features["text_chars"]:
+            score = self._model.predict(features)
+            reasons.insert(0, "модель")
+        return Verdict(relevant=score >= self._threshold, score=score, reasons=reasons)
+
+    def classify(self: Self, source: PDFSource) -> Verdict:
+        """Проверить PDF."""
+        try:
+            data = pdf_to_dict(source)
+        except Exception as e:
+            return Verdict(relevant=False, score=0.0, reasons=[f"не удалось прочитать PDF: {e.__class__.__name__}"])
+        return self.check(data)
@@ -0,0 +1,229 @@
+"""Срок обработки документа и ограничения времени отдельных этапов.
+
+Срок документа хранится в контекстной переменной и поэтому доступен на всех этапах: загрузке,
+шагах модели, вызовах инструментов и удалении, без передачи через аргументы.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, wait
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from typing import TYPE_CHECKING, Any, Literal, Self
+
+from src.core.logger import logger as log
+from src.core.metrics import STAGE_SECONDS
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Iterator
+
+type Stage = Literal["upload", "step", "tool", "delete"]
+
+CLEANUP_STAGES: frozenset[Stage] = frozenset({"delete"})  # Выполняются и после истечения срока документа
+
+
+@dataclass
+class DeadlineSettings:
+    """Ограничения времени, секунды."""
+
+    document: float = 600.0  # Вся обработка документа: загрузка, шаги модели, инструменты
+    upload: float = 60.0  # Загрузка файла в модель
+    step: float = 120.0  # Один запрос к модели
+    tool: float = 35.0  # Один вызов инструмента
+    delete: float = 30.0  # Удаление файла из модели
+
+
+settings = DeadlineSettings()
+
+
+class DeadlineExceededError(TimeoutError):
+    """Истёк срок документа или время этапа."""
+
+    def __init__(self: Self, stage: Stage, reason: str) -> None:
+        """Ошибка срока.
+
+        Args:
+            stage (Stage): Этап, на котором истёк срок.
+            reason (str): Какое ограничение сработало.
+        """
+        super().__init__(f"Deadline exceeded at stage '{stage}': {reason}")
+        self.stage = stage
+        self.reason = reason
+
+
+class Deadline:
+    """Срок обработки одного документа."""
+
+    def __init__(self: Self, total: float, stages: DeadlineSettings | None = None) -> None:
+        """Начать отсчёт.
+
+        Args:
+            total (float): Секунд на весь документ.
+            stages (DeadlineSettings | None): Ограничения этапов, по умолчанию - общие настройки.
+        """
+        self.total = total
+        self.stages = stages or settings
+        self.started = time.monotonic()
+
+    def elapsed(self: Self) -> float:
+        """Сколько секунд прошло с начала обработки."""  # noqa: RUF002
+        return time.monotonic() - self.started
+
+    def remaining(self: Self) -> float:
+        """Сколько секунд осталось до срока."""
+        return self.total - self.elapsed()
+
+    def timeout(self: Self, stage: Stage) -> tuple[float, str]:
+        """Время на этап и ограничение, которое его определило.
+
+        Raises:
+            DeadlineExceededError: Срок документа уже истёк.
+        """  # noqa: RUF002
+        limit = float(getattr(self.stages, stage))
+        if stage in CLEANUP_STAGES:
+            return limit, f"{stage} timeout {limit:g} s"
+
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceededError(stage, f"document deadline {self.total:g} s passed")
+        if remaining < limit:
+            return remaining, f"document deadline {self.total:g} s"
+        return limit, f"{stage} timeout {limit:g} s"
+
+
+_current: contextvars.ContextVar[Deadline | None] = contextvars.ContextVar("deadline", default=None)
+# Признаки брошенных этапов, внутри которых идёт выполнение: по одному на каждый вложенный `run_stage`
+_abandoned: contextvars.ContextVar[tuple[threading.Event, ...]] = contextvars.ContextVar("abandoned", default=())
+
+
+def current() -> Deadline | None:
+    """Срок документа, который сейчас обрабатывается."""
+    return _current.get()
+
+
+@contextmanager
+def document_deadline(total: float | None = None) -> Iterator[Deadline]:
+    """Установить срок документа, если он ещё не установлен выше по стеку вызовов."""
+    deadline = _current.get()
+    if deadline is not None:
+        yield deadline
+        return
+
+    deadline = Deadline(settings.document if total is None else total)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def stage_timeout(stage: Stage, limit: float | None = None) -> float:
+    """Время на этап с учётом срока документа.
+
+    Args:
+        stage (Stage): Этап.
+        limit (float | None): Собственное ограничение вызывающего, например таймаут инструмента.
+    """  # noqa: RUF002
+    timeout = _timeout_reason(stage)[0]
+    return timeout if limit is None else min(timeout, limit)
+
+
+def _timeout_reason(stage: Stage) -> tuple[float, str]:
+    if stage not in CLEANUP_STAGES and any(event.is_set() for event in _abandoned.get()):
+        # Поток этапа, результат которого уже не ждут, не начинает новых этапов: например, запросов инструментов
+        raise DeadlineExceededError(stage, "enclosing stage timed out")
+    deadline = _current.get()
+    if deadline is None:
+        limit = float(getattr(settings, stage))
+        return limit, f"{stage} timeout {limit:g} s"
+    return deadline.timeout(stage)
+
+
+def run_stage[T](
+    stage: Stage,
+    func: Callable[..., T],
+    *args: Any,
+    on_late: Callable[[T], object] | None = None,
+    **kwargs: Any,
+) -> T:
+    """Выполнить синхронный этап с ограничением времени.
+
+    Этап выполняется в отдельном потоке: по истечении времени результат не ждём,
+    но сам поток прервать нельзя, он завершится вместе с запросом. Вложенные этапы
+    в брошенном потоке не начинаются, а результат, полученный после истечения времени,
+    передаётся в `on_late`, например чтобы удалить загруженный файл.
+    """  # noqa: RUF002
+    timeout, reason = _timeout_reason(stage)
+    future: Future[T] = Future()
+    abandoned = threading.Event()
+    context = contextvars.copy_context()
+    context.run(_abandoned.set, (*_abandoned.get(), abandoned))
+
+    def target() -> None:
+        try:
+            future.set_result(context.run(func, *args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    started = time.perf_counter()
+    outcome = "error"
+    threading.Thread(target=target, name=f"stage-{stage}", daemon=True).start()
+    try:
+        # Ожидание отдельно от результата: TimeoutError самого этапа не выдаётся за истечение времени
+        if not wait([future], timeout=timeout).done:
+            abandoned.set()
+            if on_late is not None:
+                future.add_done_callback(partial(_release_late, stage, on_late))
+            outcome = "timeout"
+            log.error("Этап %s прерван через %.1f с: %s", stage, timeout, reason)
+            raise DeadlineExceededError(stage, reason)
+        result = future.result()
+        outcome = "ok"
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage, outcome=outcome)
+    return result
+
+
+def _release_late[T](stage: Stage, on_late: Callable[[T], object], future: Future[T]) -> None:
+    """Передать результат этапа, завершившегося после истечения времени, для освобождения."""
+    if future.exception() is not None:
+        return
+
+    log.warning("Этап %s завершился после истечения времени, результат освобождается", stage)
+    try:
+        on_late(future.result())
+    except Exception:
+        log.exception("Не удалось освободить результат этапа %s", stage)
+
+
+async def arun_stage[T](stage: Stage, awaitable: Awaitable[T]) -> T:
+    """Выполнить асинхронный этап с ограничением времени, по истечении времени этап отменяется."""  # noqa: RUF002
+    try:
+        timeout, reason = _timeout_reason(stage)
+    except DeadlineExceededError:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+
+    started = time.perf_counter()
+    outcome = "error"
+    limit = asyncio.timeout(timeout)
+    try:
+        async with limit:
+            result = await awaitable
+        outcome = "ok"
+    except TimeoutError:
+        if not limit.expired():
+            # TimeoutError самого этапа, в том числе DeadlineExceededError вложенного, передаётся как есть
+            raise
+        outcome = "timeout"
+        log.error("Этап %s отменён через %.1f с: %s", stage, timeout, reason)
+        raise DeadlineExceededError(stage, reason) from None
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage, outcome=outcome)
+    return result
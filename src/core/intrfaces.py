@@ -6,6 +6,31 @@ if TYPE_CHECKING:
     from src.dto import FileDTO
 
 
+class BackendError(Exception):
+    """Модель не смогла обработать файл по причинам, не связанным с самим файлом.
+
+    Файл можно отправить в другую модель.
+    """  # noqa: RUF002
+
+
+class QuotaExceededError(BackendError):
+    """Исчерпана квота запросов или токенов модели."""
+
+    def __init__(self: Self, message: str, retry_after: float | None = None) -> None:
+        """Ошибка квоты.
+
+        Args:
+            message (str): Описание ошибки от модели.
+            retry_after (float | None): Через сколько секунд квота восстановится, если модель это сообщила.
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BackendUnavailableError(BackendError):
+    """Модель временно недоступна: ошибка сервера или сети."""
+
+
 class BaseAgentInterface(Protocol):
     """Базовый интерфейс для агента."""  # noqa: RUF002
 
@@ -59,3 +84,26 @@ class KeyRatesAgentInterface(BaseAgentInterface, Protocol):  # noqa: D101
     def process_file(self: Self, file_id: str) -> None:
         """Обработать пользовательский файл."""
         raise NotImplementedError
+
+
+class AsyncKeyRatesAgentInterface(BaseAgentInterface, Protocol):
+    """Асинхронный вариант `KeyRatesAgentInterface`: пока идёт обмен с моделью, поток не занят."""  # noqa: RUF002
+
+    async def aload_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:
+        """Загрузить пользовательский файл в модель и вернуть его идентификатор.
+
+        #### Args:
+        - file_dto (FileDTO): Данные о пользовательском файле.
+
+        #### Returns:
+        - tuple[str | None, str | None]: Сообщение об ошибке и идентификатор файла.
+        """  # noqa: RUF002
+        raise NotImplementedError
+
+    async def adelete_file(self: Self, file_id: str) -> None:
+        """Удалить пользовательский файл из модели."""
+        raise NotImplementedError
+
+    async def aprocess_file(self: Self, file_id: str) -> None:
+        """Обработать пользовательский файл."""
+        raise NotImplementedError
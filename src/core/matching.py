@@ -0,0 +1,311 @@
+"""Нечёткое сопоставление заголовков из документа с атрибутами и видами данных DocAPI."""  # noqa: RUF002
+
+from __future__ import annotations
+
+import json
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Self
+
+from src.core.logger import logger as log
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+TRANSLIT = str.maketrans(
+    {
+        "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh", "з": "z", "и": "i",
+        "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t",
+        "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "", "ы": "y", "ь": "",
+        "э": "e", "ю": "yu", "я": "ya",
+    },
+)  # fmt: skip
+NAME_KEYS = ("name", "code", "key", "attr", "id")  # Поля ответов DocAPI, где лежит имя атрибута
+ALIAS_KEYS = ("description", "title", "label", "comment", "verbose_name")  # Поля, где лежит название
+NGRAM = 3
+MIN_HINT_SCORE = 0.3  # Кандидаты, чьё сходство ниже, не попадают в промт: они чаще путают модель, чем помогают
+MIN_LEARN_SCORE = 0.6  # Псевдоним выучивается навсегда: слабое сходство не подтверждается даже успешной записью
+_NON_ALNUM_RE = re.compile(r"[^0-9a-z]+")
+
+
+def transliterate(text: str) -> str:
+    """Перевести кириллицу в латиницу."""
+    return text.lower().translate(TRANSLIT)
+
+
+def normalize(text: str) -> str:
+    """Нормализованная форма для сравнения: латиница, нижний регистр, слова через пробел."""
+    return _NON_ALNUM_RE.sub(" ", transliterate(text)).strip()
+
+
+def _ngrams(text: str) -> set[str]:
+    padded = f" {text} "
+    return {padded[i : i + NGRAM] for i in range(max(len(padded) - NGRAM + 1, 1))}
+
+
+def parse_names(text: str | None) -> dict[str, list[str]]:
+    """Имена и их человекочитаемые названия из ответа DocAPI.
+
+    Поддерживаются список строк, список объектов (`name` + `description` и т.п.) и объект `{имя: название}`.
+    """
+    if not text:
+        return {}
+
+    try:
+        data: Any = json.loads(text)
+    except ValueError:
+        return {}
+
+    if isinstance(data, dict) and not any(key in data for key in NAME_KEYS):
+        # {"items": [...]} или {имя: название}
+        nested = next((v for v in data.values() if isinstance(v, list)), None)
+        if nested is not None:
+            data = nested
+        else:
+            return {str(k): [str(v)] if isinstance(v, str) else [] for k, v in data.items()}
+
+    result: dict[str, list[str]] = {}
+    for item in data if isinstance(data, list) else [data]:
+        if isinstance(item, str):
+            result[item] = []
+        elif isinstance(item, dict):
+            name = next((item[key] for key in NAME_KEYS if isinstance(item.get(key), str)), None)
+            if name:
+                result[name] = [item[key] for key in ALIAS_KEYS if isinstance(item.get(key), str)]
+    return result
+
+
+@dataclass(frozen=True)
+class Candidate:
+    """Кандидат на сопоставление."""
+
+    name: str  # Имя атрибута или вида данных DocAPI
+    score: float  # Оценка сходства от 0 до 1
+    source: str  # Откуда взято: alias - выученный псевдоним, exact - точное совпадение, ngram - сходство
+
+
+class MatchIndex:
+    """Индекс для быстрого сопоставления заголовков с допустимыми именами.
+
+    Строится один раз по списку имён: имена и их названия транслитерируются и раскладываются на триграммы.
+    Выученные псевдонимы (заголовок -> имя) хранятся в JSON-файле и имеют приоритет над сходством.
+    """  # noqa: RUF002
+
+    def __init__(
+        self: Self,
+        names: dict[str, list[str]] | Iterable[str],
+        alias_path: Path | str | None = None,
+    ) -> None:
+        """Построить индекс.
+
+        Args:
+            names (dict[str, list[str]] | Iterable[str]): Допустимые имена и (необязательно) их названия.
+            alias_path (Path | str | None): Файл выученных псевдонимов.
+        """
+        names = names if isinstance(names, dict) else {name: [] for name in names}
+        self._lock = threading.Lock()
+        self._alias_path = Path(alias_path) if alias_path else None
+        self._aliases: dict[str, str] = {}
+        if self._alias_path and self._alias_path.exists():
+            try:
+                aliases = json.loads(self._alias_path.read_text(encoding="utf-8"))
+            except (ValueError, OSError) as err:
+                aliases = None
+                log.warning("Файл псевдонимов не прочитан: %s: %s", self._alias_path, err)
+            if isinstance(aliases, dict):
+                self._aliases = {str(key): str(value) for key, value in aliases.items()}
+            else:
+                log.warning("Псевдонимы будут выучены заново: %s", self._alias_path)
+
+        self._keys: list[tuple[str, str]] = []  # (нормализованная форма, имя)
+        self._exact: dict[str, str] = {}
+        self._inverted: dict[str, list[int]] = {}
+        self._sizes: list[int] = []
+        for name, titles in names.items():
+            for variant in (name, name.replace("_", " "), *titles):
+                key = normalize(variant)
+                if not key:
+                    continue
+                self._exact.setdefault(key, name)
+                grams = _ngrams(key)
+                idx = len(self._keys)
+                self._keys.append((key, name))
+                self._sizes.append(len(grams))
+                for gram in grams:
+                    self._inverted.setdefault(gram, []).append(idx)
+        self.names = list(names)
+        self._known = frozenset(self.names)
+
+    def __len__(self: Self) -> int:  # noqa: D105
+        return len(self.names)
+
+    def match(self: Self, text: str, top: int = 3) -> list[Candidate]:
+        """Лучшие кандидаты для заголовка по убыванию оценки."""
+        key = normalize(text)
+        if not key:
+            return []
+
+        if key in self._aliases and self._aliases[key] in self._known:
+            return [Candidate(self._aliases[key], 1.0, "alias")]
+
+        if key in self._exact:
+            return [Candidate(self._exact[key], 1.0, "exact")]
+
+        grams = _ngrams(key)
+        shared = Counter(idx for gram in grams for idx in self._inverted.get(gram, ()))
+        best: dict[str, float] = {}
+        for idx, count in shared.items():
+            score = 2 * count / (len(grams) + self._sizes[idx])
+            name = self._keys[idx][1]
+            best[name] = max(best.get(name, 0.0), score)
+
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)[:top]
+        return [Candidate(name, round(score, 3), "ngram") for name, score in ranked]
+
+    def resolve(self: Self, text: str, min_score: float = 0.85, min_gap: float = 0.15) -> str | None:
+        """Имя для заголовка, если сопоставление однозначно, иначе None."""
+        candidates = self.match(text, top=2)
+        if not candidates or candidates[0].score < min_score:
+            return None
+
+        if len(candidates) > 1 and candidates[0].score - candidates[1].score < min_gap:
+            return None
+
+        return candidates[0].name
+
+    def learn(self: Self, text: str, name: str) -> None:
+        """Запомнить подтверждённое сопоставление заголовка и имени."""
+        key = normalize(text)
+        if not key or name not in self._known:
+            return None
+
+        with self._lock:
+            self._aliases[key] = name
+            if self._alias_path:
+                self._alias_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self._alias_path.with_suffix(".tmp")
+                tmp.write_text(json.dumps(self._aliases, ensure_ascii=False, indent=2), encoding="utf-8")
+                tmp.replace(self._alias_path)
+        log.debug("Выучен псевдоним: %s -> %s", text, name)
+        return None
+
+
+@dataclass(frozen=True)
+class ReferenceContext:
+    """Справочные данные DocAPI одной версии и индексы сопоставления по ним.
+
+    Собирается целиком и подменяется у агента одним присваиванием:
+    документ не получит новый список атрибутов вместе со старыми подсказками.
+    """  # noqa: RUF002
+
+    api_doc: str | None  # Документация OpenAPI для промта
+    attrs: str | None  # Список атрибутов, ответ DocAPI
+    doc_names: str | None  # Список видов данных, ответ DocAPI
+    attrs_index: MatchIndex
+    names_index: MatchIndex
+
+    @classmethod
+    def build(
+        cls: type[Self],
+        api_doc: str | None,
+        attrs: str | None,
+        doc_names: str | None,
+        alias_path: Path | str | None = None,
+    ) -> Self:
+        """Построить индексы по справочным данным."""
+        return cls(
+            api_doc=api_doc,
+            attrs=attrs,
+            doc_names=doc_names,
+            attrs_index=MatchIndex(parse_names(attrs), alias_path),
+            names_index=MatchIndex(parse_names(doc_names)),
+        )
+
+
+def mapping_hints(
+    index: MatchIndex,
+    texts: Iterable[str],
+    top: int = 3,
+    min_score: float = MIN_HINT_SCORE,
+) -> tuple[str, list[str]]:
+    """Подсказки сопоставления для промта.
+
+    Однозначные сопоставления выводятся как `заголовок -> имя`, остальные - списком кандидатов с оценками.
+    Кандидаты с оценкой ниже `min_score` не выводятся.
+
+    Returns:
+        tuple[str, list[str]]: Текст подсказок и имена всех кандидатов для сокращённого списка допустимых имён.
+            Список пуст, если хотя бы для одного заголовка кандидатов нет: тогда нужен полный список.
+    """  # noqa: RUF002
+    lines: list[str] = []
+    used: dict[str, None] = {}
+    complete = True
+    for text in dict.fromkeys(t.strip() for t in texts if t and t.strip()):
+        resolved = index.resolve(text)
+        if resolved:
+            lines.append(f"{text} -> {resolved}")
+            used[resolved] = None
+            continue
+
+        candidates = [c for c in index.match(text, top) if c.score >= min_score]
+        if not candidates:
+            complete = False
+            continue
+
+        lines.append(f"{text} -> " + ", ".join(f"{c.name} ({c.score:.2f})" for c in candidates))
+        used.update(dict.fromkeys(c.name for c in candidates))
+    return "\n".join(lines), list(used) if complete else []
+
+
+def written_names(data: Any) -> set[str]:  # noqa: ANN401
+    """Имена в теле запроса записи: ключи и строковые значения JSON на любой глубине."""
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            return {data}
+
+    if isinstance(data, dict):
+        return {str(key) for key in data} | {name for value in data.values() for name in written_names(value)}
+    if isinstance(data, list):
+        return {name for item in data for name in written_names(item)}
+    return {data} if isinstance(data, str) else set()
+
+
+def learn_confirmed(
+    index: MatchIndex,
+    texts: Iterable[str],
+    written: set[str],
+    top: int = 3,
+    min_score: float = MIN_LEARN_SCORE,
+) -> list[str]:
+    """Запомнить сопоставления, подтверждённые успешной записью.
+
+    Сопоставление заголовка подтверждено, если в записанные данные попал его лучший кандидат
+    с оценкой не ниже `min_score` и больше никто из его кандидатов. Имя, на которое претендуют
+    несколько заголовков, ничего не подтверждает: запись не говорит, какой из них ему соответствует.
+    Заголовки с точным совпадением или уже выученным псевдонимом пропускаются.
+
+    Returns:
+        list[str]: Заголовки, для которых выучен псевдоним.
+    """  # noqa: RUF002
+    claims: dict[str, list[str]] = {}
+    for text in dict.fromkeys(t.strip() for t in texts if t and t.strip()):
+        candidates = index.match(text, top)
+        if not candidates or candidates[0].source != "ngram":
+            continue
+
+        best = candidates[0]
+        if best.score < min_score or {c.name for c in candidates} & written != {best.name}:
+            continue
+        claims.setdefault(best.name, []).append(text)
+
+    learned = []
+    for name, claimed in claims.items():
+        if len(claimed) == 1:
+            index.learn(claimed[0], name)
+            learned.extend(claimed)
+    return learned
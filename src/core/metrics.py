@@ -0,0 +1,313 @@
+"""Метрики задержки и пропускной способности этапов обработки в формате OpenMetrics.
+
+Значения хранятся в памяти процесса: обновление метрики - захват блокировки и пара сложений,
+поэтому метрики включены всегда. Текст в формате OpenMetrics собирается только по запросу
+к локальному HTTP-серверу (`serve`).
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http import HTTPMethod, HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, ClassVar, Self
+from urllib.parse import urlsplit
+
+from src.core.logger import logger as log
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+PREFIX = "keyrates_"
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+# Границы корзин гистограмм, секунды: от разбора письма до обработки документа целиком
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+MAX_ENDPOINTS = 64  # Шаблонов путей в метках инструментов: число рядов метрик ограничено при любых адресах
+OTHER_ENDPOINT = "other"  # Метка путей, которых нет среди известных операций
+
+type LabelValues = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Метрика с набором меток."""  # noqa: RUF002
+
+    type_: ClassVar[str]
+
+    def __init__(self: Self, name: str, help_: str, labels: tuple[str, ...] = ()) -> None:
+        """Метрика.
+
+        Args:
+            name (str): Имя без префикса сервиса.
+            help_ (str): Описание.
+            labels (tuple[str, ...]): Имена меток.
+        """
+        self.name = PREFIX + name
+        self.help = help_
+        self.labelnames = labels
+        self._lock = threading.Lock()
+
+    def _key(self: Self, labels: dict[str, object]) -> LabelValues:
+        if labels.keys() != set(self.labelnames):
+            msg = f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            raise ValueError(msg)
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self: Self) -> list[str]:
+        """Строки OpenMetrics: описание и значения."""
+        return [f"# TYPE {self.name} {self.type_}", f"# HELP {self.name} {_escape(self.help)}", *self._samples()]
+
+    def _samples(self: Self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Счётчик событий."""
+
+    type_ = "counter"
+
+    def __init__(self: Self, name: str, help_: str, labels: tuple[str, ...] = ()) -> None:  # noqa: D107
+        super().__init__(name, help_, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self: Self, amount: float = 1.0, **labels: object) -> None:
+        """Увеличить счётчик."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self: Self, **labels: object) -> float:
+        """Текущее значение."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self: Self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}_total{_labels(self.labelnames, key)} {value:g}" for key, value in values]
+
+
+class Gauge(Metric):
+    """Текущее значение, например глубина очереди."""
+
+    type_ = "gauge"
+
+    def __init__(self: Self, name: str, help_: str, labels: tuple[str, ...] = ()) -> None:  # noqa: D107
+        super().__init__(name, help_, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def set(self: Self, value: float, **labels: object) -> None:
+        """Установить значение."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self: Self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {value:g}" for key, value in values]
+
+
+class Histogram(Metric):
+    """Распределение значений по корзинам."""
+
+    type_ = "histogram"
+
+    def __init__(  # noqa: D107
+        self: Self,
+        name: str,
+        help_: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = BUCKETS,
+    ) -> None:
+        super().__init__(name, help_, labels)
+        self.buckets = buckets
+        # Для каждого набора меток: количество наблюдений в каждой корзине (последняя - +Inf) и сумма
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self: Self, value: float, **labels: object) -> None:
+        """Учесть наблюдение."""
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self: Self, **labels: object) -> Iterator[None]:
+        """Измерить длительность блока, в том числе завершившегося ошибкой."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self: Self, **labels: object) -> int:
+        """Количество наблюдений."""
+        with self._lock:
+            return sum(self._counts.get(self._key(labels), ()))
+
+    def _samples(self: Self) -> list[str]:
+        with self._lock:
+            series = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts, strict=True):
+                cumulative += count
+                le = bound if isinstance(bound, str) else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, f'le="{le}"')} {cumulative}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total:g}")
+        return lines
+
+
+class Registry:
+    """Набор метрик сервиса."""  # noqa: RUF002
+
+    def __init__(self: Self) -> None:  # noqa: D107
+        self._metrics: list[Metric] = []
+
+    def counter(self: Self, name: str, help_: str, labels: tuple[str, ...] = ()) -> Counter:
+        """Создать счётчик."""
+        return self._add(Counter(name, help_, labels))
+
+    def gauge(self: Self, name: str, help_: str, labels: tuple[str, ...] = ()) -> Gauge:
+        """Создать показатель текущего значения."""
+        return self._add(Gauge(name, help_, labels))
+
+    def histogram(
+        self: Self,
+        name: str,
+        help_: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = BUCKETS,
+    ) -> Histogram:
+        """Создать гистограмму, по умолчанию - длительностей в секундах."""
+        return self._add(Histogram(name, help_, labels, buckets))
+
+    def render(self: Self) -> str:
+        """Все метрики в формате OpenMetrics."""  # noqa: RUF002
+        lines = [line for metric in self._metrics for line in metric.render()]
+        return "\n".join([*lines, "# EOF"]) + "\n"
+
+    def _add[M: Metric](self: Self, metric: M) -> M:
+        self._metrics.append(metric)
+        return metric
+
+
+registry = Registry()
+
+IMAP_SECONDS = registry.histogram("imap_seconds", "IMAP operations: connect, search, fetch", ("operation",))
+MIME_SECONDS = registry.histogram("mime_parse_seconds", "Parsing of a fetched email")
+PDF_SECONDS = registry.histogram("pdf_extract_seconds", "PDF extraction")
+PDF_PAGES = registry.counter("pdf_pages", "Extracted PDF pages")
+STAGE_SECONDS = registry.histogram(
+    "stage_seconds",
+    "Model stages with time limits: upload, step, delete",
+    ("stage", "outcome"),
+)
+TOOL_SECONDS = registry.histogram("tool_seconds", "HTTP tool calls", ("endpoint",))
+TOOL_CALLS = registry.counter("tool_calls", "HTTP tool calls by endpoint and status", ("endpoint", "status"))
+DOCUMENT_SECONDS = registry.histogram("document_seconds", "Document processing from upload to cleanup", ("outcome",))
+QUEUE_DEPTH = registry.gauge("pipeline_queue_depth", "Jobs waiting before a pipeline stage", ("stage",))
+
+
+_ID_RE = re.compile(r"/(?:\d+|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(?=/|$)", re.IGNORECASE)
+_PARAM_RE = re.compile(r"\\\{[^/]*?\\\}")  # Параметр пути `{name}` после `re.escape`
+_endpoints: tuple[tuple[str, re.Pattern[str]], ...] = ()
+_endpoints_lock = threading.Lock()
+
+
+def register_endpoints(paths: Iterable[str]) -> None:
+    """Добавить шаблоны путей API, например `/rates/{id}`, по которым строятся метки инструментов.
+
+    Путь адреса может начинаться с базового пути сервера: `/api/v1/rates/42` совпадает с `/rates/{id}`.
+    """  # noqa: RUF002
+    global _endpoints  # noqa: PLW0603
+    with _endpoints_lock:
+        known = dict(_endpoints)
+        for path in paths:
+            template = "/" + path.strip("/")
+            if template in known or len(known) >= MAX_ENDPOINTS:
+                continue
+            known[template] = re.compile(_PARAM_RE.sub("[^/]+", re.escape(template)) + "$")
+        # Сначала более конкретные шаблоны: `/rates/latest` раньше `/rates/{id}`
+        _endpoints = tuple(sorted(known.items(), key=lambda item: (-item[0].count("/"), item[0].count("{"))))
+
+
+def endpoint(method: str, url: str) -> str:
+    """Метка адреса инструмента: метод и шаблон пути известной операции, иначе `other`.
+
+    Идентификаторы в пути (числа и UUID) заменяются на `{id}`, запрос отбрасывается.
+    """
+    method = str(method).upper()
+    if method not in HTTPMethod.__members__:
+        method = OTHER_ENDPOINT.upper()
+    path = _ID_RE.sub("/{id}", urlsplit(url).path).rstrip("/") or "/"
+    for template, pattern in _endpoints:
+        if pattern.search(path):
+            return f"{method} {template}"
+    return f"{method} {OTHER_ENDPOINT}"
+
+
+# Документация API запрашивается раньше, чем становятся известны её операции
+register_endpoints(["/openapi.json"])
+
+
+def observe_tool(method: str, url: str, status: int | str, started: float) -> None:
+    """Учесть вызов HTTP-инструмента.
+
+    Args:
+        method (str): Метод запроса.
+        url (str): Адрес запроса.
+        status (int | str): Код ответа, `ledger` - ответ из журнала без запроса, иначе имя ошибки.
+        started (float): Начало вызова по `time.perf_counter`.
+    """
+    label = endpoint(method, url)
+    TOOL_CALLS.inc(endpoint=label, status=status)
+    TOOL_SECONDS.observe(time.perf_counter() - started, endpoint=label)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self: Self) -> None:  # noqa: N802
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        body = registry.render().encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self: Self, format: str, *args: object) -> None:  # noqa: A002
+        log.debug("metrics: " + format, *args)
+
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Отдавать метрики по адресу `http://host:port/metrics` в фоновом потоке."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log.info("Метрики: http://%s:%d/metrics", *server.server_address[:2])
+    return server
@@ -0,0 +1,217 @@
+"""Сокращение документации OpenAPI до операций, нужных для задачи."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Self
+
+from src.core.logger import logger as log
+from src.core.matching import transliterate
+from src.core.metrics import register_endpoints
+
+KEY_RATES_TASK = (
+    "upload post key rates documents data, get attrs attributes, known names of documents, "
+    "find uploaded docs by name and date"
+)
+HTTP_METHODS = ("get", "post", "put", "patch", "delete")
+MAX_DEPTH = 6  # Глубина раскрытия вложенных схем
+MAX_OPERATIONS = 8  # Сколько операций выводить по умолчанию
+CACHE_SIZE = 8  # Сколько разобранных документов держать в памяти
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STEM = 4  # Слова сравниваются по первым буквам, чтобы "upload" совпадало с "uploads"  # noqa: RUF003
+_STOP_WORDS = frozenset({"api", "v1", "v2", "v3", "get", "post", "put", "patch", "delete", "by", "of", "and", "the"})
+
+
+def _stems(text: str) -> set[str]:
+    return {word[:_STEM] for word in _WORD_RE.findall(transliterate(text)) if len(word) > 1 and word not in _STOP_WORDS}
+
+
+@dataclass
+class Operation:
+    """Операция API с раскрытыми ссылками."""  # noqa: RUF002
+
+    method: str
+    path: str
+    summary: str
+    parameters: list[dict[str, Any]]
+    body: dict[str, Any] | None  # Схема тела запроса
+    example: Any  # Пример тела запроса
+    stems: set[str]  # Основы слов для поиска
+
+    def render(self: Self) -> str:
+        """Компактное текстовое представление операции."""
+        lines = [f"{self.method.upper()} {self.path}" + (f" - {self.summary}" if self.summary else "")]
+        params = [
+            f"{p.get('name')}{'*' if p.get('required') else ''} ({p.get('in')}, {_render(p.get('schema', {}))})"
+            for p in self.parameters
+        ]
+        if params:
+            lines.append(f"  params: {', '.join(params)}")
+        if self.body:
+            lines.append(f"  body: {_render(self.body)}")
+        if self.example is not None:
+            lines.append(f"  example: {json.dumps(self.example, ensure_ascii=False, separators=(',', ':'))}")
+        return "\n".join(lines)
+
+
+def _render(schema: dict[str, Any], depth: int = 0) -> str:  # noqa: PLR0911
+    """Схема в виде `{name*: string, items: [object]}`, `*` - обязательное поле."""
+    if depth > MAX_DEPTH or not isinstance(schema, dict):
+        return "any"
+
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            variants = [_render(s, depth + 1) for s in schema[key] if s.get("type") != "null"]
+            return " | ".join(variants) or "null"
+
+    if "allOf" in schema:
+        merged: dict[str, Any] = {"type": "object", "properties": {}, "required": []}
+        for part in schema["allOf"]:
+            merged["properties"].update(part.get("properties", {}))
+            merged["required"].extend(part.get("required", []))
+        return _render(merged, depth)
+
+    if "enum" in schema:
+        return "|".join(json.dumps(v, ensure_ascii=False) for v in schema["enum"])
+
+    schema_type = schema.get("type")
+    if schema_type == "array":
+        return f"[{_render(schema.get('items', {}), depth + 1)}]"
+
+    if schema_type == "object" or "properties" in schema:
+        required = set(schema.get("required", []))
+        props = [
+            f"{name}{'*' if name in required else ''}: {_render(prop, depth + 1)}"
+            for name, prop in schema.get("properties", {}).items()
+        ]
+        if not props and isinstance(schema.get("additionalProperties"), dict):
+            return f"{{str: {_render(schema['additionalProperties'], depth + 1)}}}"
+        return f"{{{', '.join(props)}}}" if props else "object"
+
+    fmt = schema.get("format")
+    return f"{schema_type or 'any'}({fmt})" if fmt else str(schema_type or "any")
+
+
+class OpenAPIIndex:
+    """Разобранная документация OpenAPI: операции с раскрытыми `$ref` и поиск по задаче."""  # noqa: RUF002
+
+    def __init__(self: Self, spec: dict[str, Any]) -> None:  # noqa: D107
+        self._spec = spec
+        self.operations: list[Operation] = []
+        for path, item in spec.get("paths", {}).items():
+            shared_params = item.get("parameters", [])
+            for method in HTTP_METHODS:
+                if method not in item:
+                    continue
+                op = self._resolve(item[method])
+                body, example = self._body(op)
+                text = " ".join(
+                    [
+                        path,
+                        op.get("summary", ""),
+                        op.get("description", ""),
+                        op.get("operationId", ""),
+                        *op.get("tags", []),
+                    ],
+                )
+                self.operations.append(
+                    Operation(
+                        method=method,
+                        path=path,
+                        summary=op.get("summary") or op.get("operationId") or "",
+                        parameters=[self._resolve(p) for p in [*shared_params, *op.get("parameters", [])]],
+                        body=body,
+                        example=example,
+                        stems=_stems(text),
+                    ),
+                )
+
+    def _resolve(self: Self, node: Any, seen: frozenset[str] = frozenset()) -> Any:  # noqa: ANN401
+        """Рекурсивно подставить `$ref`, циклические ссылки заменяются на `object`."""
+        if isinstance(node, list):
+            return [self._resolve(item, seen) for item in node]
+
+        if not isinstance(node, dict):
+            return node
+
+        ref = node.get("$ref")
+        if isinstance(ref, str):
+            if ref in seen or not ref.startswith("#/"):
+                return {"type": "object"}
+            target: Any = self._spec
+            for part in ref[2:].split("/"):
+                target = target.get(part.replace("~1", "/").replace("~0", "~"), {})
+            return self._resolve(target, seen | {ref})
+
+        return {key: self._resolve(value, seen) for key, value in node.items()}
+
+    @staticmethod
+    def _body(op: dict[str, Any]) -> tuple[dict[str, Any] | None, Any]:
+        content = op.get("requestBody", {}).get("content", {})
+        media = content.get("application/json") or next(iter(content.values()), None)
+        if not media:
+            return None, None
+
+        schema = media.get("schema")
+        example = media.get("example")
+        if example is None and media.get("examples"):
+            example = next(iter(media["examples"].values())).get("value")
+        if example is None and isinstance(schema, dict):
+            example = schema.get("example")
+        return schema, example
+
+    def select(self: Self, task: str, limit: int = MAX_OPERATIONS) -> list[Operation]:
+        """Операции, наиболее подходящие под описание задачи, в порядке документации."""
+        task_stems = _stems(task)
+        scored = [(len(task_stems & op.stems), i) for i, op in enumerate(self.operations)]
+        relevant = sorted((item for item in scored if item[0]), reverse=True)[:limit]
+        if not relevant:
+            return self.operations[:limit]
+        return [self.operations[i] for i in sorted(i for _, i in relevant)]
+
+    def render(self: Self, task: str, limit: int = MAX_OPERATIONS) -> str:
+        """Компактное описание операций, нужных для задачи."""
+        return "\n".join(op.render() for op in self.select(task, limit))
+
+
+_cache: dict[str, OpenAPIIndex] = {}
+_cache_lock = threading.Lock()
+
+
+def get_index(text: str) -> OpenAPIIndex:
+    """Разобранная документация из кэша по хешу текста документа."""
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    with _cache_lock:
+        index = _cache.get(digest)
+        if index is None:
+            index = OpenAPIIndex(json.loads(text))
+            if len(_cache) >= CACHE_SIZE:
+                _cache.pop(next(iter(_cache)))
+            _cache[digest] = index
+    return index
+
+
+def openapi_slice(text: str | None, task: str = KEY_RATES_TASK, limit: int = MAX_OPERATIONS) -> str | None:
+    """Сократить документацию OpenAPI до операций, нужных для задачи.
+
+    Пути выбранных операций становятся метками метрик инструментов.
+    Если документ не удаётся разобрать, возвращается исходный текст.
+    """
+    if not text:
+        return text
+
+    try:
+        operations = get_index(text).select(task, limit)
+    except (ValueError, AttributeError, TypeError) as e:
+        log.warning("Не удалось разобрать OpenAPI: %s", e)
+        return text
+
+    register_endpoints(op.path for op in operations)
+    result = "\n".join(op.render() for op in operations)
+
+    log.debug("OpenAPI сокращён: %d -> %d символов", len(text), len(result))
+    return result
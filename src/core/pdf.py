@@ -0,0 +1,327 @@
+"""Извлечение текста и таблиц из PDF."""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from itertools import repeat
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Self, TypedDict
+
+from src.core.logger import logger as log
+from src.core.metrics import PDF_PAGES, PDF_SECONDS
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+    from typing import BinaryIO
+
+    import pdfplumber
+    from pdfplumber.page import Page
+
+    type PDFSource = Path | str | bytes | bytearray | memoryview | BinaryIO
+
+
+@dataclass
+class ExtractionSettings:
+    """Настройки извлечения данных из PDF."""
+
+    workers: int = 1  # Количество процессов для разбора страниц, 1 - без параллельности
+    min_pages_per_worker: int = 8  # Меньше страниц на процесс не даёт выигрыша из-за накладных расходов
+    prefilter: bool = False  # Искать таблицы только на страницах, где может быть таблица; текст разбирается всегда
+    # Ищутся в символах страницы; общие слова вроде "%" и "rate" есть почти на любой финансовой странице
+    prefilter_keywords: tuple[str, ...] = ("ключев", "ставк", "key rate", "interest rate", "tenor")
+    prefilter_min_rulings: int = 4  # Сколько линий и прямоугольников достаточно для сетки таблицы
+    prefilter_head_pages: int = 1  # Таблицы всегда ищутся на первых страницах: там заголовок и дата документа
+    cache_size: int = 8  # Разобранных документов в памяти: классификатор и агент читают один и тот же файл
+
+
+settings = ExtractionSettings()
+
+
+class TableData(TypedDict):
+    """Таблица со страницы PDF."""  # noqa: RUF002
+
+    table_id: int  # Номер таблицы на странице
+    columns: list[str]  # Уникальные заголовки столбцов
+    data: list[dict[str, str | None]]  # Строки таблицы: заголовок -> значение ячейки
+
+
+class PageData(TypedDict):
+    """Данные страницы PDF."""
+
+    page_number: int  # Номер страницы, начиная с 1  # noqa: RUF003
+    text: str  # Текст страницы
+    tables: list[TableData]  # Таблицы страницы
+    images: int  # Количество изображений
+
+
+class ExtractionStats(TypedDict):
+    """Статистика предварительного отбора страниц."""
+
+    total_pages: int  # Количество страниц в документе
+    table_pages: int  # Страниц, на которых искались таблицы
+    skipped_pages: list[int]  # Номера страниц, на которых таблицы не искались
+
+
+@dataclass
+class Extraction:
+    """Результат извлечения данных из PDF."""
+
+    pages: list[PageData]  # Разобранные страницы в исходном порядке
+    metadata: dict[str, Any]  # Метаданные документа
+    total_pages: int  # Количество страниц в документе
+    skipped_pages: list[int] = field(default_factory=list)  # Страницы, на которых таблицы не искались
+
+    @property
+    def stats(self: Self) -> ExtractionStats:
+        """Статистика отбора страниц."""
+        return ExtractionStats(
+            total_pages=self.total_pages,
+            table_pages=self.total_pages - len(self.skipped_pages),
+            skipped_pages=self.skipped_pages,
+        )
+
+
+def _open_pdf(source: PDFSource) -> pdfplumber.PDF:
+    """Открыть PDF из файла, байтов или буфера без записи на диск."""
+    # Тяжёлый импорт выполняется только при первом разборе PDF
+    import pdfplumber  # noqa: PLC0415
+
+    if isinstance(source, bytes | bytearray | memoryview):
+        return pdfplumber.open(BytesIO(source))
+    return pdfplumber.open(source)
+
+
+def _unique_columns(header: list[str | None]) -> list[str]:
+    """Уникальные имена столбцов: пустые заголовки (объединённые ячейки) и повторы получают номер."""
+    columns: list[str] = []
+    seen: set[str] = set()
+    for i, cell in enumerate(header, start=1):
+        name = cell.strip() if cell and cell.strip() else f"col_{i}"
+        candidate, n = name, 1
+        while candidate in seen:
+            n += 1
+            candidate = f"{name}_{n}"
+        seen.add(candidate)
+        columns.append(candidate)
+    return columns
+
+
+def _table_to_records(table_id: int, table: list[list[str | None]]) -> TableData:
+    """Преобразовать строки pdfplumber в записи: первая строка - заголовок."""
+    columns = _unique_columns(table[0])
+    return TableData(
+        table_id=table_id,
+        columns=columns,
+        data=[dict(zip(columns, row, strict=False)) for row in table[1:]],
+    )
+
+
+def extract_page(page: Page, *, find_tables: bool = True) -> PageData:
+    """Извлечь текст и таблицы одной страницы, `find_tables=False` - только текст."""
+    tables = (
+        [_table_to_records(j, table) for j, table in enumerate(page.extract_tables(), start=1) if table]
+        if find_tables
+        else []
+    )
+    return PageData(
+        page_number=page.page_number,
+        text=page.extract_text(),
+        tables=tables,
+        images=len(page.images),
+    )
+
+
+def is_table_candidate(page: Page, options: ExtractionSettings | None = None) -> bool:
+    """Быстро проверить, может ли на странице быть нужная таблица.
+
+    Используются дешёвые признаки: положение страницы в документе, количество линий и прямоугольников
+    и ключевые слова в символах страницы. Разбор текста и поиск таблиц при этом не выполняются.
+    """
+    options = options or settings
+    if page.page_number <= options.prefilter_head_pages:
+        return True
+
+    if len(page.lines) + len(page.rects) >= options.prefilter_min_rulings:
+        return True
+
+    raw_text = "".join(char["text"] for char in page.chars).lower()
+    return any(keyword in raw_text for keyword in options.prefilter_keywords)
+
+
+def _iter_pages(
+    pdf: pdfplumber.PDF,
+    options: ExtractionSettings,
+    start: int = 0,
+    stop: int | None = None,
+) -> Iterator[tuple[PageData, bool]]:
+    """Разобрать страницы; второй элемент - искались ли на странице таблицы."""
+    for page in pdf.pages[start:stop]:
+        find_tables = not options.prefilter or is_table_candidate(page, options)
+        yield extract_page(page, find_tables=find_tables), find_tables
+        page.close()
+
+
+def _collect(pages: Iterable[tuple[PageData, bool]]) -> tuple[list[PageData], list[int]]:
+    """Разделить разобранные страницы и номера страниц, на которых таблицы не искались."""
+    collected, skipped = [], []
+    for page_data, find_tables in pages:
+        collected.append(page_data)
+        if not find_tables:
+            skipped.append(page_data["page_number"])
+    return collected, skipped
+
+
+def iter_pdf_pages(source: PDFSource) -> Iterator[PageData]:
+    """Постранично извлекать данные из PDF.
+
+    Страница освобождается сразу после разбора, поэтому в памяти держится только текущая.
+    При включённом `settings.prefilter` на страницах без признаков таблицы разбирается только текст.
+
+    Args:
+        source (PDFSource): Путь к файлу, содержимое файла (`bytes`, `memoryview`) или открытый бинарный буфер.
+
+    Yields:
+        PageData: Данные очередной страницы.
+    """
+    with _open_pdf(source) as pdf:
+        for page_data, _ in _iter_pages(pdf, settings):
+            yield page_data
+
+
+def _extract_range(
+    source: Path | str | bytes,
+    options: ExtractionSettings,
+    start: int,
+    stop: int,
+) -> list[tuple[PageData, bool]]:
+    """Разобрать страницы `[start, stop)` в отдельном процессе."""
+    with _open_pdf(source) as pdf:
+        return list(_iter_pages(pdf, options, start, stop))
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Общий пул процессов, пересоздаётся при изменении количества процессов."""
+    global _pool, _pool_workers  # noqa: PLW0603
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # fork копирует блокировки потоков сервиса (журнал, SQLite) в занятом состоянии
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+            _pool_workers = workers
+        return _pool
+
+
+@atexit.register
+def shutdown_pool() -> None:
+    """Остановить пул процессов извлечения."""
+    global _pool  # noqa: PLW0603
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+def extract_pages(source: PDFSource, workers: int | None = None) -> Extraction:
+    """Извлечь все страницы PDF, при необходимости параллельно в нескольких процессах.
+
+    Документ делится на непрерывные диапазоны страниц, диапазоны разбираются в пуле процессов
+    и собираются обратно в исходном порядке. Если страниц мало для выбранного числа процессов,
+    разбор идёт последовательно в текущем процессе.
+    При включённом `settings.prefilter` таблицы ищутся только на страницах-кандидатах (см. `is_table_candidate`),
+    текст разбирается на всех страницах.
+
+    Args:
+        source (PDFSource): Путь к файлу, содержимое файла (`bytes`, `memoryview`) или открытый бинарный буфер.
+        workers (int | None): Количество процессов, по умолчанию `settings.workers`.
+
+    Returns:
+        Extraction: Разобранные страницы, метаданные и количество страниц документа.
+    """
+    workers = settings.workers if workers is None else workers
+    if isinstance(source, bytes | bytearray | memoryview):
+        source = bytes(source)
+    elif not isinstance(source, Path | str):
+        source = source.read()
+
+    with _open_pdf(source) as pdf:
+        metadata = pdf.metadata
+        total = len(pdf.pages)
+        workers = min(workers, total // max(settings.min_pages_per_worker, 1))
+        if workers <= 1:
+            pages, skipped = _collect(_iter_pages(pdf, settings))
+            return Extraction(pages=pages, metadata=metadata, total_pages=total, skipped_pages=skipped)
+
+    step = -(-total // workers)
+    starts = range(0, total, step)
+    stops = [min(start + step, total) for start in starts]
+    log.debug("Параллельный разбор PDF: %d страниц, %d процессов", total, len(stops))
+    chunks = _get_pool(workers).map(_extract_range, repeat(source, len(stops)), repeat(settings), starts, stops)
+    pages, skipped = _collect(page for chunk in chunks for page in chunk)
+    return Extraction(pages=pages, metadata=metadata, total_pages=total, skipped_pages=skipped)
+
+
+_cache: OrderedDict[tuple[str, str], dict[str, Any]] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_key(source: PDFSource) -> tuple[str, str] | None:
+    """Ключ кэша: хэш содержимого и настройки разбора; файлы и буферы не кэшируются."""
+    if not settings.cache_size or not isinstance(source, bytes | bytearray | memoryview):
+        return None
+    return hashlib.sha256(source).hexdigest(), repr(settings)
+
+
+def pdf_to_dict(source: PDFSource, workers: int | None = None) -> dict[str, Any]:
+    """Извлечение структурированных данных из PDF.
+
+    Обёртка над `extract_pages`: собирает все страницы, список всех таблиц, метаданные документа
+    и статистику отбора страниц (`stats`).
+    Таблицы в `tables` - те же объекты, что и в `pages`, без копирования.
+    Большие документы разбираются параллельно.
+    Результат для содержимого в памяти кэшируется по хэшу: повторный вызов для того же файла
+    (классификатор, затем агент) возвращает тот же объект, поэтому изменять его нельзя.
+
+    Args:
+        source (PDFSource): Путь к файлу, содержимое файла (`bytes`, `memoryview`) или открытый бинарный буфер.
+        workers (int | None): Количество процессов, по умолчанию `settings.workers`.
+    """  # noqa: RUF002
+    key = _cache_key(source)
+    if key is not None:
+        with _cache_lock:
+            cached = _cache.get(key)
+            if cached is not None:
+                _cache.move_to_end(key)
+                return cached
+
+    with PDF_SECONDS.time():
+        extraction = extract_pages(source, workers)
+    PDF_PAGES.inc(extraction.total_pages)
+    stats = extraction.stats
+    if stats["skipped_pages"]:
+        log.debug("Таблицы не искались на %d страницах из %d", len(stats["skipped_pages"]), stats["total_pages"])
+
+    result = {
+        "pages": extraction.pages,
+        "tables": [table for page_data in extraction.pages for table in page_data["tables"]],
+        "metadata": extraction.metadata,
+        "stats": stats,
+    }
+    if key is not None:
+        with _cache_lock:
+            _cache[key] = result
+            while len(_cache) > settings.cache_size:
+                _cache.popitem(last=False)
+    return result
@@ -0,0 +1,136 @@
+"""Компактное представление данных из PDF для промтов."""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+import re
+from dataclasses import dataclass, field
+from math import ceil
+from typing import TYPE_CHECKING, Any, Literal
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from src.core.pdf import PageData, TableData
+
+CHARS_PER_TOKEN = 4  # Грубая оценка длины токена для оценки размера промта
+MAX_TITLE_LENGTH = 120  # Более длинные строки считаются обычным текстом, а не названием таблицы  # noqa: RUF003
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+
+type TableFormat = Literal["tsv", "csv", "json"]
+
+
+@dataclass
+class PromptData:
+    """Данные документа, подготовленные для промта."""
+
+    text: str  # Текст для передачи модели
+    tokens: int  # Оценка количества токенов
+    tables: int  # Количество таблиц
+    dropped_lines: int  # Количество строк текста, убранных как дубликаты
+    headers: list[str] = field(default_factory=list)  # Заголовки столбцов всех таблиц
+    titles: list[str] = field(default_factory=list)  # Названия таблиц: строки текста на их страницах
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценить количество токенов в тексте без обращения к токенизатору модели."""
+    return sum(ceil(len(word) / CHARS_PER_TOKEN) for word in _WORD_RE.findall(text))
+
+
+def _clean(cell: str | None) -> str:
+    return _SPACE_RE.sub(" ", cell).strip() if cell else ""
+
+
+def _table_rows(table: TableData) -> list[list[str]]:
+    """Строки таблицы без пустых строк, пустых столбцов и пустых ячеек в конце строк.
+
+    Столбец без значений не выводится, даже если у него есть заголовок: у пустых
+    и повторяющихся заголовков он сгенерирован при разборе PDF.
+    """  # noqa: RUF002
+    rows = [[_clean(c) for c in table["columns"]]]
+    rows.extend([_clean(record.get(c)) for c in table["columns"]] for record in table["data"])
+    values = rows[1:] or rows
+    keep = [i for i in range(len(rows[0])) if any(row[i] for row in values)]
+    result = []
+    for row in rows:
+        cells = [row[i] for i in keep]
+        while cells and not cells[-1]:
+            cells.pop()
+        if cells:
+            result.append(cells)
+    return result
+
+
+def _format_rows(rows: list[list[str]], fmt: TableFormat) -> str:
+    if fmt == "json":
+        header, body = (rows[0], rows[1:]) if rows else ([], [])
+        return json.dumps({"columns": header, "rows": body}, ensure_ascii=False, separators=(",", ":"))
+
+    if fmt == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        return buffer.getvalue().rstrip("\n")
+
+    return "\n".join("\t".join(row) for row in rows)
+
+
+def format_table(table: TableData, fmt: TableFormat = "tsv") -> str:
+    """Представить таблицу один раз: заголовок и строки, числа - ровно как в документе."""
+    return _format_rows(_table_rows(table), fmt)
+
+
+def pdf_to_prompt(data: dict[str, Any] | Iterable[PageData], fmt: TableFormat = "tsv") -> PromptData:
+    """Преобразовать результат `pdf_to_dict` (или страницы из `iter_pdf_pages`) в компактный текст.
+
+    Каждая таблица выводится один раз, метаданные не выводятся.
+    Строки текста, целиком состоящие из содержимого таблиц страницы,
+    и строки, уже встречавшиеся на предыдущих страницах (колонтитулы), убираются.
+
+    Args:
+        data (dict[str, Any] | Iterable[PageData]): Результат `pdf_to_dict` или страницы документа.
+        fmt (TableFormat): Формат таблиц: `tsv`, `csv` или `json` (заголовок и массив строк).
+    """
+    pages: Iterable[PageData] = data["pages"] if isinstance(data, dict) else data
+    parts: list[str] = []
+    seen_lines: set[str] = set()
+    tables = dropped = 0
+    headers: dict[str, None] = {}
+    titles: dict[str, None] = {}
+    for page in pages:
+        page_tables = [(table["table_id"], _table_rows(table)) for table in page["tables"]]
+        cells = {word for _, rows in page_tables for row in rows for cell in row for word in cell.split()}
+        lines = []
+        for raw_line in (page["text"] or "").splitlines():
+            line = _clean(raw_line)
+            if not line:
+                continue
+            if line in seen_lines or (cells and all(word in cells for word in line.split())):
+                dropped += 1
+                continue
+            seen_lines.add(line)
+            lines.append(line)
+
+        if not lines and not page["tables"]:
+            continue
+
+        parts.append(f"## Страница {page['page_number']}")
+        parts.extend(lines)
+        if page_tables:
+            titles.update(dict.fromkeys(line for line in lines if len(line) <= MAX_TITLE_LENGTH))
+        for table_id, rows in page_tables:
+            tables += 1
+            headers.update(dict.fromkeys(cell for cell in rows[0] if cell) if rows else {})
+            parts.extend((f"### Таблица {table_id}", _format_rows(rows, fmt)))
+
+    text = "\n".join(parts)
+    return PromptData(
+        text=text,
+        tokens=estimate_tokens(text),
+        tables=tables,
+        dropped_lines=dropped,
+        headers=list(headers),
+        titles=list(titles),
+    )
@@ -0,0 +1,177 @@
+"""Описание инструментов для моделей, не зависящее от провайдера.
+
+Функция или pydantic-модель разбирается один раз, результат кэшируется по самому объекту.
+Узлы схемы неизменяемые: кэшированный узел общий для всех функций, где встречается тип.
+Провайдеры (`func_to_gemi`, `func_to_giga`) только переводят готовое описание в свои классы.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field, replace
+from enum import Enum
+from functools import cache
+from types import MappingProxyType, NoneType, UnionType
+from typing import TYPE_CHECKING, Annotated, Any, Self, get_args, get_origin, get_type_hints
+
+from pydantic import BaseModel
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Mapping
+
+    from pydantic.fields import FieldInfo
+
+TYPES_MAP = {
+    NoneType: "null",
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    list: "array",
+    dict: "object",
+}
+
+
+@dataclass(frozen=True, eq=False)
+class SchemaNode:
+    """Узел схемы параметра.
+
+    Узлы и их коллекции неизменяемые, узлы сравниваются по идентичности,
+    поэтому их можно использовать как ключи кэша провайдеров.
+    """
+
+    type: str  # Тип в терминах JSON Schema
+    description: str | None = None
+    enum: tuple[Any, ...] | None = None
+    items: SchemaNode | None = None  # Схема элементов массива
+    properties: Mapping[str, SchemaNode] | None = None  # Поля объекта, только для чтения
+    required: tuple[str, ...] | None = None  # Обязательные поля объекта
+    ref: str | None = None  # Имя общего определения для pydantic-модели
+
+    def described(self: Self, description: str | None) -> SchemaNode:
+        """Тот же узел с другим описанием."""  # noqa: RUF002
+        return self if description == self.description else replace(self, description=description)
+
+
+@dataclass(frozen=True, eq=False)
+class ToolSchema:
+    """Описание функции-инструмента."""
+
+    name: str
+    description: str
+    parameters: SchemaNode  # Объект параметров функции
+    defs: Mapping[str, SchemaNode] = field(default_factory=dict)  # Общие определения вложенных моделей
+    uses: Mapping[str, int] = field(default_factory=dict)  # Сколько раз модель встречается в параметрах
+
+
+@cache
+def compile_model(model: type[BaseModel]) -> SchemaNode:
+    """Схема pydantic-модели, строится один раз на модель."""
+    properties = {}
+    required = []
+    for field_name, model_field in model.model_fields.items():
+        properties[field_name] = compile_type(model_field.annotation).described(model_field.description)  # type: ignore[arg-type]
+        if model_field.is_required():
+            required.append(field_name)
+    return SchemaNode(
+        type="object",
+        properties=MappingProxyType(properties),
+        required=tuple(required),
+        ref=model.__name__,
+    )
+
+
+@cache
+def compile_type(py_type: type | UnionType) -> SchemaNode:
+    """Схема типа Python, включая вложенные типы. Результат кэшируется по типу."""
+    origin_type = get_origin(py_type) or py_type
+    args_type = get_args(py_type)
+
+    # Поддерживается только Optional, сложные объединения лучше не использовать в сигнатурах инструментов
+    if origin_type is UnionType:
+        if len(args_type) == 2 and NoneType in args_type:  # noqa: PLR2004
+            return compile_type(next(t for t in args_type if t is not NoneType))
+        msg = f"Only Union with None is supported in schema generation. Got: {py_type}"
+        raise ValueError(msg)
+
+    if isinstance(origin_type, type) and issubclass(origin_type, Enum):
+        return SchemaNode(type="string", enum=tuple(e.value for e in origin_type))
+
+    if origin_type is list:
+        if not args_type:
+            msg = f"List type must specify item type (e.g., list[str]). Got: {py_type}"
+            raise ValueError(msg)
+        return SchemaNode(type="array", items=compile_type(args_type[0]))
+
+    if isinstance(origin_type, type) and issubclass(origin_type, BaseModel):
+        return compile_model(origin_type)
+
+    if origin_type in TYPES_MAP:
+        return SchemaNode(type=TYPES_MAP[origin_type])  # type: ignore[index]
+
+    msg = f"Unsupported type '{py_type}'"
+    raise ValueError(msg)
+
+
+def compile_field(py_type: type | UnionType, field_info: FieldInfo | None = None) -> SchemaNode:
+    """Схема параметра с описанием из `Field`."""  # noqa: RUF002
+    node = compile_type(py_type)
+    return node.described(field_info.description) if field_info else node
+
+
+def _collect_models(node: SchemaNode, defs: dict[str, SchemaNode], uses: dict[str, int]) -> None:
+    if node.ref:
+        uses[node.ref] = uses.get(node.ref, 0) + 1
+        if node.ref in defs:
+            return
+        defs[node.ref] = node
+    for child in [node.items, *(node.properties or {}).values()]:
+        if child is not None:
+            _collect_models(child, defs, uses)
+
+
+@cache
+def compile_function(func: Callable) -> ToolSchema:
+    """Описание функции-инструмента, строится один раз на функцию.
+
+    Все параметры должны быть аннотированы как `Annotated[тип, Field(description=...)]`,
+    у функции должна быть документация - она становится описанием инструмента.
+    """  # noqa: RUF002
+    func_doc = func.__doc__
+    if not func_doc:
+        msg = f"Function '{func.__name__}' must have a docstring description."
+        raise ValueError(msg)
+
+    props: dict[str, SchemaNode] = {}
+    required: list[str] = []
+    for p, ann in get_type_hints(func, include_extras=True).items():
+        if p == "return":
+            continue
+
+        if get_origin(ann) is not Annotated:
+            msg = (
+                f"Only Annotated is supported for parameters. "
+                f"Check your function {func.__name__}. Parameter: '{p}', Got: {ann}"
+            )
+            raise ValueError(msg)
+
+        py_type: type | UnionType = get_args(ann)[0]
+        field_info: FieldInfo = get_args(ann)[1]
+        if not field_info.description:
+            msg = f"Field '{p}' has no description in its Field()."
+            raise ValueError(msg)
+
+        props[p] = compile_field(py_type, field_info)
+        if field_info.is_required():
+            required.append(p)
+
+    parameters = SchemaNode(type="object", properties=MappingProxyType(props), required=tuple(required))
+    defs: dict[str, SchemaNode] = {}
+    uses: dict[str, int] = {}
+    _collect_models(parameters, defs, uses)
+    return ToolSchema(
+        name=func.__name__,
+        description=func_doc,
+        parameters=parameters,
+        defs=MappingProxyType(defs),
+        uses=MappingProxyType(uses),
+    )
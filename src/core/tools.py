@@ -0,0 +1,241 @@
+"""Реестр инструментов для моделей: описание, проверка аргументов и вызов."""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import inspect
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Self, get_type_hints, overload
+
+from pydantic import TypeAdapter, ValidationError, create_model
+
+from src.core.deadline import stage_timeout
+from src.core.logger import logger as log
+from src.core.tool_schema import compile_function
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator, Mapping
+
+    from pydantic import BaseModel
+
+    from src.core.tool_schema import ToolSchema
+
+DEFAULT_TIMEOUT = 30.0  # Секунд на выполнение инструмента
+
+
+@dataclass(frozen=True)
+class Tool:
+    """Зарегистрированный инструмент."""
+
+    name: str
+    func: Callable[..., Any]
+    schema: ToolSchema  # Описание для моделей
+    validator: TypeAdapter[BaseModel]  # Проверка и приведение аргументов
+    timeout: float  # Секунд на выполнение
+    is_async: bool
+
+
+@dataclass
+class ToolResult:
+    """Результат вызова инструмента.
+
+    При ошибке `error` содержит её вид: `unknown_tool`, `validation`, `timeout` или `execution`.
+    """
+
+    name: str
+    ok: bool
+    value: Any = None  # Результат инструмента
+    error: str | None = None  # Вид ошибки
+    message: str = ""  # Описание ошибки для модели
+    details: list[dict[str, Any]] = field(default_factory=list)  # Ошибки отдельных аргументов
+    elapsed: float = 0.0  # Секунд на вызов
+
+    def error_response(self: Self) -> dict[str, Any]:
+        """Ошибка в виде, пригодном для ответа модели: она сможет исправить вызов."""
+        return {"error": {"type": self.error, "message": self.message, "details": self.details}}
+
+
+def _start_thread(tool: Tool, kwargs: dict[str, Any]) -> Future[Any]:
+    """Запустить инструмент в отдельном потоке с контекстом вызывающего: там срок документа.
+
+    Поток на каждый вызов, а не пул: зависший инструмент нельзя прервать, и в пуле он занимал бы поток,
+    пока зависшие вызовы не заблокируют все следующие.
+    """  # noqa: RUF002
+    future: Future[Any] = Future()
+    context = contextvars.copy_context()
+
+    def target() -> None:
+        try:
+            value = context.run(asyncio.run, tool.func(**kwargs)) if tool.is_async else context.run(tool.func, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(value)
+
+    threading.Thread(target=target, name=f"tool-{tool.name}", daemon=True).start()
+    return future
+
+
+def _build_validator(func: Callable[..., Any]) -> TypeAdapter[BaseModel]:
+    """Собрать проверку аргументов по сигнатуре функции один раз при регистрации."""
+    hints = get_type_hints(func, include_extras=True)
+    fields: dict[str, Any] = {}
+    for name, param in inspect.signature(func).parameters.items():
+        annotation = hints.get(name, Any)
+        fields[name] = annotation if param.default is inspect.Parameter.empty else (annotation, param.default)
+    model = create_model(f"{func.__name__}_args", **fields)
+    return TypeAdapter(model)
+
+
+class ToolRegistry:
+    """Реестр инструментов.
+
+    Инструменты регистрируются декоратором, описание и проверка аргументов строятся один раз.
+    При вызове аргументы проверяются и приводятся к типам из сигнатуры до выполнения инструмента,
+    ошибки возвращаются в `ToolResult`, а не выбрасываются.
+
+    Пример:
+    ```python
+    registry = ToolRegistry()
+
+
+    @registry.tool(timeout=10)
+    def foo(x: Annotated[int, Field(description="some int")]) -> int:
+        '''Some desc'''
+        return x
+
+
+    declarations = registry.declarations(func_to_gemi)
+    result = registry.call("foo", {"x": "7"})  # result.value == 7
+    ```
+    """  # noqa: RUF002
+
+    def __init__(self: Self, default_timeout: float = DEFAULT_TIMEOUT) -> None:  # noqa: D107
+        self._tools: dict[str, Tool] = {}
+        self._default_timeout = default_timeout
+
+    def __contains__(self: Self, name: object) -> bool:  # noqa: D105
+        return name in self._tools
+
+    def __iter__(self: Self) -> Iterator[Tool]:  # noqa: D105
+        return iter(self._tools.values())
+
+    def __len__(self: Self) -> int:  # noqa: D105
+        return len(self._tools)
+
+    def get(self: Self, name: str) -> Tool | None:
+        """Инструмент по имени."""
+        return self._tools.get(name)
+
+    def register(self: Self, func: Callable[..., Any], timeout: float | None = None) -> Tool:
+        """Зарегистрировать функцию как инструмент."""
+        tool = Tool(
+            name=func.__name__,
+            func=func,
+            schema=compile_function(func),
+            validator=_build_validator(func),
+            timeout=self._default_timeout if timeout is None else timeout,
+            is_async=inspect.iscoroutinefunction(func),
+        )
+        self._tools[tool.name] = tool
+        return tool
+
+    @overload
+    def tool[F: Callable[..., Any]](self: Self, func: F, *, timeout: float | None = None) -> F: ...
+
+    @overload
+    def tool[F: Callable[..., Any]](
+        self: Self,
+        func: None = None,
+        *,
+        timeout: float | None = None,
+    ) -> Callable[[F], F]: ...
+
+    def tool[F: Callable[..., Any]](
+        self: Self,
+        func: F | None = None,
+        *,
+        timeout: float | None = None,
+    ) -> F | Callable[[F], F]:
+        """Декоратор регистрации инструмента, функция возвращается без изменений."""
+
+        def decorator(f: F) -> F:
+            self.register(f, timeout)
+            return f
+
+        return decorator if func is None else decorator(func)
+
+    def declarations[T](self: Self, emitter: Callable[[Callable[..., Any]], T]) -> list[T]:
+        """Описания всех инструментов для провайдера, например `func_to_gemi` или `func_to_giga`."""
+        return [emitter(tool.func) for tool in self._tools.values()]
+
+    def _prepare(self: Self, name: str, args: Mapping[str, Any] | None) -> tuple[Tool, dict[str, Any]] | ToolResult:
+        tool = self._tools.get(name)
+        if tool is None:
+            return ToolResult(name, ok=False, error="unknown_tool", message=f"Unknown tool '{name}'")
+
+        try:
+            validated = tool.validator.validate_python(dict(args or {}))
+        except ValidationError as e:
+            details = [
+                {"loc": ".".join(map(str, err["loc"])), "msg": err["msg"]} for err in e.errors(include_url=False)
+            ]
+            return ToolResult(name, ok=False, error="validation", message="Invalid arguments", details=details)
+
+        return tool, dict(validated)
+
+    def call(self: Self, name: str, args: Mapping[str, Any] | None = None) -> ToolResult:
+        """Проверить аргументы и вызвать инструмент с ограничением времени.
+
+        Инструмент выполняется в отдельном потоке: по истечении времени результат не ждём,
+        но сам поток прервать нельзя, он завершится вместе с запросом.
+        """  # noqa: RUF002
+        prepared = self._prepare(name, args)
+        if isinstance(prepared, ToolResult):
+            log.warning("Инструмент %s: %s %s", name, prepared.message, prepared.details)
+            return prepared
+
+        tool, kwargs = prepared
+        timeout = stage_timeout("tool", tool.timeout)
+        start = time.monotonic()
+        future = _start_thread(tool, kwargs)
+        try:
+            value = future.result(timeout=timeout)
+        except FutureTimeoutError as e:
+            if future.done():  # Инструмент сам завершился ошибкой TimeoutError, время ожидания не истекло
+                return self._failed(tool, "execution", f"{e.__class__.__name__}: {e}", start)
+            return self._failed(tool, "timeout", f"No result in {timeout:g} s", start)
+        except Exception as e:
+            return self._failed(tool, "execution", f"{e.__class__.__name__}: {e}", start)
+
+        return ToolResult(name, ok=True, value=value, elapsed=time.monotonic() - start)
+
+    async def acall(self: Self, name: str, args: Mapping[str, Any] | None = None) -> ToolResult:
+        """Асинхронный вариант `call`, синхронные инструменты выполняются в отдельном потоке."""
+        prepared = self._prepare(name, args)
+        if isinstance(prepared, ToolResult):
+            log.warning("Инструмент %s: %s %s", name, prepared.message, prepared.details)
+            return prepared
+
+        tool, kwargs = prepared
+        timeout = stage_timeout("tool", tool.timeout)
+        coro = tool.func(**kwargs) if tool.is_async else asyncio.wrap_future(_start_thread(tool, kwargs))
+        start = time.monotonic()
+        try:
+            value = await asyncio.wait_for(coro, timeout)
+        except TimeoutError:
+            return self._failed(tool, "timeout", f"No result in {timeout:g} s", start)
+        except Exception as e:
+            return self._failed(tool, "execution", f"{e.__class__.__name__}: {e}", start)
+
+        return ToolResult(name, ok=True, value=value, elapsed=time.monotonic() - start)
+
+    @staticmethod
+    def _failed(tool: Tool, error: str, message: str, start: float) -> ToolResult:
+        log.error("Инструмент %s: %s", tool.name, message)
+        return ToolResult(tool.name, ok=False, error=error, message=message, elapsed=time.monotonic() - start)
@@ -0,0 +1,234 @@
+"""Учёт токенов и стоимости запросов к моделям.
+
+Каждый ответ модели проходит через `record`: токены запроса (из них кэшированные и ответы инструментов)
+и ответа учитываются в метриках по бэкенду, модели и отправителю письма и в счёте документа.
+Счёт документа хранится в контекстной переменной, как срок документа, и ограничивает расход:
+при превышении бюджета `record` прерывает диалог ошибкой `BudgetExceededError`.
+"""
+
+from __future__ import annotations
+
+import contextvars
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Any, Self
+
+from src.core.logger import logger as log
+from src.core.metrics import registry
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+PER_TOKENS = 1_000_000  # Цены указываются за миллион токенов
+# Границы корзин гистограмм токенов: от короткого шага до документа на сотни тысяч токенов
+TOKEN_BUCKETS = (1e3, 2.5e3, 5e3, 1e4, 2.5e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6)
+
+
+@dataclass(frozen=True)
+class Price:
+    """Цена токенов модели, долларов за миллион."""
+
+    input: float
+    cached: float
+    output: float
+
+
+# Оценка по опубликованным ценам; ключ - начало названия модели, выбирается самое длинное совпадение
+PRICES: dict[str, Price] = {
+    "gemini-2.5-pro": Price(1.25, 0.31, 10.0),
+    "gemini-2.5-flash": Price(0.30, 0.075, 2.50),
+    "gemini-2.5-flash-lite": Price(0.10, 0.025, 0.40),
+    "gemini-2.0-flash": Price(0.10, 0.025, 0.40),
+}
+
+
+@dataclass
+class UsageSettings:
+    """Цены моделей и бюджет документа."""
+
+    prices: dict[str, Price] = field(default_factory=lambda: dict(PRICES))
+    document_tokens: int = 0  # Токенов на документ, 0 - без ограничения
+    document_cost: float = 0.0  # Долларов на документ, 0 - без ограничения
+
+
+settings = UsageSettings()
+
+
+def parse_prices(text: str) -> dict[str, Price]:
+    """Разобрать цены вида `gemini-2.5-flash=0.3/0.075/2.5, GigaChat-2-Max=...` (вход/кэш/ответ)."""
+    prices = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+
+        model, _, values = item.partition("=")
+        parts = values.split("/")
+        try:
+            input_, cached, output = map(float, parts)
+        except ValueError:
+            msg = f"Invalid model price: {item.strip()!r}"
+            raise ValueError(msg) from None
+        prices[model.strip()] = Price(input_, cached, output)
+    return prices
+
+
+def price_for(model: str) -> Price | None:
+    """Цена модели по самому длинному совпадающему началу названия."""
+    matches = [prefix for prefix in settings.prices if model.startswith(prefix)]
+    return settings.prices[max(matches, key=len)] if matches else None
+
+
+@dataclass
+class Usage:
+    """Токены одного или нескольких запросов к модели."""
+
+    input: int = 0  # Токены запроса, включая кэшированные и ответы инструментов
+    cached: int = 0  # Из них прочитаны из кэша модели
+    tool: int = 0  # Из них ответы инструментов (оценка)
+    output: int = 0  # Токены ответа, включая рассуждения
+
+    @property
+    def total(self: Self) -> int:
+        """Всего токенов."""  # noqa: RUF002
+        return self.input + self.output
+
+    def cost(self: Self, price: Price | None) -> float:
+        """Оценка стоимости, 0 - цена модели неизвестна."""
+        if price is None:
+            return 0.0
+        fresh = max(self.input - self.cached, 0)
+        return (fresh * price.input + self.cached * price.cached + self.output * price.output) / PER_TOKENS
+
+    def __add__(self: Self, other: Usage) -> Usage:  # noqa: D105
+        return Usage(
+            self.input + other.input,
+            self.cached + other.cached,
+            self.tool + other.tool,
+            self.output + other.output,
+        )
+
+
+class BudgetExceededError(RuntimeError):
+    """Расход документа превысил бюджет: диалог прерывается и не повторяется."""
+
+
+@dataclass
+class Account:
+    """Счёт документа: расход всех шагов всех моделей, в том числе прерванных запусков."""
+
+    sender: str = ""
+    document: str = ""
+    usage: Usage = field(default_factory=Usage)
+    cost: float = 0.0
+    steps: int = 0
+
+    def summary(self: Self) -> dict[str, Any]:
+        """Итог для журнала и хранилища заданий."""
+        return {**asdict(self.usage), "cost": round(self.cost, 6), "steps": self.steps}
+
+    def restore(self: Self, summary: dict[str, Any] | None) -> Self:
+        """Продолжить счёт с сохранённого итога."""  # noqa: RUF002
+        if summary:
+            self.usage = Usage(**{name: summary.get(name, 0) for name in ("input", "cached", "tool", "output")})
+            self.cost = summary.get("cost", 0.0)
+            self.steps = summary.get("steps", 0)
+        return self
+
+    def check(self: Self) -> None:
+        """Проверить бюджет.
+
+        Raises:
+            BudgetExceededError: Расход превысил бюджет документа.
+        """
+        if settings.document_tokens and self.usage.total > settings.document_tokens:
+            msg = f"token budget {settings.document_tokens} exceeded: {self.usage.total} after {self.steps} steps"
+            raise BudgetExceededError(msg)
+        if settings.document_cost and self.cost > settings.document_cost:
+            msg = f"cost budget ${settings.document_cost:g} exceeded: ${self.cost:.4f} after {self.steps} steps"
+            raise BudgetExceededError(msg)
+
+
+TOKENS = registry.counter(
+    "model_tokens",
+    "Model tokens by kind: input, cached, tool, output",
+    ("backend", "model", "kind"),
+)
+COST = registry.counter("model_cost_usd", "Estimated model cost", ("backend", "model"))
+SENDER_TOKENS = registry.counter("sender_tokens", "Model tokens by email sender", ("sender",))
+SENDER_COST = registry.counter("sender_cost_usd", "Estimated model cost by email sender", ("sender",))
+STEP_TOKENS = registry.histogram("step_tokens", "Tokens per model step", ("backend", "model"), TOKEN_BUCKETS)
+DOCUMENT_TOKENS = registry.histogram("document_tokens", "Tokens per document", buckets=TOKEN_BUCKETS)
+
+_current: contextvars.ContextVar[Account | None] = contextvars.ContextVar("usage", default=None)
+
+
+def current() -> Account | None:
+    """Счёт документа, который сейчас обрабатывается."""
+    return _current.get()
+
+
+@contextmanager
+def document_usage(sender: str = "", document: str = "", spent: dict[str, Any] | None = None) -> Iterator[Account]:
+    """Открыть счёт документа, если он ещё не открыт выше по стеку вызовов.
+
+    Args:
+        sender (str): Отправитель письма.
+        document (str): Имя файла.
+        spent (dict[str, Any] | None): Итог прошлых запусков из `Account.summary`.
+    """
+    account = _current.get()
+    if account is not None:
+        yield account
+        return
+
+    account = Account(sender, document).restore(spent)
+    before = account.usage.total
+    token = _current.set(account)
+    try:
+        yield account
+    finally:
+        _current.reset(token)
+        DOCUMENT_TOKENS.observe(account.usage.total - before)
+
+
+def record(backend: str, model: str, step: Usage) -> float:
+    """Учесть ответ модели.
+
+    Args:
+        backend (str): Бэкенд: `gemini`, `gigachat`.
+        model (str): Название модели.
+        step (Usage): Токены запроса и ответа.
+
+    Returns:
+        float: Оценка стоимости запроса.
+
+    Raises:
+        BudgetExceededError: Расход документа превысил бюджет.
+    """
+    cost = step.cost(price_for(model))
+    for kind, tokens in asdict(step).items():
+        TOKENS.inc(tokens, backend=backend, model=model, kind=kind)
+    COST.inc(cost, backend=backend, model=model)
+    STEP_TOKENS.observe(step.total, backend=backend, model=model)
+    log.debug(
+        "%s: токенов запроса %d (кэш %d, инструменты ~%d), ответа %d, $%.4f",
+        model,
+        step.input,
+        step.cached,
+        step.tool,
+        step.output,
+        cost,
+    )
+
+    account = _current.get()
+    if account is None:
+        return cost
+
+    account.usage += step
+    account.cost += cost
+    account.steps += 1
+    if account.sender:
+        SENDER_TOKENS.inc(step.total, sender=account.sender)
+        SENDER_COST.inc(cost, sender=account.sender)
+    account.check()
+    return cost
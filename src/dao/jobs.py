@@ -0,0 +1,431 @@
+"""Хранилище заданий на обработку вложений с сохранением состояния между запусками.
+
+Каждое вложение из почты - задание: его этап, число шагов модели и выполненных записей на сервер,
+последняя контрольная точка диалога. После перезапуска незавершённые задания продолжаются
+с контрольной точки, а завершённые пропускаются.
+"""  # noqa: RUF002
+
+from __future__ import annotations
+
+import contextvars
+import datetime as dt
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from enum import StrEnum
+from typing import TYPE_CHECKING, Any, Self
+
+from src.core import usage
+from src.core.logger import logger as log
+from src.dao.leases import LeaseLostError
+from src.dto import FileDTO
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+    from pathlib import Path
+
+    from src.dao.leases import Lease
+
+MAX_ATTEMPTS = 3  # Запусков задания, после которых оно считается неудачным
+RETRY_DELAY = 10 * 60.0  # Секунд до повторного запуска прерванного задания
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    content BLOB NOT NULL,
+    stage TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    steps INTEGER NOT NULL DEFAULT 0,
+    tool_calls INTEGER NOT NULL DEFAULT 0,
+    checkpoint TEXT,
+    error TEXT,
+    usage TEXT,
+    owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cursors (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Колонки, добавленные после создания таблицы: в существующих хранилищах добавляются при открытии
+_MIGRATIONS = {
+    "owner": "ALTER TABLE jobs ADD COLUMN owner TEXT",
+    "lease_until": "ALTER TABLE jobs ADD COLUMN lease_until REAL NOT NULL DEFAULT 0",
+    "usage": "ALTER TABLE jobs ADD COLUMN usage TEXT",
+}
+
+_COLUMNS = "key, source, name, type, content, stage, attempts, steps, tool_calls, checkpoint, error, usage"
+
+
+class JobStage(StrEnum):
+    """Этап задания."""
+
+    FETCHED = "fetched"  # Вложение получено из почты
+    UPLOADED = "uploaded"  # Файл передан агенту
+    PROCESSING = "processing"  # Идут шаги модели, сохранена контрольная точка
+    DONE = "done"  # Данные загружены
+    FAILED = "failed"  # Обработка не удалась, повторять не нужно
+    SKIPPED = "skipped"  # Документ отсеян классификатором
+
+
+FINAL_STAGES = frozenset({JobStage.DONE, JobStage.FAILED, JobStage.SKIPPED})
+
+
+@dataclass
+class Job:
+    """Задание на обработку одного вложения."""
+
+    key: str
+    source: str  # Письмо, из которого взято вложение
+    file_dto: FileDTO
+    stage: JobStage = JobStage.FETCHED
+    attempts: int = 0
+    steps: int = 0  # Выполненных шагов модели
+    tool_calls: int = 0  # Успешных записей на сервер
+    checkpoint: dict[str, Any] | None = None  # Состояние диалога, из которого агент продолжит работу
+    error: str | None = None  # Почему последний запуск не завершил задание
+    usage: dict[str, Any] | None = None  # Токены и стоимость всех запусков, см. `src.core.usage.Account`
+    # Аренда, под которой задание обрабатывает этот экземпляр; в хранилище не сохраняется
+    lease: Lease | None = field(default=None, repr=False, compare=False)
+
+    @property
+    def finished(self: Self) -> bool:
+        """Задание завершено и повторно не выполняется."""
+        return self.stage in FINAL_STAGES
+
+
+class JobStore:
+    """Хранилище заданий в SQLite.
+
+    Один файл хранилища могут использовать несколько экземпляров сервиса: задание обрабатывает тот,
+    кто взял его в аренду (`src.dao.leases.Lease`), и изменять задание, пока аренда у другого
+    экземпляра, нельзя.
+    Пока хранилище не открыто через `init_jobs`, задания существуют только в памяти процесса.
+    """  # noqa: RUF002
+
+    def __init__(self: Self, clock: Callable[[], float] = time.time) -> None:
+        """Хранилище.
+
+        Args:
+            clock (Callable[[], float]): Источник времени, секунды от эпохи.
+        """
+        self._clock = clock
+        self._conn: sqlite3.Connection | None = None
+        self._retention = dt.timedelta(0)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self: Self) -> bool:
+        """Хранилище открыто и используется."""
+        return self._conn is not None
+
+    def open(self: Self, path: Path | str, retention: dt.timedelta) -> None:
+        """Открыть (или создать) хранилище и удалить давно завершённые задания.
+
+        Args:
+            path (Path | str): Путь к файлу хранилища.
+            retention (dt.timedelta): Время хранения завершённых заданий.
+        """
+        self.close()
+        # Ожидание блокировки: в файл одновременно пишут несколько экземпляров
+        conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # Журнал предзаписи: прерванная запись не повреждает уже сохранённые задания
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column, statement in _MIGRATIONS.items():
+            if column not in columns:
+                conn.execute(statement)
+        conn.commit()
+        with self._lock:
+            self._conn = conn
+            self._retention = retention
+        removed = self.purge()
+        log.debug("Хранилище заданий открыто: %s, удалено завершённых заданий: %d", path, removed)
+
+    def close(self: Self) -> None:
+        """Закрыть хранилище."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+
+    @staticmethod
+    def make_key(source: str, file_dto: FileDTO) -> str:
+        """Ключ задания: хеш письма, имени и содержимого файла."""
+        digest = hashlib.sha256(file_dto.content).hexdigest()
+        return hashlib.sha256(f"{source}\n{file_dto.name}\n{digest}".encode()).hexdigest()
+
+    def add(self: Self, source: str, file_dto: FileDTO) -> Job:
+        """Добавить задание для вложения или вернуть уже существующее."""
+        key = self.make_key(source, file_dto)
+        now = self._now()
+        with self._lock:
+            if self._conn is None:
+                return Job(key, source, file_dto)
+
+            self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (key, source, name, type, content, stage, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, source, file_dto.name, file_dto.type_, file_dto.content, JobStage.FETCHED, now, now),
+            )
+            self._conn.commit()
+            row = self._conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE key = ?", (key,)).fetchone()  # noqa: S608
+        return self._job(row)
+
+    def get(self: Self, key: str) -> Job | None:
+        """Найти задание по ключу."""
+        with self._lock:
+            if self._conn is None:
+                return None
+            row = self._conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE key = ?", (key,)).fetchone()  # noqa: S608
+        return None if row is None else self._job(row)
+
+    def pending(self: Self) -> list[Job]:
+        """Незавершённые задания в порядке поступления.
+
+        Задания в действующей аренде других экземпляров не возвращаются, прерванные - только через
+        `RETRY_DELAY` после последнего запуска.
+        """
+        now = self._now()
+        with self._lock:
+            if self._conn is None:
+                return []
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE stage NOT IN (?, ?, ?) AND lease_until < ? "  # noqa: S608
+                "AND (error IS NULL OR updated_at < ?) ORDER BY created_at",
+                (*FINAL_STAGES, now, now - RETRY_DELAY),
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def refresh(self: Self, job: Job) -> None:
+        """Обновить задание из хранилища: задание мог продвинуть другой экземпляр."""
+        stored = self.get(job.key)
+        if stored is not None:
+            stored.lease = job.lease
+            job.__dict__.update(stored.__dict__)
+
+    def claim(self: Self, key: str, owner: str, ttl: float) -> bool:
+        """Взять незавершённое задание в аренду, если оно свободно или его аренда истекла."""  # noqa: RUF002
+        now = self._now()
+        with self._lock:
+            if self._conn is None:
+                return True
+            cursor = self._conn.execute(
+                "UPDATE jobs SET owner = ?, lease_until = ? WHERE key = ? AND stage NOT IN (?, ?, ?) "
+                "AND (owner IS NULL OR owner = ? OR lease_until < ?)",
+                (owner, now + ttl, key, *FINAL_STAGES, owner, now),
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def renew(self: Self, key: str, owner: str, ttl: float) -> bool:
+        """Продлить аренду задания."""
+        with self._lock:
+            if self._conn is None:
+                return True
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE key = ? AND owner = ?",
+                (self._now() + ttl, key, owner),
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def release(self: Self, key: str, owner: str) -> None:
+        """Освободить задание."""
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.execute(
+                "UPDATE jobs SET owner = NULL, lease_until = 0 WHERE key = ? AND owner = ?",
+                (key, owner),
+            )
+            self._conn.commit()
+
+    def start(self: Self, job: Job) -> None:
+        """Учесть новый запуск задания."""
+        job.attempts += 1
+        job.error = None
+        self._save(job, "attempts = ?, error = NULL", (job.attempts,))
+
+    def update(self: Self, job: Job, stage: JobStage, error: str | None = None) -> None:
+        """Перевести задание на этап."""
+        job.stage, job.error = stage, error
+        self._save(job, "stage = ?, error = ?", (stage, error))
+        log.debug("Задание %s: %s%s", job.file_dto.name, stage, f" ({error})" if error else "")
+
+    def save_checkpoint(
+        self: Self,
+        job: Job,
+        state: dict[str, Any],
+        steps: int,
+        tool_calls: int,
+        spent: dict[str, Any] | None = None,
+    ) -> None:
+        """Сохранить контрольную точку диалога и, если передан, расход токенов."""
+        job.stage, job.checkpoint, job.steps, job.tool_calls = JobStage.PROCESSING, state, steps, tool_calls
+        job.usage = job.usage if spent is None else spent
+        self._save(
+            job,
+            "stage = ?, checkpoint = ?, steps = ?, tool_calls = ?, usage = ?",
+            (
+                job.stage,
+                json.dumps(state, ensure_ascii=False),
+                steps,
+                tool_calls,
+                None if job.usage is None else json.dumps(job.usage),
+            ),
+        )
+
+    def save_usage(self: Self, job: Job, spent: dict[str, Any]) -> None:
+        """Сохранить расход токенов и стоимость задания."""
+        job.usage = spent
+        self._save(job, "usage = ?", (json.dumps(spent),))
+
+    def cursor(self: Self, name: str) -> str | None:
+        """Сохранённая позиция чтения источника, например время последнего письма."""
+        with self._lock:
+            if self._conn is None:
+                return None
+            row = self._conn.execute("SELECT value FROM cursors WHERE name = ?", (name,)).fetchone()
+        return None if row is None else str(row[0])
+
+    def set_cursor(self: Self, name: str, value: str) -> None:
+        """Сохранить позицию чтения источника."""
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.execute("INSERT OR REPLACE INTO cursors (name, value) VALUES (?, ?)", (name, value))
+            self._conn.commit()
+
+    def purge(self: Self) -> int:
+        """Удалить завершённые задания старше срока хранения.
+
+        Returns:
+            int: Количество удалённых заданий.
+        """
+        expire_before = self._now() - self._retention.total_seconds()
+        with self._lock:
+            if self._conn is None:
+                return 0
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE stage IN (?, ?, ?) AND updated_at < ?",
+                (*FINAL_STAGES, expire_before),
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def _save(self: Self, job: Job, assignments: str, values: tuple[Any, ...]) -> None:
+        # Задание изменяет только владелец аренды: после потери аренды записи не затирают работу другого
+        owner = None if job.lease is None else job.lease.owner
+        with self._lock:
+            if self._conn is None:
+                return
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? WHERE key = ? AND (owner IS NULL OR owner = ?)",  # noqa: S608
+                (*values, self._now(), job.key, owner),
+            )
+            self._conn.commit()
+        if cursor.rowcount == 0:
+            log.warning("Задание %s в аренде другого экземпляра, изменение не сохранено", job.key[:8])
+
+    @staticmethod
+    def _job(row: tuple[Any, ...]) -> Job:
+        key, source, name, type_, content, stage, attempts, steps, tool_calls, checkpoint, error, spent = row
+        return Job(
+            key=key,
+            source=source,
+            file_dto=FileDTO(type_=type_, name=name, content=bytes(content)),
+            stage=JobStage(stage),
+            attempts=attempts,
+            steps=steps,
+            tool_calls=tool_calls,
+            checkpoint=None if checkpoint is None else json.loads(checkpoint),
+            error=error,
+            usage=None if spent is None else json.loads(spent),
+        )
+
+    def _now(self: Self) -> float:
+        return self._clock()
+
+
+jobs = JobStore()
+
+
+def init_jobs(path: Path | str, retention_hours: float) -> JobStore:
+    """Инициализация хранилища заданий."""
+    jobs.open(path, dt.timedelta(hours=retention_hours))
+    return jobs
+
+
+# Задание, которое сейчас обрабатывается: агенты сохраняют в него контрольные точки
+_current: contextvars.ContextVar[Job | None] = contextvars.ContextVar("job", default=None)
+
+
+def current() -> Job | None:
+    """Задание, которое сейчас обрабатывается."""
+    return _current.get()
+
+
+@contextmanager
+def active(job: Job) -> Iterator[Job]:
+    """Сделать задание текущим на время обработки."""
+    token = _current.set(job)
+    try:
+        yield job
+    finally:
+        _current.reset(token)
+
+
+def restore() -> dict[str, Any] | None:
+    """Контрольная точка текущего задания, с которой агент продолжает работу."""  # noqa: RUF002
+    job = _current.get()
+    return None if job is None else job.checkpoint
+
+
+def checkpoint(state: dict[str, Any], steps: int, tool_calls: int) -> None:
+    """Сохранить контрольную точку текущего задания вместе с расходом токенов документа.
+
+    Args:
+        state (dict[str, Any]): Состояние диалога, сериализуемое в JSON.
+        steps (int): Выполнено шагов модели.
+        tool_calls (int): Выполнено успешных записей на сервер.
+
+    Raises:
+        LeaseLostError: Аренда задания потеряна, следующий шаг выполнять нельзя.
+    """  # noqa: RUF002
+    job = _current.get()
+    if job is None:
+        return
+
+    if job.lease is not None and job.lease.lost:
+        msg = f"Lease of job {job.key[:8]} lost"
+        raise LeaseLostError(msg)
+
+    account = usage.current()
+    jobs.save_checkpoint(job, state, steps, tool_calls, None if account is None else account.summary())
+
+
+def fail(reason: str) -> None:
+    """Завершить текущее задание неудачей: повторная обработка не поможет."""
+    job = _current.get()
+    if job is not None:
+        jobs.update(job, JobStage.FAILED, reason)
+
+
+def postpone(reason: str) -> None:
+    """Прервать текущее задание: оно останется незавершённым и продолжится при следующем запуске."""
+    job = _current.get()
+    if job is not None:
+        jobs.update(job, job.stage, reason)
@@ -0,0 +1,114 @@
+"""Аренда заданий несколькими экземплярами сервиса.
+
+Экземпляр берёт задание в аренду на ограниченное время и продлевает её, пока обрабатывает задание.
+Если экземпляр остановился, аренда истекает и задание забирает другой экземпляр.
+"""
+
+from __future__ import annotations
+
+import os
+import socket
+import threading
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Protocol, Self
+
+from src.core.logger import logger as log
+
+if TYPE_CHECKING:
+    from types import TracebackType
+
+HEARTBEATS = 3  # Продлений за время аренды: аренда переживает пропуск одного продления
+
+
+def default_owner() -> str:
+    """Имя экземпляра по умолчанию: хост и процесс."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+@dataclass
+class LeaseSettings:
+    """Настройки аренды."""
+
+    owner: str = field(default_factory=default_owner)  # Имя экземпляра сервиса
+    ttl: float = 60.0  # Секунд, на которые берётся и продлевается аренда
+
+
+settings = LeaseSettings()
+
+
+class LeaseLostError(RuntimeError):
+    """Аренда задания потеряна: продолжать обработку нельзя, задание мог забрать другой экземпляр."""
+
+
+class LeaseStore(Protocol):
+    """Общее для экземпляров хранилище аренды."""
+
+    def claim(self: Self, key: str, owner: str, ttl: float) -> bool:
+        """Взять задание в аренду, если оно свободно, его аренда истекла или уже принадлежит владельцу."""  # noqa: RUF002
+        raise NotImplementedError
+
+    def renew(self: Self, key: str, owner: str, ttl: float) -> bool:
+        """Продлить аренду, если она ещё принадлежит владельцу."""
+        raise NotImplementedError
+
+    def release(self: Self, key: str, owner: str) -> None:
+        """Освободить задание, если оно принадлежит владельцу."""
+        raise NotImplementedError
+
+
+class Lease:
+    """Аренда задания на время обработки с продлением в фоновом потоке.
+
+    ```
+    with Lease(store, job.key) as lease:
+        if lease.held:
+            ...
+    ```
+    """  # noqa: RUF002
+
+    def __init__(self: Self, store: LeaseStore, key: str, owner: str | None = None, ttl: float | None = None) -> None:
+        """Аренда задания.
+
+        Args:
+            store (LeaseStore): Хранилище аренды.
+            key (str): Ключ задания.
+            owner (str | None): Имя экземпляра, по умолчанию - из настроек.
+            ttl (float | None): Срок аренды, по умолчанию - из настроек.
+        """
+        self.store = store
+        self.key = key
+        self.owner = owner or settings.owner
+        self.ttl = ttl or settings.ttl
+        self.held = False
+        self.lost = False  # Аренду не удалось продлить: задание мог забрать другой экземпляр
+        self._stop = threading.Event()
+        self._heartbeat: threading.Thread | None = None
+
+    def __enter__(self: Self) -> Self:  # noqa: D105
+        self.held = self.store.claim(self.key, self.owner, self.ttl)
+        if self.held:
+            self._heartbeat = threading.Thread(target=self._renew, name=f"lease-{self.key[:8]}", daemon=True)
+            self._heartbeat.start()
+        return self
+
+    def __exit__(  # noqa: D105
+        self: Self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        if not self.held:
+            return
+
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        if not self.lost:
+            self.store.release(self.key, self.owner)
+
+    def _renew(self: Self) -> None:
+        while not self._stop.wait(self.ttl / HEARTBEATS):
+            if not self.store.renew(self.key, self.owner, self.ttl):
+                self.lost = True
+                log.warning("Аренда задания %s потеряна: его может обработать другой экземпляр", self.key[:8])
+                return
@@ -0,0 +1,169 @@
+"""Журнал изменяющих запросов к DocAPI."""
+
+from __future__ import annotations
+
+import contextlib
+import datetime as dt
+import hashlib
+import json
+import sqlite3
+import threading
+from http import HTTPMethod, HTTPStatus
+from typing import TYPE_CHECKING, Any, Self
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from src.core.logger import logger as log
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+MUTATING_METHODS = frozenset({HTTPMethod.POST, HTTPMethod.PUT, HTTPMethod.PATCH, HTTPMethod.DELETE})
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS writes (
+    key TEXT PRIMARY KEY,
+    method TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+
+class WriteLedger:
+    """Журнал успешных изменяющих запросов.
+
+    Повторный запрос с тем же методом, адресом и телом не отправляется на сервер,
+    а получает ответ, записанный при первой успешной отправке.
+    Успешный изменяющий запрос другого вида к тому же ресурсу сбрасывает записи ресурса:
+    после POST, DELETE и снова POST последний запрос уходит на сервер.
+    Пока журнал не открыт через `init_ledger`, он ничего не хранит и не мешает запросам.
+    """  # noqa: RUF002
+
+    def __init__(self: Self) -> None:  # noqa: D107
+        self._conn: sqlite3.Connection | None = None
+        self._retention = dt.timedelta(0)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self: Self) -> bool:
+        """Журнал открыт и используется."""
+        return self._conn is not None
+
+    def open(self: Self, path: Path | str, retention: dt.timedelta) -> None:
+        """Открыть (или создать) журнал и удалить устаревшие записи.
+
+        Args:
+            path (Path | str): Путь к файлу журнала.
+            retention (dt.timedelta): Время хранения записей.
+        """
+        self.close()
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute(_SCHEMA)
+        conn.commit()
+        with self._lock:
+            self._conn = conn
+            self._retention = retention
+        removed = self.purge()
+        log.debug("Журнал запросов открыт: %s, удалено устаревших записей: %d", path, removed)
+
+    def close(self: Self) -> None:
+        """Закрыть журнал."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+
+    @staticmethod
+    def resource(url: str) -> str:
+        """Канонический адрес ресурса: схема, хост и путь без параметров."""  # noqa: RUF002
+        parts = urlsplit(url)
+        return f"{parts.scheme.lower()}://{parts.netloc.lower()}{parts.path.rstrip('/') or '/'}"
+
+    @classmethod
+    def make_key(cls: type[Self], method: str, url: str, data: Any = None) -> str:  # noqa: ANN401
+        """Канонический ключ запроса: хеш метода, адреса с отсортированными параметрами и тела."""  # noqa: RUF002
+        query = urlencode(sorted(parse_qsl(urlsplit(url).query, keep_blank_values=True)))
+        path = f"{cls.resource(url)}?{query}" if query else cls.resource(url)
+        if isinstance(data, str):
+            # `http_request_s` получает тело строкой: приводим валидный JSON к общему виду
+            with contextlib.suppress(ValueError):
+                data = json.loads(data)
+        body = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        raw = f"{str(method).upper()}\n{path}\n{body}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def lookup(self: Self, method: str, url: str, data: Any = None) -> tuple[int, str] | None:  # noqa: ANN401
+        """Найти ранее выполненный успешный запрос.
+
+        Returns:
+            tuple[int, str] | None: Сохранённые статус и тело ответа или None.
+        """
+        if not self.enabled or str(method).upper() not in MUTATING_METHODS:
+            return None
+
+        key = self.make_key(method, url, data)
+        expire_before = self._now() - self._retention.total_seconds()
+        with self._lock:
+            if self._conn is None:
+                return None
+            row = self._conn.execute(
+                "SELECT status, text FROM writes WHERE key = ? AND created_at >= ?",
+                (key, expire_before),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        log.info("Запрос уже выполнен ранее, ответ взят из журнала: %s %s", method, url)
+        return int(row[0]), str(row[1])
+
+    def record(self: Self, method: str, url: str, data: Any, status: int, text: str) -> None:  # noqa: ANN401
+        """Записать успешно выполненный изменяющий запрос."""
+        if not self.enabled or str(method).upper() not in MUTATING_METHODS:
+            return None
+
+        if not HTTPStatus.OK <= status < HTTPStatus.MULTIPLE_CHOICES:
+            return None
+
+        key = self.make_key(method, url, data)
+        resource = self.resource(url)
+        with self._lock:
+            if self._conn is None:
+                return None
+            # После изменения прежние ответы для этого адреса устарели
+            self._conn.execute("DELETE FROM writes WHERE path = ? AND key != ?", (resource, key))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO writes (key, method, path, status, text, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, str(method).upper(), resource, status, text, self._now()),
+            )
+            self._conn.commit()
+        return None
+
+    def purge(self: Self) -> int:
+        """Удалить записи старше срока хранения.
+
+        Returns:
+            int: Количество удалённых записей.
+        """
+        expire_before = self._now() - self._retention.total_seconds()
+        with self._lock:
+            if self._conn is None:
+                return 0
+            cursor = self._conn.execute("DELETE FROM writes WHERE created_at < ?", (expire_before,))
+            self._conn.commit()
+        return cursor.rowcount
+
+    @staticmethod
+    def _now() -> float:
+        return dt.datetime.now(tz=dt.UTC).timestamp()
+
+
+ledger = WriteLedger()
+
+
+def init_ledger(path: Path | str, retention_hours: float) -> WriteLedger:
+    """Инициализация журнала изменяющих запросов."""
+    ledger.open(path, dt.timedelta(hours=retention_hours))
+    return ledger
@@ -9,6 +9,7 @@ from email.header import decode_header
 from email.utils import parsedate_to_datetime
 from typing import TYPE_CHECKING, Self
 
+from src.core.metrics import IMAP_SECONDS, MIME_SECONDS
 from src.dto import EmailDTO, FileDTO
 
 if TYPE_CHECKING:
@@ -39,12 +40,14 @@ class Mailer:
 
     def read_new_messages(self: Self, from_: dt.datetime) -> list[EmailDTO]:
         """Обработка новых сообщений."""
-        mail = imaplib.IMAP4_SSL(self._host, self._port)
-        mail.login(self._username, self._password)
-        mail.select("inbox")
+        with IMAP_SECONDS.time(operation="connect"):
+            mail = imaplib.IMAP4_SSL(self._host, self._port)
+            mail.login(self._username, self._password)
+            mail.select("inbox")
 
         date_str = from_.strftime("%d-%b-%Y")
-        status, uids = mail.search(None, f'(SINCE "{date_str}")')
+        with IMAP_SECONDS.time(operation="search"):
+            status, uids = mail.search(None, f'(SINCE "{date_str}")')
         uids: list[bytes]  # type: ignore # [b'1 2 3 4']
         if status != STATUS_OK:
             return []
@@ -60,14 +63,19 @@ class Mailer:
 
     def get_email(self: Self, mail: imaplib.IMAP4, from_: dt.datetime, uid: str) -> EmailDTO | None:
         """Получение сообщения."""
-        status, msg_data = mail.fetch(uid, "(RFC822)")  # type: ignore
+        with IMAP_SECONDS.time(operation="fetch"):
+            status, msg_data = mail.fetch(uid, "(RFC822)")  # type: ignore
         msg_data: list[tuple[bytes, ...]]  # type: ignore
         if status != STATUS_OK:
             return None
 
+        with MIME_SECONDS.time():
+            return self._parse(msg_data[0][1], from_)  # type: ignore
+
+    def _parse(self: Self, raw: bytes, from_: dt.datetime) -> EmailDTO | None:
         text = ""
         attachments: list[FileDTO] = []
-        msg = email.message_from_bytes(msg_data[0][1])  # type: ignore
+        msg = email.message_from_bytes(raw)
         sender = self._get_sender(msg)
         subject = self._get_subject(msg)
         recived_at = self._get_date(msg, from_)
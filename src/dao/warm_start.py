@@ -0,0 +1,191 @@
+"""Справочные данные агентов (документация DocAPI, атрибуты, виды данных) с сохранением между запусками."""  # noqa: RUF002
+
+from __future__ import annotations
+
+import datetime as dt
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Self
+
+from src.core.logger import logger as log
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+
+CACHE_VERSION = 1  # Увеличивается при изменении формата файла: старый файл тогда игнорируется
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    """Сохранённое значение."""
+
+    value: str
+    fetched_at: float  # Время получения, секунды от эпохи
+    fresh: bool  # Срок хранения не истёк
+
+
+class WarmCache:
+    """Кэш справочных данных в JSON-файле.
+
+    Пока кэш не открыт через `init_warm_cache`, значения хранятся только в памяти процесса.
+    Устаревшие значения не удаляются: при `stale=True` ими можно пользоваться, пока идёт обновление.
+    """
+
+    def __init__(self: Self) -> None:  # noqa: D107
+        self._path: Path | None = None
+        self._ttl = dt.timedelta(0)
+        self._entries: dict[str, dict[str, str | float]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self: Self) -> bool:
+        """Кэш сохраняется в файл."""
+        return self._path is not None
+
+    def open(self: Self, path: Path | str, ttl: dt.timedelta) -> None:
+        """Открыть кэш: прочитать файл, если он есть и его формат совпадает с текущим."""  # noqa: RUF002
+        path = Path(path)
+        entries: dict[str, dict[str, str | float]] = {}
+        if path.exists():
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except ValueError:
+                data = {}
+            if data.get("version") == CACHE_VERSION:
+                entries = data.get("entries", {})
+            else:
+                log.info("Формат кэша справочных данных изменился, кэш будет собран заново: %s", path)
+
+        with self._lock:
+            self._path = path
+            self._ttl = ttl
+            self._entries = entries
+        log.debug("Кэш справочных данных открыт: %s, записей: %d", path, len(entries))
+
+    def get(self: Self, key: str, *, stale: bool = False) -> CacheEntry | None:
+        """Сохранённое значение по ключу, устаревшее - только при `stale=True`."""
+        with self._lock:
+            entry = self._entries.get(key)
+            ttl = self._ttl.total_seconds()
+        if entry is None:
+            return None
+
+        fetched_at = float(entry["fetched_at"])
+        fresh = time.time() - fetched_at < ttl
+        if not fresh and not stale:
+            return None
+        return CacheEntry(value=str(entry["value"]), fetched_at=fetched_at, fresh=fresh)
+
+    def put(self: Self, key: str, value: str) -> None:
+        """Сохранить значение."""
+        with self._lock:
+            self._entries[key] = {"value": value, "fetched_at": time.time()}
+            if self._path is not None:
+                self._path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self._path.with_suffix(".tmp")
+                tmp.write_text(
+                    json.dumps({"version": CACHE_VERSION, "entries": self._entries}, ensure_ascii=False),
+                    encoding="utf-8",
+                )
+                tmp.replace(self._path)
+
+
+warm_cache = WarmCache()
+
+
+def init_warm_cache(path: Path | str, ttl_hours: float) -> WarmCache:
+    """Открыть кэш справочных данных, используемый агентами."""
+    warm_cache.open(path, dt.timedelta(hours=ttl_hours))
+    return warm_cache
+
+
+class Bootstrap:
+    """Справочные данные агента.
+
+    Значения, которых нет в кэше, запрашиваются параллельно при создании.
+    Значения из кэша доступны сразу, устаревшие обновляются в фоне (`refresh_in_background`).
+    """
+
+    def __init__(  # noqa: D107
+        self: Self,
+        sources: dict[str, str],
+        fetch: Callable[[str], str | None],
+        cache: WarmCache | None = None,
+    ) -> None:
+        self._sources = sources  # Имя значения -> URL, он же ключ в кэше
+        self._fetch = fetch
+        self._cache = cache or warm_cache
+        self._values: dict[str, str | None] = dict.fromkeys(sources)
+        self._stale: list[str] = []
+        missing = []
+        for name, url in sources.items():
+            entry = self._cache.get(url, stale=True)
+            if entry is None:
+                missing.append(name)
+                continue
+            self._values[name] = entry.value
+            if not entry.fresh:
+                self._stale.append(name)
+
+        if missing:
+            self._load(missing)
+        log.debug("Справочные данные: из кэша %d, загружено %d", len(sources) - len(missing), len(missing))
+
+    def __getitem__(self: Self, name: str) -> str | None:  # noqa: D105
+        return self._values[name]
+
+    def _load(self: Self, names: Iterable[str]) -> list[str]:
+        """Параллельно запросить значения.
+
+        Returns:
+            list[str]: Имена изменившихся значений.
+        """
+        names = list(names)
+        if not names:
+            return []
+
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            results = list(executor.map(lambda name: self._fetch(self._sources[name]), names))
+
+        changed = []
+        for name, value in zip(names, results, strict=True):
+            if value is None:
+                # Сервер недоступен: остаётся прежнее значение
+                continue
+            if self._values[name] != value:
+                changed.append(name)
+            self._values[name] = value
+            self._cache.put(self._sources[name], value)
+        return changed
+
+    def refresh(self: Self, names: Iterable[str] | None = None) -> list[str]:
+        """Запросить значения заново.
+
+        Returns:
+            list[str]: Имена изменившихся значений.
+        """
+        return self._load(self._sources if names is None else names)
+
+    def refresh_in_background(
+        self: Self,
+        on_change: Callable[[list[str]], None] | None = None,
+    ) -> threading.Thread | None:
+        """Обновить устаревшие значения в фоне, `on_change` вызывается, если что-то изменилось."""
+        if not self._stale:
+            return None
+
+        stale, self._stale = self._stale, []
+
+        def run() -> None:
+            changed = self.refresh(stale)
+            log.debug("Справочные данные обновлены в фоне, изменились: %s", changed)
+            if changed and on_change is not None:
+                on_change(changed)
+
+        thread = threading.Thread(target=run, name="bootstrap-refresh", daemon=True)
+        thread.start()
+        return thread
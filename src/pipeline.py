@@ -0,0 +1,319 @@
+"""Обработка вложений из почты как заданий с сохранением состояния.
+
+Задание проходит три этапа: загрузка файла в модель, обработка моделью и удаление файла.
+`Pipeline` выполняет этапы в отдельных потоках с небольшими очередями между ними,
+поэтому следующий файл загружается, пока модель обрабатывает текущий.
+"""  # noqa: RUF002
+
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass
+from email.utils import parseaddr
+from queue import Queue
+from typing import TYPE_CHECKING, Literal, Self
+
+from src.core.logger import logger as log
+from src.core.metrics import DOCUMENT_SECONDS
+from src.core.usage import BudgetExceededError, document_usage
+from src.dao.jobs import MAX_ATTEMPTS, JobStage, active, jobs
+from src.dao.leases import Lease
+
+if TYPE_CHECKING:
+    from src.core.classifier import DocumentClassifier
+    from src.core.intrfaces import KeyRatesAgentInterface
+    from src.dao.jobs import Job
+    from src.dto import EmailDTO
+
+type PipelineStage = Literal["upload", "process", "cleanup"]
+
+STAGES: tuple[PipelineStage, ...] = ("upload", "process", "cleanup")
+
+
+@dataclass
+class PipelineSettings:
+    """Настройки конвейера."""
+
+    depth: int = 1  # Заданий в очереди перед каждым этапом
+
+
+settings = PipelineSettings()
+
+
+@dataclass
+class Task:
+    """Задание, файл которого загружен в модель."""
+
+    job: Job
+    file_id: str
+    resources: ExitStack  # Аренда задания: освобождается после удаления файла
+    started: float  # Начало загрузки файла по `time.perf_counter`
+    error: Exception | None = None
+
+
+def process_job(
+    agent: KeyRatesAgentInterface,
+    job: Job,
+    classifier: DocumentClassifier | None = None,
+) -> None:
+    """Обработать задание, продолжив его с последней контрольной точки.
+
+    Задание обрабатывается, только если его удалось взять в аренду: задание, которое обрабатывает
+    другой экземпляр, пропускается. Задание завершается, если агент не сообщил об ошибке.
+    Прерванное задание (исключение, срок документа, нет доступных моделей) остаётся незавершённым
+    и продолжится позже, пока не исчерпает `MAX_ATTEMPTS` запусков.
+
+    Args:
+        agent (KeyRatesAgentInterface): Агент.
+        job (Job): Задание.
+        classifier (DocumentClassifier | None): Отбор документов перед первым запуском задания.
+    """  # noqa: RUF002
+    task = upload(agent, job, classifier)
+    if task is None:
+        return
+
+    process(agent, task)
+    cleanup(agent, task)
+    if task.error is not None:
+        raise task.error
+
+
+def upload(agent: KeyRatesAgentInterface, job: Job, classifier: DocumentClassifier | None = None) -> Task | None:
+    """Этап загрузки: взять задание в аренду, отобрать документ и загрузить файл в модель.
+
+    Returns:
+        Task | None: Задание с загруженным файлом, None - если обрабатывать задание не нужно.
+    """  # noqa: RUF002
+    with ExitStack() as resources:
+        lease = resources.enter_context(Lease(jobs, job.key))
+        jobs.refresh(job)
+        if job.finished:
+            log.info("Файл %s уже обработан: %s", job.file_dto.name, job.stage)
+            return None
+        if not lease.held:
+            log.info("Файл %s обрабатывает другой экземпляр", job.file_dto.name)
+            return None
+        job.lease = lease
+        if _skipped(job, classifier) or not _startable(job):
+            return None
+
+        jobs.start(job)
+        started = time.perf_counter()
+        try:
+            with active(job):
+                err, file_id = agent.load_file(job.file_dto)
+        except Exception as e:
+            jobs.update(job, job.stage, repr(e))
+            raise
+
+        if not file_id:
+            jobs.update(job, JobStage.FAILED, err)
+            return None
+
+        if job.stage == JobStage.FETCHED:
+            jobs.update(job, JobStage.UPLOADED)
+        return Task(job, file_id, resources.pop_all(), started)
+
+
+def process(agent: KeyRatesAgentInterface, task: Task) -> None:
+    """Этап обработки: диалог модели по загруженному файлу.
+
+    Расход токенов считается с учётом прошлых запусков задания: документ, превысивший бюджет,
+    считается неудачным и не повторяется.
+    """  # noqa: RUF002
+    job = task.job
+    with active(job), document_usage(sender(job.source), job.file_dto.name, job.usage) as account:
+        try:
+            agent.process_file(task.file_id)
+        except BudgetExceededError as e:
+            log.error("Файл %s: %s", job.file_dto.name, e)
+            jobs.update(job, JobStage.FAILED, str(e))
+        except Exception as e:
+            task.error = e
+    jobs.save_usage(job, account.summary())
+    log.info("Расход на файл %s: %s", job.file_dto.name, account.summary())
+
+
+def cleanup(agent: KeyRatesAgentInterface, task: Task) -> None:
+    """Этап удаления: удалить файл из модели, записать итог задания и освободить аренду."""
+    job = task.job
+    try:
+        with active(job):
+            agent.delete_file(task.file_id)
+    except Exception as e:
+        task.error = task.error or e
+    finally:
+        try:
+            if task.error is not None:
+                jobs.update(job, job.stage, repr(task.error))
+            elif not job.finished and job.error is None:
+                jobs.update(job, JobStage.DONE)
+            DOCUMENT_SECONDS.observe(time.perf_counter() - task.started, outcome=_outcome(task))
+        finally:
+            # Аренда освобождается, даже если итог не записан: иначе её продлевали бы до остановки сервиса
+            task.resources.close()
+            job.lease = None
+
+
+def _outcome(task: Task) -> str:
+    """Итог задания для метрик: ошибка, финальный этап или отложено до следующего запуска."""
+    if task.error is not None:
+        return "error"
+    return task.job.stage.value if task.job.finished else "postponed"
+
+
+def _skipped(job: Job, classifier: DocumentClassifier | None) -> bool:
+    if classifier is None or job.stage != JobStage.FETCHED or job.attempts:
+        return False
+
+    verdict = classifier.classify(job.file_dto.content)
+    if verdict.relevant:
+        return False
+
+    jobs.update(job, JobStage.SKIPPED, str(verdict))
+    log.info("Файл %s пропущен: %s", job.file_dto.name, verdict)
+    return True
+
+
+def _startable(job: Job) -> bool:
+    if job.attempts >= MAX_ATTEMPTS:
+        jobs.update(job, JobStage.FAILED, f"{MAX_ATTEMPTS} attempts exhausted: {job.error}")
+        log.error("Файл %s не обработан за %d запусков: %s", job.file_dto.name, MAX_ATTEMPTS, job.error)
+        return False
+
+    if job.checkpoint is not None:
+        log.info("Файл %s продолжается после %d шагов модели", job.file_dto.name, job.steps)
+    return True
+
+
+def email_source(email: EmailDTO) -> str:
+    """Идентификатор письма для ключа задания."""
+    return f"{email.sender}|{email.recived_at.isoformat()}|{email.subject}"
+
+
+def sender(source: str) -> str:
+    """Адрес отправителя из идентификатора письма."""
+    name = source.split("|", 1)[0]
+    return parseaddr(name)[1].lower() or name
+
+
+class Pipeline:
+    """Конвейер заданий: загрузка, обработка и удаление файлов выполняются в отдельных потоках.
+
+    Между этапами - очереди глубиной `depth`: пока модель обрабатывает файл, следующий уже загружается,
+    а удаление обработанного файла не задерживает обработку следующего.
+    Если очередь этапа заполнена, предыдущий этап ждёт, поэтому заранее загружается не больше `depth + 1` файлов.
+    """  # noqa: RUF002
+
+    def __init__(
+        self: Self,
+        agent: KeyRatesAgentInterface,
+        classifier: DocumentClassifier | None = None,
+        depth: int | None = None,
+    ) -> None:
+        """Запустить потоки этапов.
+
+        Args:
+            agent (KeyRatesAgentInterface): Агент.
+            classifier (DocumentClassifier | None): Отбор документов перед первым запуском задания.
+            depth (int | None): Глубина очередей, по умолчанию - из настроек.
+        """
+        self._agent = agent
+        self._classifier = classifier
+        depth = depth or settings.depth
+        self._inbox: Queue[Job | None] = Queue(depth)
+        self._uploaded: Queue[Task | None] = Queue(depth)
+        self._processed: Queue[Task | None] = Queue(depth)
+        self._in_flight: set[str] = set()
+        self._idle = threading.Condition()
+        self._threads = [
+            threading.Thread(target=target, name=f"pipeline-{stage}", daemon=True)
+            for stage, target in zip(STAGES, (self._upload, self._process, self._cleanup), strict=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self: Self, job: Job) -> bool:
+        """Поставить задание в очередь; ждёт, если очередь загрузки заполнена.
+
+        Returns:
+            bool: False - задание уже в конвейере.
+        """
+        with self._idle:
+            if job.key in self._in_flight:
+                return False
+            self._in_flight.add(job.key)
+        self._inbox.put(job)
+        return True
+
+    def submit_email(self: Self, email: EmailDTO) -> None:
+        """Создать задания для PDF-вложений письма и поставить их в очередь."""
+        source = email_source(email)
+        for attachment in email.attachments:
+            if attachment.type_ == "pdf":
+                self.submit(jobs.add(source, attachment))
+
+    def resume(self: Self) -> None:
+        """Поставить в очередь прерванные задания: свои и брошенные остановившимися экземплярами."""
+        submitted = sum(self.submit(job) for job in jobs.pending())
+        if submitted:
+            log.info("Незавершённых заданий: %d", submitted)
+
+    def depths(self: Self) -> dict[PipelineStage, int]:
+        """Заданий в очереди перед каждым этапом."""
+        return {"upload": self._inbox.qsize(), "process": self._uploaded.qsize(), "cleanup": self._processed.qsize()}
+
+    def wait(self: Self, timeout: float | None = None) -> bool:
+        """Дождаться завершения всех поставленных заданий.
+
+        Returns:
+            bool: False - истекло время ожидания.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._in_flight, timeout)
+
+    def close(self: Self) -> None:
+        """Дождаться уже поставленных заданий и остановить потоки."""
+        self._inbox.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _done(self: Self, job: Job) -> None:
+        with self._idle:
+            self._in_flight.discard(job.key)
+            self._idle.notify_all()
+
+    def _upload(self: Self) -> None:
+        while (job := self._inbox.get()) is not None:
+            try:
+                task = upload(self._agent, job, self._classifier)
+            except Exception:
+                log.exception("Задание %s прервано при загрузке", job.file_dto.name)
+                task = None
+            if task is None:
+                self._done(job)
+            else:
+                self._uploaded.put(task)
+        self._uploaded.put(None)
+
+    def _process(self: Self) -> None:
+        while (task := self._uploaded.get()) is not None:
+            try:
+                process(self._agent, task)
+            except Exception as e:
+                log.exception("Задание %s прервано при обработке", task.job.file_dto.name)
+                task.error = task.error or e
+            self._processed.put(task)
+        self._processed.put(None)
+
+    def _cleanup(self: Self) -> None:
+        while (task := self._processed.get()) is not None:
+            try:
+                cleanup(self._agent, task)
+            except Exception:
+                log.exception("Не удалось завершить задание %s", task.job.file_dto.name)
+            if task.error is not None:
+                log.error("Задание %s прервано", task.job.file_dto.name, exc_info=task.error)
+            self._done(task.job)
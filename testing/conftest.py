@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+import pytest
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+CELL_WIDTH = 120
+CELL_HEIGHT = 20
+
+
+@dataclass
+class PageSpec:
+    """Описание страницы тестового PDF."""
+
+    lines: list[str] = field(default_factory=list)  # Строки текста сверху вниз
+    table: list[list[str]] | None = None  # Таблица с линиями сетки, первая строка - заголовок  # noqa: RUF003
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _page_stream(page: PageSpec) -> bytes:
+    ops: list[str] = []
+    y = PAGE_HEIGHT - 60
+    for line in page.lines:
+        ops.append(f"BT /F1 12 Tf 50 {y} Td ({_escape(line)}) Tj ET")
+        y -= 20
+
+    if page.table:
+        top = y - 20
+        rows, cols = len(page.table), len(page.table[0])
+        bottom = top - rows * CELL_HEIGHT
+        right = 50 + cols * CELL_WIDTH
+        ops.extend(f"50 {top - r * CELL_HEIGHT} m {right} {top - r * CELL_HEIGHT} l S" for r in range(rows + 1))
+        ops.extend(f"{50 + c * CELL_WIDTH} {top} m {50 + c * CELL_WIDTH} {bottom} l S" for c in range(cols + 1))
+        for r, row in enumerate(page.table):
+            for c, cell in enumerate(row):
+                x, cy = 55 + c * CELL_WIDTH, top - (r + 1) * CELL_HEIGHT + 6
+                ops.append(f"BT /F1 10 Tf {x} {cy} Td ({_escape(cell)}) Tj ET")
+
+    return "\n".join(ops).encode("latin-1")
+
+
+def build_pdf(pages: list[PageSpec]) -> bytes:
+    """Собрать минимальный PDF: текст шрифтом Helvetica и таблицы с линиями сетки."""  # noqa: RUF002
+    objects: list[bytes] = []
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for pid, page in zip(page_ids, pages, strict=True):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {pid + 1} 0 R >>".encode(),
+        )
+        stream = _page_stream(page)
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+@pytest.fixture
+def rates_pdf() -> bytes:
+    """PDF из трёх страниц: текст, таблица ставок, текст."""
+    return build_pdf(
+        [
+            PageSpec(lines=["Monthly report", "Nothing interesting here"]),
+            PageSpec(
+                lines=["Key rates from 01.07.2025"],
+                table=[["Term", "Rate", "Spread"], ["1M", "20.50", "0.15"], ["3M", "20.75", ""]],
+            ),
+            PageSpec(lines=["Signature"]),
+        ],
+    )
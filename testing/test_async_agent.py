@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from typing import Self
+
+import pytest
+
+from src.agents import AGENTS, load_agent
+from src.core.async_agent import BlockingAgent, ThreadedAgent, as_async, as_sync, handle_document
+from src.dto import FileDTO
+
+DELAY = 0.2  # Секунд на обработку одного файла
+
+
+class SyncAgent:
+    """Синхронный агент, который записывает вызовы."""
+
+    name = "sync"
+
+    def __init__(self: Self) -> None:  # noqa: D107
+        self.calls: list[str] = []
+
+    def load_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
+        self.calls.append(f"load {file_dto.name}")
+        return None, file_dto.name
+
+    def process_file(self: Self, file_id: str) -> None:  # noqa: D102
+        time.sleep(DELAY)
+        self.calls.append(f"process {file_id}")
+
+    def delete_file(self: Self, file_id: str) -> None:  # noqa: D102
+        self.calls.append(f"delete {file_id}")
+
+
+class AsyncAgent:
+    """Асинхронный агент, который записывает вызовы и падает на файле `bad`."""
+
+    name = "async"
+
+    def __init__(self: Self) -> None:  # noqa: D107
+        self.calls: list[str] = []
+        self.threads: set[str] = set()
+
+    async def aload_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
+        if not file_dto.content:
+            return "empty", None
+        return None, file_dto.name
+
+    async def aprocess_file(self: Self, file_id: str) -> None:  # noqa: D102
+        self.threads.add(threading.current_thread().name)
+        await asyncio.sleep(DELAY)
+        if file_id == "bad":
+            msg = "model error"
+            raise RuntimeError(msg)
+        self.calls.append(f"process {file_id}")
+
+    async def adelete_file(self: Self, file_id: str) -> None:  # noqa: D102
+        self.calls.append(f"delete {file_id}")
+
+
+def _file(name: str, content: bytes = b"%PDF") -> FileDTO:
+    return FileDTO(name=name, content=content, type_="pdf")
+
+
+class TestAsyncAgent:
+    """Тесты для асинхронного интерфейса агентов."""
+
+    def test_sync_agent_runs_concurrently(self: Self) -> None:
+        """Синхронный агент через адаптер обрабатывает файлы одновременно."""
+        agent = SyncAgent()
+        async_agent = as_async(agent)
+        assert isinstance(async_agent, ThreadedAgent)
+        assert async_agent.name == "sync"
+
+        async def run() -> list[str | None]:
+            return await asyncio.gather(*(handle_document(async_agent, _file(f"f{i}")) for i in range(4)))
+
+        start = time.monotonic()
+        assert asyncio.run(run()) == [None] * 4
+        assert time.monotonic() - start < DELAY * 3
+        assert agent.calls.count("delete f3") == 1
+
+    def test_async_agent_used_synchronously(self: Self) -> None:
+        """Асинхронный агент через адаптер работает как синхронный."""
+        agent = AsyncAgent()
+        sync_agent = as_sync(agent)
+        assert isinstance(sync_agent, BlockingAgent)
+        try:
+            assert sync_agent.load_file(_file("a")) == (None, "a")
+            sync_agent.process_file("a")
+            sync_agent.delete_file("a")
+        finally:
+            sync_agent.close()
+        assert agent.calls == ["process a", "delete a"]
+        assert agent.threads == {"agent-loop"}
+
+    def test_file_deleted_on_error(self: Self) -> None:
+        """Файл удаляется из модели, даже если обработка упала."""
+        agent = AsyncAgent()
+        assert as_async(agent) is agent
+        with pytest.raises(RuntimeError):
+            asyncio.run(handle_document(agent, _file("bad")))
+        assert agent.calls == ["delete bad"]
+        assert asyncio.run(handle_document(agent, _file("empty", b""))) == "empty"
+
+    def test_not_an_agent(self: Self) -> None:
+        """Объект без методов агента не принимается."""
+        with pytest.raises(TypeError, match="neither sync nor async"):
+            as_async(object())  # type: ignore[arg-type]
+
+    @pytest.mark.parametrize("mode", list(AGENTS))
+    def test_agents_implement_both(self: Self, mode: str) -> None:
+        """Все агенты реализуют оба интерфейса и используются без адаптеров."""  # noqa: RUF002
+        agent_class = load_agent(mode)
+        assert as_async(agent_class) is agent_class  # type: ignore[arg-type]
+        assert as_sync(agent_class) is agent_class
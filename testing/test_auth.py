@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from http import HTTPStatus
+from typing import Self
+
+import httpx
+from gigachat.models import AccessToken
+
+from src.agents._gigachat.auth import SharedTokenGigaChat, TokenManager
+
+FIRST, SECOND = "token-1", "token-2"
+
+
+class FakeAuth:
+    """Сервер авторизации со счётчиком запросов."""  # noqa: RUF002
+
+    def __init__(self: Self, lifetime: float, delay: float = 0.0) -> None:  # noqa: D107
+        self.lifetime = lifetime
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self: Self) -> AccessToken:  # noqa: D102
+        time.sleep(self.delay)
+        self.calls += 1
+        return AccessToken(access_token=f"token-{self.calls}", expires_at=int((time.time() + self.lifetime) * 1000))
+
+
+class TestTokenManager:
+    """Тесты для общего токена GigaChat."""
+
+    def test_token_reused(self: Self) -> None:
+        """Действующий токен не запрашивается повторно."""
+        auth = FakeAuth(lifetime=600)
+        tokens = TokenManager(auth, margin=60)
+        assert tokens.get().access_token == FIRST
+        assert tokens.get().access_token == FIRST
+        assert auth.calls == 1
+        assert 590 < tokens.time_left() <= 600  # noqa: PLR2004
+
+    def test_proactive_refresh(self: Self) -> None:
+        """Токен обновляется заранее, когда до истечения остаётся меньше запаса."""
+        auth = FakeAuth(lifetime=30)
+        tokens = TokenManager(auth, margin=60)
+        tokens.get()
+        assert tokens.get().access_token == SECOND
+        assert tokens.refreshes == 2  # noqa: PLR2004
+
+    def test_single_refresh_for_threads(self: Self) -> None:
+        """Одновременные запросы токена приводят к одному обращению к серверу."""
+        auth = FakeAuth(lifetime=600, delay=0.1)
+        tokens = TokenManager(auth, margin=60)
+        results: list[str] = []
+        threads = [threading.Thread(target=lambda: results.append(tokens.get().access_token)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+        assert auth.calls == 1
+        assert set(results) == {FIRST}
+
+    def test_invalidate_once(self: Self) -> None:
+        """Отклонённый токен заменяется один раз, даже если об отказе сообщили несколько клиентов."""  # noqa: RUF002
+        auth = FakeAuth(lifetime=600)
+        tokens = TokenManager(auth, margin=60)
+        stale = tokens.get().access_token
+        assert tokens.invalidate(stale).access_token == SECOND
+        assert tokens.invalidate(stale).access_token == SECOND
+        assert auth.calls == 2  # noqa: PLR2004
+
+
+class TestSharedTokenGigaChat:
+    """Тесты для клиента с общим токеном."""  # noqa: RUF002
+
+    @staticmethod
+    def _client(auth: FakeAuth, rejected: set[str]) -> SharedTokenGigaChat:
+        """Клиент, для которого сервер отвечает 401 на токены из `rejected`."""
+
+        def handle(request: httpx.Request) -> httpx.Response:
+            if request.headers["Authorization"].removeprefix("Bearer ") in rejected:
+                return httpx.Response(HTTPStatus.UNAUTHORIZED, json={"message": "Token has expired"})
+            return httpx.Response(HTTPStatus.OK, json={"balance": [{"usage": "GigaChat", "value": 100}]})
+
+        client = SharedTokenGigaChat(credentials="key", base_url="http://giga")
+        client._tokens = TokenManager(auth, margin=60)  # noqa: SLF001
+        client._client = httpx.Client(base_url="http://giga", transport=httpx.MockTransport(handle))  # noqa: SLF001
+        client._aclient = httpx.AsyncClient(  # noqa: SLF001
+            base_url="http://giga",
+            transport=httpx.MockTransport(handle),
+        )
+        return client
+
+    def test_rejected_token_replaced(self: Self) -> None:
+        """После ответа 401 запрос повторяется с новым токеном, а не с отклонённым из кэша."""  # noqa: RUF002
+        auth = FakeAuth(lifetime=600)
+        client = self._client(auth, rejected={FIRST})
+
+        assert client.get_balance().balance[0].value == 100  # noqa: PLR2004
+        assert client.token == SECOND
+        assert auth.calls == 2  # noqa: PLR2004
+
+    def test_rejected_token_replaced_async(self: Self) -> None:
+        """Асинхронный вызов тоже заменяет отклонённый токен."""
+        auth = FakeAuth(lifetime=600)
+        client = self._client(auth, rejected={FIRST})
+
+        assert asyncio.run(client.aget_balance()).balance[0].value == 100  # noqa: PLR2004
+        assert client.token == SECOND
+        assert auth.calls == 2  # noqa: PLR2004
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Annotated, Any, Self
+
+import pytest
+from google.genai import types as gtypes
+from pydantic import Field
+
+from src.agents._gemini import assistants
+from src.agents._gemini.assistants import MODEL_TIERS, KeyRatesAgent, ModelTier, Outcome
+from src.core.tools import ToolRegistry
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+LITE, FLASH = "lite", "flash"
+DOC_URL = "http://docapi"
+
+
+def _response(*parts: gtypes.Part) -> gtypes.GenerateContentResponse:
+    return gtypes.GenerateContentResponse(
+        candidates=[gtypes.Candidate(content=gtypes.Content(role="model", parts=list(parts)))],
+        usage_metadata=gtypes.GenerateContentResponseUsageMetadata(total_token_count=10),
+    )
+
+
+def _call(method: str, url: str) -> gtypes.Part:
+    return gtypes.Part(function_call=gtypes.FunctionCall(name="http_request", args={"method": method, "url": url}))
+
+
+def _text(text: str) -> gtypes.Part:
+    return gtypes.Part(text=text)
+
+
+class FakeModels:
+    """Модели, отвечающие по сценарию: функция от номера шага модели возвращает ответ."""
+
+    def __init__(self: Self, scripts: dict[str, Callable[[int], gtypes.GenerateContentResponse]]) -> None:  # noqa: D107
+        self.scripts = scripts
+        self.steps: dict[str, int] = dict.fromkeys(scripts, 0)
+        self.contents: dict[str, list[gtypes.Part]] = {}
+
+    def generate_content(self: Self, model: str, contents: list[gtypes.Part], config: Any) -> Any:  # noqa: ANN401, ARG002, D102
+        self.steps[model] += 1
+        self.contents[model] = list(contents)
+        return self.scripts[model](self.steps[model])
+
+
+class AsyncFakeModels:
+    """Асинхронный доступ к тем же сценариям."""
+
+    def __init__(self: Self, models: FakeModels) -> None:  # noqa: D107
+        self._models = models
+
+    async def generate_content(self: Self, **kwargs: Any) -> Any:  # noqa: ANN401, D102
+        return self._models.generate_content(**kwargs)
+
+
+@pytest.fixture
+def make_agent(monkeypatch: pytest.MonkeyPatch) -> Callable[..., tuple[KeyRatesAgent, FakeModels]]:
+    """Агент с каскадом из двух моделей, поддельными моделями и сервером."""  # noqa: RUF002
+    registry = ToolRegistry()
+
+    @registry.tool
+    def http_request(
+        method: Annotated[str, Field(description="Method")],
+        url: Annotated[str, Field(description="URL")],
+    ) -> tuple[int, str]:
+        """Сервер, принимающий любые запросы."""
+        return (201 if method == "POST" else 200), f"{method} {url}"
+
+    monkeypatch.setattr(assistants, "registry", registry)
+    monkeypatch.setattr(assistants, "STEP_PAUSE", 0)
+    monkeypatch.setattr(assistants, "MODEL_TIERS", (ModelTier(LITE, max_steps=3), ModelTier(FLASH, max_steps=5)))
+
+    def make(scripts: dict[str, Callable[[int], gtypes.GenerateContentResponse]]) -> tuple[KeyRatesAgent, FakeModels]:
+        agent = KeyRatesAgent("key", DOC_URL, "", "")
+        models = FakeModels(scripts)
+        agent._model = SimpleNamespace(models=models, aio=SimpleNamespace(models=AsyncFakeModels(models)))  # type: ignore[assignment]  # noqa: SLF001
+        return agent, models
+
+    return make
+
+
+def _loads_data(step: int) -> gtypes.GenerateContentResponse:
+    """Сценарий успешной обработки: документация, загрузка, завершение."""
+    if step == 1:
+        return _response(_call("GET", f"{DOC_URL}/attrs"))
+    if step == 2:  # noqa: PLR2004
+        return _response(_call("POST", f"{DOC_URL}/rates"))
+    return _response(_text(assistants.STOP_WORD))
+
+
+class TestCascade:
+    """Тесты для каскада моделей Gemini."""
+
+    def test_cheap_model_is_enough(self: Self, make_agent: Callable[..., tuple[KeyRatesAgent, FakeModels]]) -> None:
+        """Простой документ обрабатывает первая модель, следующая не вызывается."""
+        agent, models = make_agent({LITE: _loads_data, FLASH: _loads_data})
+        agent.process_file("file")
+        assert models.steps == {LITE: 3, FLASH: 0}
+        assert agent.tier_stats[LITE].success_rate == 1.0
+
+    def test_escalation_on_error_keeps_context(
+        self: Self,
+        make_agent: Callable[..., tuple[KeyRatesAgent, FakeModels]],
+    ) -> None:
+        """После ERROR файл передаётся следующей модели вместе с уже полученными данными."""  # noqa: RUF002
+
+        def fails(step: int) -> gtypes.GenerateContentResponse:
+            if step == 1:
+                return _response(_call("GET", f"{DOC_URL}/attrs"))
+            return _response(_text(f"{assistants.ERROR_WORD}: нет атрибута"))
+
+        agent, models = make_agent({LITE: fails, FLASH: _loads_data})
+        agent.process_file("file")
+        assert agent.tier_stats[LITE].outcomes == {Outcome.ERROR: 1}
+        assert agent.tier_stats[FLASH].outcomes == {Outcome.DONE: 1}
+        first = models.contents[FLASH]
+        assert f"({LITE})" in str(first[2].text)
+        assert Outcome.ERROR in str(first[2].text)
+        assert first[3].function_call is not None
+        assert first[4].function_response is not None
+        assert first[4].function_response.response == {"status": 200, "data": f"GET {DOC_URL}/attrs"}
+
+    def test_escalation_on_budget_and_invalid(
+        self: Self,
+        make_agent: Callable[..., tuple[KeyRatesAgent, FakeModels]],
+    ) -> None:
+        """Исчерпание шагов и завершение без загрузки данных ведут к следующей модели."""
+        agent, models = make_agent(
+            {
+                LITE: lambda _: _response(_call("GET", f"{DOC_URL}/attrs")),
+                FLASH: lambda _: _response(_text(assistants.STOP_WORD)),
+            },
+        )
+        agent.process_file("file")
+        assert models.steps == {LITE: 3, FLASH: 1}
+        assert agent.tier_stats[LITE].outcomes == {Outcome.BUDGET: 1}
+        assert agent.tier_stats[FLASH].outcomes == {Outcome.INVALID: 1}
+
+    def test_explicit_model_without_cascade(self: Self) -> None:
+        """Указанная модель работает без каскада."""
+        agent = KeyRatesAgent("key", DOC_URL, "", "", model="gemini-2.5-pro")
+        assert list(agent.tier_stats) == ["gemini-2.5-pro"]
+        assert len(KeyRatesAgent("key", DOC_URL, "", "").tier_stats) == len(MODEL_TIERS)
+
+    def test_async_writes_are_sequential(
+        self: Self,
+        make_agent: Callable[..., tuple[KeyRatesAgent, FakeModels]],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """Записи одного шага в асинхронном режиме выполняются по очереди и в порядке, заданном моделью."""
+        active: list[str] = []
+        done: list[str] = []
+        overlaps: list[bool] = []
+        registry = ToolRegistry()
+
+        @registry.tool
+        def http_request(
+            method: Annotated[str, Field(description="Method")],  # noqa: ARG001
+            url: Annotated[str, Field(description="URL")],
+        ) -> tuple[int, str]:
+            """Сервер, отмечающий одновременные запросы."""
+            overlaps.append(bool(active))
+            active.append(url)
+            time.sleep(0.05)
+            active.remove(url)
+            done.append(url)
+            return 201, url
+
+        monkeypatch.setattr(assistants, "registry", registry)
+
+        def writes(step: int) -> gtypes.GenerateContentResponse:
+            if step == 1:
+                return _response(_call("POST", f"{DOC_URL}/rates/1"), _call("post", f"{DOC_URL}/rates/2"))
+            return _response(_text(assistants.STOP_WORD))
+
+        agent, _ = make_agent({LITE: writes, FLASH: writes})
+        asyncio.run(agent.aprocess_file("file"))
+        assert done == [f"{DOC_URL}/rates/1", f"{DOC_URL}/rates/2"]
+        assert overlaps == [False, False]
+        assert agent.tier_stats[LITE].outcomes == {Outcome.DONE: 1}
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Self
+
+from src.core.classifier import DocumentClassifier, LinearModel, extract_features
+from src.core.pdf import pdf_to_dict
+from testing.conftest import PageSpec, build_pdf
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+INVOICE = build_pdf(
+    [PageSpec(lines=["Invoice No 17", "Payment for services", "Total 1200.00 RUB", "Signature"])],
+)
+
+
+class TestDocumentClassifier:
+    """Тесты для локального отбора документов."""
+
+    def test_rates_document_is_relevant(self: Self, rates_pdf: bytes) -> None:
+        """Документ с таблицей ставок и датой проходит проверку."""  # noqa: RUF002
+        verdict = DocumentClassifier().classify(rates_pdf)
+        assert verdict.relevant
+        assert verdict.score > 0.5  # noqa: PLR2004
+
+    def test_contract_words_do_not_reject_rates(self: Self, rates_pdf: bytes) -> None:
+        """Упоминание договора и подписи в уведомлении о ставках не снижает оценку."""  # noqa: RUF002
+        data = pdf_to_dict(rates_pdf)
+        signed = {
+            **data,
+            "pages": [{**page, "text": f"{page['text']}\nСогласно договору. Подпись"} for page in data["pages"]],
+        }
+        assert DocumentClassifier().check(signed).score == DocumentClassifier().check(data).score
+
+    def test_invoice_is_rejected_with_reasons(self: Self) -> None:
+        """Счёт без таблиц отклоняется, причины указаны."""
+        verdict = DocumentClassifier().classify(INVOICE)
+        assert not verdict.relevant
+        assert "нет таблиц" in verdict.reasons
+        assert "нет ключевых слов" in verdict.reasons
+
+    def test_empty_document_is_rejected(self: Self) -> None:
+        """PDF без текста (скан) отклоняется."""
+        verdict = DocumentClassifier().classify(build_pdf([PageSpec()]))
+        assert not verdict.relevant
+        assert verdict.reasons == ["нет текстового слоя (скан или изображение)"]
+
+    def test_broken_pdf_is_rejected(self: Self) -> None:
+        """Повреждённый файл не прерывает обработку."""
+        assert not DocumentClassifier().classify(b"not a pdf").relevant
+
+
+class TestLinearModel:
+    """Тесты для обучаемой модели отбора."""
+
+    def test_fit_save_load(self: Self, rates_pdf: bytes, tmp_path: Path) -> None:
+        """Обученная модель разделяет примеры и переживает сохранение."""
+        relevant = extract_features(pdf_to_dict(rates_pdf))
+        other = extract_features(pdf_to_dict(INVOICE))
+        model = LinearModel.fit([(relevant, True), (other, False)])
+        model.save(tmp_path / "model.json")
+
+        classifier = DocumentClassifier.from_config(tmp_path / "model.json", threshold=0.5)
+        assert classifier.classify(rates_pdf).relevant
+        assert not classifier.classify(INVOICE).relevant
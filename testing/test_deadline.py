@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from typing import Annotated, Self
+
+import pytest
+from pydantic import Field
+
+from src.agents.router import AgentRouter, Backend, BackendSpec
+from src.core import deadline
+from src.core.deadline import (
+    DeadlineExceededError,
+    DeadlineSettings,
+    arun_stage,
+    document_deadline,
+    run_stage,
+    stage_timeout,
+)
+from src.core.tools import ToolRegistry
+from src.dto import FileDTO
+
+SHORT = 0.05  # Секунд на этап в тестах
+
+
+@pytest.fixture(autouse=True)
+def short_stages(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Короткие ограничения этапов."""
+    monkeypatch.setattr(deadline, "settings", DeadlineSettings(document=1.0, upload=SHORT, step=SHORT, delete=SHORT))
+
+
+class HangingAgent:
+    """Агент, у которого зависает запрос к модели."""  # noqa: RUF002
+
+    def __init__(self: Self) -> None:  # noqa: D107
+        self.deleted: list[str] = []
+
+    def load_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
+        return None, run_stage("upload", lambda: file_dto.name)
+
+    def process_file(self: Self, file_id: str) -> None:  # noqa: ARG002, D102
+        run_stage("step", time.sleep, 1)
+
+    def delete_file(self: Self, file_id: str) -> None:  # noqa: D102
+        run_stage("delete", self.deleted.append, file_id)
+
+
+class TestDeadline:
+    """Тесты для сроков обработки документа."""
+
+    def test_stage_timeout(self: Self) -> None:
+        """Зависший этап прерывается, в ошибке указаны этап и сработавшее ограничение."""
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceededError, match="step timeout") as error:
+            run_stage("step", time.sleep, 1)
+        assert error.value.stage == "step"
+        assert time.monotonic() - start < 0.5  # noqa: PLR2004
+
+    def test_document_deadline_limits_stages(self: Self) -> None:
+        """Этап не может длиться дольше, чем осталось до срока документа."""
+        with document_deadline(0.02) as outer:
+            with document_deadline() as inner:
+                assert inner is outer
+            assert stage_timeout("step") <= 0.02  # noqa: PLR2004
+            with pytest.raises(DeadlineExceededError, match="document deadline"):
+                run_stage("step", time.sleep, 1)
+            with pytest.raises(DeadlineExceededError, match="passed"):
+                stage_timeout("tool")
+            # Удаление выполняется и после срока документа
+            assert stage_timeout("delete") == SHORT
+        assert deadline.current() is None
+
+    def test_async_stage_cancelled(self: Self) -> None:
+        """Асинхронный этап отменяется по истечении времени."""
+        cancelled = []
+
+        async def hang() -> None:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        with pytest.raises(DeadlineExceededError, match="step timeout"):
+            asyncio.run(arun_stage("step", hang()))
+        assert cancelled == [True]
+
+    def test_own_timeout_not_relabelled(self: Self) -> None:
+        """TimeoutError самого этапа и ошибка срока вложенного этапа передаются как есть."""
+
+        def fails() -> None:
+            msg = "server timeout"
+            raise TimeoutError(msg)
+
+        async def afails() -> None:
+            fails()
+
+        with pytest.raises(TimeoutError, match="server timeout") as error:
+            run_stage("step", fails)
+        assert not isinstance(error.value, DeadlineExceededError)
+        with pytest.raises(TimeoutError, match="server timeout") as error:
+            asyncio.run(arun_stage("step", afails()))
+        assert not isinstance(error.value, DeadlineExceededError)
+
+        async def nested() -> None:
+            await arun_stage("upload", asyncio.sleep(1))
+
+        with pytest.raises(DeadlineExceededError) as nested_error:
+            asyncio.run(arun_stage("tool", nested()))
+        assert nested_error.value.stage == "upload"
+
+    def test_late_result_released(self: Self) -> None:
+        """Результат этапа, завершившегося после истечения времени, передаётся на освобождение."""
+        released: list[str] = []
+        done = threading.Event()
+
+        def upload() -> str:
+            time.sleep(SHORT * 3)
+            return "files/1"
+
+        def release(uri: str) -> None:
+            released.append(uri)
+            done.set()
+
+        with pytest.raises(DeadlineExceededError, match="upload timeout"):
+            run_stage("upload", upload, on_late=release)
+        assert done.wait(timeout=5)
+        assert released == ["files/1"]
+
+    def test_abandoned_stage_starts_no_tools(self: Self) -> None:
+        """Брошенный по истечении времени шаг не начинает вызовы инструментов."""
+        attempts: list[BaseException | None] = []
+        done = threading.Event()
+
+        def step() -> None:
+            time.sleep(SHORT * 3)
+            try:
+                stage_timeout("tool")
+            except DeadlineExceededError as e:
+                attempts.append(e)
+            else:
+                attempts.append(None)
+            # Удаление файлов разрешено и в брошенном потоке
+            attempts.append(None if stage_timeout("delete") == SHORT else ValueError())
+            done.set()
+
+        with pytest.raises(DeadlineExceededError, match="step timeout"):
+            run_stage("step", step)
+        assert done.wait(timeout=5)
+        assert isinstance(attempts[0], DeadlineExceededError)
+        assert attempts[0].stage == "tool"
+        assert attempts[1] is None
+
+    def test_tool_sees_document_deadline(self: Self) -> None:
+        """Инструмент получает срок документа и ограничивается им."""
+        registry = ToolRegistry(default_timeout=10)
+        seen = []
+
+        @registry.tool
+        def probe(delay: Annotated[float, Field(description="Delay")]) -> None:
+            """Запомнить срок и подождать."""
+            seen.append(deadline.current())
+            time.sleep(delay)
+
+        with document_deadline(0.1) as current:
+            assert registry.call("probe", {"delay": 0}).ok
+            result = registry.call("probe", {"delay": 1})
+        assert seen == [current, current]
+        assert result.error == "timeout"
+        assert result.elapsed < 0.5  # noqa: PLR2004
+
+    def test_router_reports_deadline(self: Self, caplog: pytest.LogCaptureFixture) -> None:
+        """Маршрутизатор прерывает документ, удаляет файл из модели и сообщает причину."""
+        agent = HangingAgent()
+        router = AgentRouter([Backend(BackendSpec("G"), agent)])
+        _, file_id = router.load_file(FileDTO(type_="pdf", name="rates.pdf", content=b"%PDF"))
+        assert file_id is not None
+        router.process_file(file_id)
+        assert agent.deleted == ["rates.pdf"]
+        assert router.backends[0].stats.error_rate == 1.0
+        assert "step timeout" in caplog.text
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Self
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+BACKENDS = ("google.genai", "gigachat", "langchain_core", "langchain_gigachat", "langgraph")
+HEAVY = ("pandas", "pdfplumber", *BACKENDS)
+MAX_IMPORT_SECONDS = 0.3  # Порог взят про запас: без ленивой загрузки импорт занимает секунды
+
+
+def _loaded(code: str) -> set[str]:
+    """Какие тяжёлые модули загружены после выполнения кода в чистом интерпретаторе."""
+    script = f"import json, sys\n{code}\nprint(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True)  # noqa: S603
+    modules = json.loads(result.stdout.splitlines()[-1])
+    return {name for name in HEAVY if name in modules}
+
+
+def _import_seconds(module: str) -> float:
+    """Общее время импорта модуля по `-X importtime`."""
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    line = next(line for line in reversed(result.stderr.splitlines()) if line.rstrip().endswith(f"| {module}"))
+    return int(line.split("|")[1]) / 1_000_000
+
+
+class TestLazyImport:
+    """Тесты для ленивой загрузки агентов."""
+
+    def test_package_is_light(self: Self) -> None:
+        """Пакет агентов и классификатор не загружают SDK моделей и разбор PDF."""
+        assert _loaded("import src.agents, src.core.classifier") == set()
+
+    @pytest.mark.parametrize(
+        ("mode", "expected"),
+        [
+            ("G", {"google.genai"}),
+            ("S", {"gigachat"}),
+            ("SL", {"gigachat", "langchain_core", "langchain_gigachat", "langgraph"}),
+        ],
+    )
+    def test_only_selected_backend(self: Self, mode: str, expected: set[str]) -> None:
+        """Выбор режима загружает только нужный агент."""
+        loaded = _loaded(f"from src.agents import load_agent\nload_agent({mode!r})")
+        assert loaded & set(BACKENDS) == expected
+        assert "pandas" not in loaded
+
+    def test_import_time(self: Self) -> None:
+        """Импорт пакета агентов остаётся быстрым."""
+        assert _import_seconds("src.agents") < MAX_IMPORT_SECONDS
+
+    def test_old_names(self: Self) -> None:
+        """Прежние имена классов доступны."""
+        import src.agents  # noqa: PLC0415
+
+        assert src.agents.GeminiKeyRatesAgent is src.agents.load_agent("G")
+        with pytest.raises(ValueError, match="Unknown mode"):
+            src.agents.load_agent("X")
+        with pytest.raises(AttributeError):
+            _ = src.agents.Missing
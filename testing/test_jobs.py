@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import datetime as dt
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Annotated, Any, Self
+
+import pytest
+from google.genai import types as gtypes
+from pydantic import Field
+
+from src import pipeline
+from src.agents._gemini import assistants
+from src.agents._gemini.assistants import KeyRatesAgent, ModelTier
+from src.core.classifier import DocumentClassifier
+from src.core.tools import ToolRegistry
+from src.dao import jobs as jobs_module
+from src.dao.jobs import MAX_ATTEMPTS, JobStage, JobStore, active
+from src.dto import EmailDTO, FileDTO
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+DOC_URL = "http://docapi"
+FILE = FileDTO(type_="pdf", name="rates.pdf", content=b"%PDF")
+
+
+@pytest.fixture
+def store(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> JobStore:
+    """Открытое хранилище во временном каталоге, подменяющее общее."""
+    store = JobStore()
+    store.open(tmp_path / "jobs.sqlite3", dt.timedelta(hours=1))
+    monkeypatch.setattr(jobs_module, "jobs", store)
+    monkeypatch.setattr(pipeline, "jobs", store)
+    return store
+
+
+class FakeAgent:
+    """Агент, который обрабатывает файлы или падает с заданной ошибкой."""  # noqa: RUF002
+
+    def __init__(self: Self, error: Exception | None = None) -> None:  # noqa: D107
+        self.error = error
+        self.processed: list[str] = []
+
+    def load_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
+        return None, file_dto.name
+
+    def process_file(self: Self, file_id: str) -> None:  # noqa: D102
+        if self.error is not None:
+            raise self.error
+        self.processed.append(file_id)
+
+    def delete_file(self: Self, file_id: str) -> None:  # noqa: D102
+        pass
+
+
+class CrashingModels:
+    """Модель, которая читает документацию, записывает данные и завершает работу; может упасть на заданном шаге."""
+
+    def __init__(self: Self, crash_at: int | None = None) -> None:  # noqa: D107
+        self.crash_at = crash_at
+        self.calls: list[list[gtypes.Part]] = []
+
+    def generate_content(self: Self, model: str, contents: list[gtypes.Part], config: Any) -> Any:  # noqa: ANN401, ARG002, D102
+        self.calls.append(list(contents))
+        step = sum(part.function_call is not None for part in contents) + 1
+        if step == self.crash_at:
+            msg = "process killed"
+            raise RuntimeError(msg)
+        if step == 1:
+            part = gtypes.Part(function_call=gtypes.FunctionCall(name="http_request", args={"method": "GET"}))
+        elif step == 2:  # noqa: PLR2004
+            part = gtypes.Part(function_call=gtypes.FunctionCall(name="http_request", args={"method": "POST"}))
+        else:
+            part = gtypes.Part(text=assistants.STOP_WORD)
+        return gtypes.GenerateContentResponse(
+            candidates=[gtypes.Candidate(content=gtypes.Content(role="model", parts=[part]))],
+            usage_metadata=gtypes.GenerateContentResponseUsageMetadata(total_token_count=10),
+        )
+
+
+class TestJobStore:
+    """Тесты для хранилища заданий."""
+
+    def test_jobs_survive_restart(self: Self, tmp_path: Path) -> None:
+        """Задания, контрольные точки и позиция чтения почты сохраняются между запусками."""
+        store = JobStore()
+        store.open(tmp_path / "jobs.sqlite3", dt.timedelta(hours=1))
+        job = store.add("mail-1", FILE)
+        store.save_checkpoint(job, {"steps": 2}, steps=2, tool_calls=1)
+        done = store.add("mail-2", FILE)
+        store.update(done, JobStage.DONE)
+        store.set_cursor("mail", "2025-07-01T00:00:00+00:00")
+        store.close()
+
+        store.open(tmp_path / "jobs.sqlite3", dt.timedelta(hours=1))
+        assert [(job.key, job.stage, job.checkpoint) for job in store.pending()] == [
+            (job.key, JobStage.PROCESSING, {"steps": 2}),
+        ]
+        assert store.add("mail-2", FILE).stage == JobStage.DONE
+        assert store.pending()[0].file_dto == FILE
+        assert store.cursor("mail") == "2025-07-01T00:00:00+00:00"
+
+    def test_interrupted_job_retried_until_limit(self: Self, store: JobStore) -> None:
+        """Прерванное задание остаётся незавершённым, после MAX_ATTEMPTS запусков считается неудачным."""
+        job = store.add("mail", FILE)
+        for _ in range(MAX_ATTEMPTS):
+            with pytest.raises(ConnectionError):
+                pipeline.process_job(FakeAgent(ConnectionError("reset")), job)
+        assert store.get(job.key).error == "ConnectionError('reset')"  # type: ignore[union-attr]
+
+        pipeline.process_job(FakeAgent(), job)
+        assert store.get(job.key).stage == JobStage.FAILED  # type: ignore[union-attr]
+        assert store.pending() == []
+
+    def test_email_processed_once(self: Self, store: JobStore, rates_pdf: bytes) -> None:
+        """Повторно прочитанное письмо не обрабатывается, нерелевантные файлы пропускаются."""
+        email = EmailDTO(
+            sender="bank@example.com",
+            subject="Ставки",
+            recived_at=dt.datetime(2025, 7, 1, tzinfo=dt.UTC),
+            text="",
+            attachments=[FileDTO(type_="pdf", name="rates.pdf", content=rates_pdf), FILE],
+        )
+        agent = FakeAgent()
+        conveyor = pipeline.Pipeline(agent, DocumentClassifier())  # type: ignore[arg-type]
+        for _ in range(2):
+            conveyor.submit_email(email)
+            assert conveyor.wait(timeout=5)
+        conveyor.close()
+        assert agent.processed == ["rates.pdf"]
+        assert store.add(pipeline.email_source(email), FILE).stage == JobStage.SKIPPED
+
+    def test_gemini_resumes_from_checkpoint(self: Self, store: JobStore, monkeypatch: pytest.MonkeyPatch) -> None:
+        """После падения диалог продолжается с контрольной точки: выполненные шаги не повторяются."""  # noqa: RUF002
+        registry = ToolRegistry()
+        writes = []
+
+        @registry.tool
+        def http_request(method: Annotated[str, Field(description="Method")]) -> tuple[int, str]:
+            """Сервер, принимающий любые запросы."""
+            writes.append(method)
+            return (201 if method == "POST" else 200), method
+
+        monkeypatch.setattr(assistants, "registry", registry)
+        monkeypatch.setattr(assistants, "STEP_PAUSE", 0)
+        monkeypatch.setattr(assistants, "MODEL_TIERS", (ModelTier("lite", max_steps=5),))
+
+        def agent(models: CrashingModels) -> KeyRatesAgent:
+            agent = KeyRatesAgent("key", DOC_URL, "", "")
+            agent._model = SimpleNamespace(models=models)  # type: ignore[assignment]  # noqa: SLF001
+            return agent
+
+        job = store.add("mail", FILE)
+        with active(job), pytest.raises(RuntimeError):
+            agent(CrashingModels(crash_at=3)).process_file("first-upload")
+
+        job = store.pending()[0]
+        assert (job.stage, job.steps, job.tool_calls) == (JobStage.PROCESSING, 2, 1)
+
+        models = CrashingModels()
+        with active(job):
+            agent(models).process_file("second-upload")
+        assert len(models.calls) == 1
+        assert models.calls[0][1].file_data.file_uri == "second-upload"  # type: ignore[union-attr]
+        assert writes == ["GET", "POST"]
+        assert store.get(job.key).checkpoint["outcome"] == "done"  # type: ignore[index, union-attr]
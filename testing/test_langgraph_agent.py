@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import datetime as dt
+from dataclasses import replace
+from typing import TYPE_CHECKING, Any, Self
+
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage  # noqa: TC002
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import tool
+from pydantic import Field
+
+from src.agents._gigachat.assistants import SYSTEM_PROMPT, KeyRatesAgent
+from src.core.matching import Candidate, MatchIndex
+from src.dao import jobs as jobs_module
+from src.dao.jobs import JobStage, JobStore, active
+from src.dto import FileDTO
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+FILE = FileDTO(type_="pdf", name="rates.pdf", content=b"%PDF")
+TOOL_CALL = AIMessage("", tool_calls=[{"name": "post", "args": {"data": "{}"}, "id": "call-1"}])
+
+
+class ScriptedChat(BaseChatModel):
+    """Модель, которая отвечает заранее заданными сообщениями и может упасть на заданном вызове."""
+
+    replies: list[AIMessage]
+    crash_at: int | None = None
+    calls: list[list[BaseMessage]] = Field(default_factory=list)
+
+    @property
+    def _llm_type(self: Self) -> str:
+        return "scripted"
+
+    def _generate(self: Self, messages: list[BaseMessage], *args: Any, **kwargs: Any) -> ChatResult:  # noqa: ARG002
+        self.calls.append(list(messages))
+        if len(self.calls) == self.crash_at:
+            msg = "process killed"
+            raise RuntimeError(msg)
+        return ChatResult(generations=[ChatGeneration(message=self.replies[len(self.calls) - 1])])
+
+    def bind_tools(self: Self, tools: Any, **kwargs: Any) -> Self:  # noqa: ANN401, ARG002, D102
+        return self
+
+
+def _agent(model: ScriptedChat, writes: list[str]) -> KeyRatesAgent:
+    @tool
+    def post(data: str) -> str:
+        """Записать данные на сервер."""
+        writes.append(data)
+        return "201"
+
+    agent = KeyRatesAgent("key", "http://docapi", "", "", model="GigaChat-Max")
+    agent._agent = agent._graph(model, [post])  # noqa: SLF001
+    return agent
+
+
+class TestMappingLearning:
+    """Тесты для обучения сопоставлений по записям агента."""
+
+    def test_successful_write_teaches_alias(self: Self, rates_pdf: bytes) -> None:
+        """Успешная запись на сервер подтверждает сопоставление столбца с его лучшим кандидатом."""  # noqa: RUF002
+        write = AIMessage(
+            "",
+            tool_calls=[
+                {
+                    "name": "http_request_s",
+                    "args": {"method": "post", "url": "http://docapi/rates", "data": '{"spread_pct": "0.15"}'},
+                    "id": "call-1",
+                },
+            ],
+        )
+
+        @tool
+        def http_request_s(method: str, url: str, data: str | None = None) -> tuple[int, str]:  # noqa: ARG001
+            """Выполнить HTTP-запрос."""
+            return 201, "{}"
+
+        agent = KeyRatesAgent("key", "http://docapi", "", "", model="GigaChat")
+        agent._agent = agent._graph(ScriptedChat(replies=[write, AIMessage("готово")]), [http_request_s])  # noqa: SLF001
+        agent._context = replace(  # noqa: SLF001
+            agent._context,  # noqa: SLF001
+            attrs_index=MatchIndex(["term_months", "rate_value", "spread_pct", "volume_bp"]),
+        )
+        _, file_id = agent.load_file(FileDTO(type_="pdf", name="rates.pdf", content=rates_pdf))
+
+        agent.process_file(file_id)  # type: ignore[arg-type]
+
+        assert agent._context.attrs_index.match("Spread")[0] == Candidate("spread_pct", 1.0, "alias")  # noqa: SLF001
+        assert agent._context.attrs_index.match("Rate")[0].source == "ngram"  # noqa: SLF001
+        assert agent._documents == {}  # noqa: SLF001
+
+
+class TestLangGraphAgent:
+    """Тесты для агента на LangGraph."""
+
+    def test_single_dialog_without_priming(self: Self) -> None:
+        """Системный промт передаётся вместе с файлом: отдельного вызова модели перед диалогом нет."""  # noqa: RUF002
+        model = ScriptedChat(replies=[TOOL_CALL, AIMessage("готово")])
+        writes: list[str] = []
+        agent = _agent(model, writes)
+
+        updates = list(agent.stream_file("upload-1"))
+
+        assert [next(iter(update)) for update in updates] == ["agent", "tools", "agent"]
+        assert writes == ["{}"]
+        assert len(model.calls) == 2  # noqa: PLR2004
+        system, file_message = model.calls[0]
+        assert system == SYSTEM_PROMPT
+        assert isinstance(file_message, HumanMessage)
+        assert file_message.attachments == ["upload-1"]  # type: ignore[attr-defined]
+        assert not any(isinstance(m, SystemMessage) for m in model.calls[1][1:])
+
+    def test_resumes_from_job_checkpoint(
+        self: Self,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """После падения диалог продолжается с последнего шага: выполненный инструмент не повторяется."""  # noqa: RUF002
+        store = JobStore()
+        store.open(tmp_path / "jobs.sqlite3", dt.timedelta(hours=1))
+        monkeypatch.setattr(jobs_module, "jobs", store)
+        job = store.add("mail", FILE)
+        writes: list[str] = []
+
+        crashing = ScriptedChat(replies=[TOOL_CALL], crash_at=2)
+        with active(job), pytest.raises(RuntimeError):
+            list(_agent(crashing, writes).stream_file("first-upload"))
+
+        job = store.pending()[0]
+        assert (job.stage, job.steps, job.tool_calls) == (JobStage.PROCESSING, 1, 1)
+
+        model = ScriptedChat(replies=[AIMessage("готово")])
+        with active(job):
+            _agent(model, writes).process_file("second-upload")
+
+        assert writes == ["{}"]
+        assert len(model.calls) == 1
+        assert model.calls[0][1].attachments == ["second-upload"]  # type: ignore[attr-defined]
+        assert [type(m).__name__ for m in model.calls[0]] == [
+            "SystemMessage",
+            "HumanMessage",
+            "AIMessage",
+            "ToolMessage",
+        ]
+        assert store.get(job.key).steps == 2  # type: ignore[union-attr]  # noqa: PLR2004
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import datetime as dt
+import threading
+import time
+from typing import TYPE_CHECKING, Self
+
+import pytest
+
+from src import pipeline
+from src.dao import jobs as jobs_module
+from src.dao.jobs import JobStage, JobStore, active
+from src.dao.leases import Lease, LeaseLostError
+from src.dto import FileDTO
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+FILE = FileDTO(type_="pdf", name="rates.pdf", content=b"%PDF")
+TTL = 0.3  # Срок аренды: время хранилища управляется тестом, от срока зависит только частота продлений
+
+
+class Clock:
+    """Управляемое время хранилища."""
+
+    def __init__(self: Self) -> None:  # noqa: D107
+        self.now = 1_000_000.0
+
+    def __call__(self: Self) -> float:  # noqa: D102
+        return self.now
+
+
+class RenewCounter:
+    """Хранилище аренды, сообщающее о каждом продлении."""  # noqa: RUF002
+
+    def __init__(self: Self, store: JobStore) -> None:  # noqa: D107
+        self.store = store
+        self.results: list[bool] = []
+        self.renewed = threading.Condition()
+
+    def claim(self: Self, key: str, owner: str, ttl: float) -> bool:  # noqa: D102
+        return self.store.claim(key, owner, ttl)
+
+    def renew(self: Self, key: str, owner: str, ttl: float) -> bool:  # noqa: D102
+        result = self.store.renew(key, owner, ttl)
+        with self.renewed:
+            self.results.append(result)
+            self.renewed.notify_all()
+        return result
+
+    def release(self: Self, key: str, owner: str) -> None:  # noqa: D102
+        self.store.release(key, owner)
+
+    def wait(self: Self, count: int) -> None:
+        """Дождаться `count` продлений от текущего момента."""
+        with self.renewed:
+            target = len(self.results) + count
+            assert self.renewed.wait_for(lambda: len(self.results) >= target, timeout=5)
+
+
+@pytest.fixture
+def clock() -> Clock:
+    """Время хранилищ."""
+    return Clock()
+
+
+@pytest.fixture
+def stores(tmp_path: Path, clock: Clock) -> tuple[JobStore, JobStore]:
+    """Хранилища двух экземпляров сервиса в одном файле."""
+    first, second = JobStore(clock), JobStore(clock)
+    for store in (first, second):
+        store.open(tmp_path / "jobs.sqlite3", dt.timedelta(hours=1))
+    return first, second
+
+
+class RecordingAgent:
+    """Агент, запоминающий обработанные файлы."""
+
+    def __init__(self: Self) -> None:  # noqa: D107
+        self.processed: list[str] = []
+
+    def load_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
+        return None, file_dto.name
+
+    def process_file(self: Self, file_id: str) -> None:  # noqa: D102
+        self.processed.append(file_id)
+
+    def delete_file(self: Self, file_id: str) -> None:  # noqa: D102
+        pass
+
+
+class TestLeases:
+    """Тесты для аренды заданий экземплярами сервиса."""
+
+    def test_abandoned_job_is_stolen(self: Self, stores: tuple[JobStore, JobStore], clock: Clock) -> None:
+        """Задание в аренде недоступно другим, после истечения аренды его забирает другой экземпляр."""  # noqa: RUF002
+        first, second = stores
+        key = first.add("mail", FILE).key
+        assert first.claim(key, "a", TTL)
+        assert not second.claim(key, "b", TTL)
+        assert second.pending() == []
+
+        clock.now += TTL * 1.5
+        assert [job.key for job in second.pending()] == [key]
+        assert second.claim(key, "b", TTL)
+        assert not first.renew(key, "a", TTL)
+
+    def test_heartbeat_keeps_lease(self: Self, stores: tuple[JobStore, JobStore], clock: Clock) -> None:
+        """Пока задание обрабатывается, аренда продлевается, после обработки задание освобождается."""
+        first, second = stores
+        key = first.add("mail", FILE).key
+        counter = RenewCounter(first)
+        with Lease(counter, key, "a", TTL) as lease:
+            assert lease.held
+            # Без продления аренда уже истекла бы
+            clock.now += TTL * 1.5
+            counter.wait(2)
+            assert not second.claim(key, "b", TTL)
+        assert not lease.lost
+        assert second.claim(key, "b", TTL)
+
+    def test_lost_lease_stops_job(
+        self: Self,
+        stores: tuple[JobStore, JobStore],
+        clock: Clock,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """После потери аренды следующий шаг не начинается, а изменения задания не затирают работу другого."""  # noqa: RUF002
+        first, second = stores
+        monkeypatch.setattr(jobs_module, "jobs", first)
+        job = first.add("mail", FILE)
+        counter = RenewCounter(first)
+        with Lease(counter, job.key, "a", TTL) as lease, active(job):
+            job.lease = lease
+            jobs_module.checkpoint({"step": 1}, steps=1, tool_calls=0)
+
+            clock.now += TTL * 1.5
+            assert second.claim(job.key, "b", TTL)
+            with counter.renewed:
+                assert counter.renewed.wait_for(lambda: False in counter.results, timeout=5)
+            # Признак ставится сразу после неудачного продления
+            for _ in range(100):
+                if lease.lost:
+                    break
+                time.sleep(0.01)
+            assert lease.lost
+            with pytest.raises(LeaseLostError):
+                jobs_module.checkpoint({"step": 2}, steps=2, tool_calls=1)
+            first.update(job, JobStage.FAILED, "stale")
+
+        stored = second.get(job.key)
+        assert stored is not None
+        assert stored.checkpoint == {"step": 1}
+        assert stored.stage == JobStage.PROCESSING
+        assert stored.error is None
+
+    def test_no_duplicate_processing(
+        self: Self,
+        stores: tuple[JobStore, JobStore],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """Экземпляр пропускает задание, которое обрабатывает другой, и завершённое другим."""
+        first, second = stores
+        job = first.add("mail", FILE)
+        agent = RecordingAgent()
+        monkeypatch.setattr(pipeline, "jobs", second)
+        with Lease(first, job.key, "a", TTL):
+            pipeline.process_job(agent, second.add("mail", FILE))
+        assert agent.processed == []
+
+        first.update(job, JobStage.DONE)
+        pipeline.process_job(agent, second.add("mail", FILE))
+        assert agent.processed == []
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import datetime as dt
+from typing import TYPE_CHECKING, Self
+
+import pytest
+
+from src.dao.ledger import WriteLedger
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+URL = "https://example.com/api/v1/docs"
+
+
+@pytest.fixture
+def ledger(tmp_path: Path) -> WriteLedger:
+    """Открытый журнал во временном каталоге."""
+    ledger = WriteLedger()
+    ledger.open(tmp_path / "ledger.sqlite3", dt.timedelta(hours=1))
+    return ledger
+
+
+class TestWriteLedger:
+    """Тесты для журнала изменяющих запросов."""
+
+    def test_disabled_by_default(self: Self) -> None:
+        """Неоткрытый журнал ничего не хранит."""
+        ledger = WriteLedger()
+        ledger.record("POST", URL, {"a": 1}, 201, "ok")
+        assert not ledger.enabled
+        assert ledger.lookup("POST", URL, {"a": 1}) is None
+
+    def test_repeat_returns_prior_success(self: Self, ledger: WriteLedger) -> None:
+        """Повторный запрос получает сохранённый ответ."""
+        ledger.record("POST", URL, {"name": "rate", "date": "2025-01-01"}, 201, '{"id": 1}')
+        assert ledger.lookup("post", URL, {"date": "2025-01-01", "name": "rate"}) == (201, '{"id": 1}')
+
+    def test_key_is_canonical(self: Self) -> None:
+        """Ключ не зависит от порядка полей и параметров, но различает хосты."""
+        key = WriteLedger.make_key("POST", f"{URL}?b=2&a=1", {"x": 1, "y": [1, 2]})
+        assert key == WriteLedger.make_key("post", "HTTPS://Example.com/api/v1/docs/?a=1&b=2", '{"y": [1, 2], "x": 1}')
+        assert key != WriteLedger.make_key("POST", "http://127.0.0.1/api/v1/docs?a=1&b=2", {"x": 1, "y": [1, 2]})
+        assert key != WriteLedger.make_key("PUT", f"{URL}?b=2&a=1", {"x": 1, "y": [1, 2]})
+        assert key != WriteLedger.make_key("POST", f"{URL}?b=2&a=1", {"x": 2, "y": [1, 2]})
+
+    def test_later_write_invalidates_resource(self: Self, ledger: WriteLedger) -> None:
+        """После POST, DELETE и снова POST последний запрос не берётся из журнала."""
+        record = f"{URL}/1"
+        ledger.record("POST", record, {"a": 1}, 201, "created")
+        ledger.record("DELETE", record, None, 204, "")
+        assert ledger.lookup("POST", record, {"a": 1}) is None
+        assert ledger.lookup("DELETE", record, None) == (204, "")
+        assert ledger.lookup("POST", f"{URL}/2", {"a": 1}) is None
+
+    def test_failures_and_reads_are_not_recorded(self: Self, ledger: WriteLedger) -> None:
+        """Ошибки и читающие запросы в журнал не попадают."""
+        ledger.record("POST", URL, {"a": 1}, 422, "bad")
+        ledger.record("GET", URL, None, 200, "[]")
+        assert ledger.lookup("POST", URL, {"a": 1}) is None
+        assert ledger.lookup("GET", URL, None) is None
+
+    def test_retention(self: Self, tmp_path: Path) -> None:
+        """Устаревшие записи не используются и удаляются."""
+        ledger = WriteLedger()
+        ledger.open(tmp_path / "ledger.sqlite3", dt.timedelta(0))
+        ledger.record("POST", URL, {"a": 1}, 200, "ok")
+        ledger.open(tmp_path / "ledger.sqlite3", dt.timedelta(seconds=-1))
+        assert ledger.lookup("POST", URL, {"a": 1}) is None
+        assert ledger.purge() == 0
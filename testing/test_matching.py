@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING, Self
+
+from src.core.matching import MatchIndex, learn_confirmed, mapping_hints, normalize, parse_names, written_names
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+ATTRS = json.dumps(
+    [
+        {"name": "term", "description": "Срок"},
+        {"name": "rate", "description": "Ставка"},
+        {"name": "spread_value"},
+        {"name": "rate_max", "description": "Максимальная ставка"},
+    ],
+    ensure_ascii=False,
+)
+
+
+class TestParseNames:
+    """Тесты для разбора ответов DocAPI."""
+
+    def test_formats(self: Self) -> None:
+        """Поддерживаются список строк, список объектов и словарь."""
+        assert parse_names('["a", "b"]') == {"a": [], "b": []}
+        assert parse_names(ATTRS)["term"] == ["Срок"]
+        assert parse_names('{"items": [{"code": "x", "title": "X"}]}') == {"x": ["X"]}
+        assert parse_names('{"key_rate": "Ключевая ставка"}') == {"key_rate": ["Ключевая ставка"]}
+        assert parse_names(None) == {}
+        assert parse_names("<html>") == {}
+
+
+class TestMatchIndex:
+    """Тесты для индекса сопоставления."""
+
+    def test_normalize(self: Self) -> None:
+        """Кириллица транслитерируется, знаки убираются."""
+        assert normalize("Ставка, %") == "stavka"
+
+    def test_exact_by_title(self: Self) -> None:
+        """Заголовок, совпадающий с названием атрибута, сопоставляется однозначно."""  # noqa: RUF002
+        index = MatchIndex(parse_names(ATTRS))
+        assert index.resolve("Ставка, %") == "rate"
+        assert index.resolve("СРОК") == "term"
+
+    def test_ngram_candidates(self: Self) -> None:
+        """Похожие заголовки получают кандидатов с оценками по убыванию."""  # noqa: RUF002
+        index = MatchIndex(parse_names(ATTRS))
+        candidates = index.match("Спред")
+        assert candidates[0].name == "spread_value"
+        assert candidates[0].source == "ngram"
+        assert [c.score for c in candidates] == sorted((c.score for c in candidates), reverse=True)
+
+    def test_learned_alias_persists(self: Self, tmp_path: Path) -> None:
+        """Выученный псевдоним сохраняется и имеет приоритет."""
+        alias_path = tmp_path / "aliases.json"
+        MatchIndex(parse_names(ATTRS), alias_path).learn("Ст., % год.", "rate_max")
+        index = MatchIndex(parse_names(ATTRS), alias_path)
+        assert index.match("ст % год")[0].name == "rate_max"
+        assert index.match("ст % год")[0].source == "alias"
+
+    def test_corrupt_alias_file(self: Self, tmp_path: Path) -> None:
+        """Повреждённый файл псевдонимов не мешает построить индекс и перезаписывается при обучении."""
+        alias_path = tmp_path / "aliases.json"
+        alias_path.write_text('{"st god": "rate', encoding="utf-8")
+        index = MatchIndex(parse_names(ATTRS), alias_path)
+        assert index.match("st god")[0].source == "ngram"
+
+        index.learn("st god", "rate_max")
+        assert json.loads(alias_path.read_text(encoding="utf-8")) == {"st god": "rate_max"}
+        assert not alias_path.with_suffix(".tmp").exists()
+
+    def test_unknown_name_is_not_learned(self: Self) -> None:
+        """Псевдоним для неизвестного имени не запоминается."""
+        index = MatchIndex({"rate": ["Ставка"]})
+        index.learn("Ставка", "unknown")
+        assert index.match("Ставка")[0].source == "exact"
+
+
+class TestMappingHints:
+    """Тесты для подсказок в промт."""
+
+    def test_hints_and_short_list(self: Self) -> None:
+        """Подсказки содержат решения и кандидатов, список имён сокращён."""
+        hints, names = mapping_hints(MatchIndex(parse_names(ATTRS)), ["Срок", "Ставка", "Спред", "Срок"])
+        assert hints.splitlines()[:2] == ["Срок -> term", "Ставка -> rate"]
+        assert "spread_value" in names
+        assert names[:2] == ["term", "rate"]
+
+    def test_full_list_when_unmatched(self: Self) -> None:
+        """Если у заголовка нет кандидатов, сокращённый список не предлагается."""  # noqa: RUF002
+        _, names = mapping_hints(MatchIndex(["rate"]), ["Ставка", "qqq"])
+        assert names == []
+
+    def test_weak_candidates_omitted(self: Self) -> None:
+        """Кандидаты со слабым сходством в промт не попадают, тогда нужен полный список имён."""  # noqa: RUF002
+        hints, names = mapping_hints(MatchIndex(["rate", "spread_value"]), ["Валюта"])
+        assert hints == ""
+        assert names == []
+
+
+class TestLearnConfirmed:
+    """Тесты для обучения псевдонимов по успешным записям."""
+
+    def test_learns_single_written_candidate(self: Self, tmp_path: Path) -> None:
+        """Из кандидатов в запись попал один - псевдоним выучен и сохраняется."""
+        alias_path = tmp_path / "aliases.json"
+        index = MatchIndex(parse_names(ATTRS), alias_path)
+        written = written_names('{"name": "deposit", "comment": "Ставки", "rows": [{"term": "1M", "rate_max": "20"}]}')
+
+        learned = learn_confirmed(index, ["Максим. ставка", "Срок", "Спред"], written)
+
+        assert learned == ["Максим. ставка"]
+        assert MatchIndex(parse_names(ATTRS), alias_path).match("Максим. ставка")[0].name == "rate_max"
+
+    def test_ambiguous_write_is_not_learned(self: Self) -> None:
+        """Если в запись попали несколько кандидатов заголовка, псевдоним не запоминается."""
+        index = MatchIndex(parse_names(ATTRS))
+        assert learn_confirmed(index, ["Ставка макс"], {"rate", "rate_max"}) == []
+        assert index.match("Ставка макс")[0].source == "ngram"
+
+    def test_weak_or_runner_up_match_is_not_learned(self: Self) -> None:
+        """Одна запись при нескольких заголовках не учит ни слабое сходство, ни кандидата не с первого места."""  # noqa: RUF002
+        index = MatchIndex(["key_rate", "deposit_rate", "credit_rate"])
+        titles = ["Key rates from 01.07.2025", "Deposit rates", "Monthly report"]
+
+        assert learn_confirmed(index, titles, {"key_rate"}) == []
+        assert index.match("Deposit rates")[0].name == "deposit_rate"
+        assert index.match("Deposit rates")[0].source == "ngram"
+
+    def test_name_claimed_by_several_headers_is_not_learned(self: Self) -> None:
+        """Если записанное имя - лучший кандидат нескольких заголовков, ни один не выучивается."""
+        index = MatchIndex(["key_rate", "deposit_rate", "credit_rate"])
+        assert learn_confirmed(index, ["Key rates", "Key rate value"], {"key_rate"}) == []
+        assert learn_confirmed(index, ["Key rates"], {"key_rate"}) == ["Key rates"]
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import time
+from typing import Self
+
+import httpx
+import pytest
+
+from src.core import metrics
+from src.core.deadline import DeadlineExceededError, DeadlineSettings, document_deadline, run_stage
+from src.core.metrics import Registry
+
+
+class TestMetrics:
+    """Тесты для метрик этапов."""
+
+    def test_render_openmetrics(self: Self) -> None:
+        """Счётчики и гистограммы выводятся в формате OpenMetrics с накопленными корзинами."""  # noqa: RUF002
+        registry = Registry()
+        calls = registry.counter("calls", "Calls", ("status",))
+        latency = registry.histogram("latency_seconds", "Latency")
+        calls.inc(status=201)
+        calls.inc(2, status=201)
+        latency.observe(0.003)
+        latency.observe(7)
+
+        text = registry.render()
+
+        assert text.endswith("# EOF\n")
+        assert "# TYPE keyrates_calls counter" in text
+        assert 'keyrates_calls_total{status="201"} 3' in text
+        assert 'keyrates_latency_seconds_bucket{le="0.005"} 1' in text
+        assert 'keyrates_latency_seconds_bucket{le="5"} 1' in text
+        assert 'keyrates_latency_seconds_bucket{le="10"} 2' in text
+        assert 'keyrates_latency_seconds_bucket{le="+Inf"} 2' in text
+        assert "keyrates_latency_seconds_count 2" in text
+        with pytest.raises(ValueError, match="expects labels"):
+            calls.inc(method="GET")
+
+    def test_endpoint_label(self: Self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Метка инструмента не зависит от идентификаторов и параметров запроса."""
+        monkeypatch.setattr(metrics, "_endpoints", ())
+        metrics.register_endpoints(["/openapi.json"])
+        metrics.register_endpoints(["/rates/{rate_id}", "/rates/latest", "/docs/{doc_id}/rows"])
+        uuid = "3f2b8c1e-9a4d-4e7b-8c6a-1d2e3f4a5b6c"
+        assert metrics.endpoint("post", "http://docapi/api/v1/rates/42?x=1") == "POST /rates/{rate_id}"
+        assert metrics.endpoint("GET", "http://docapi/rates/latest") == "GET /rates/latest"
+        assert metrics.endpoint("put", f"http://docapi/docs/{uuid}/rows") == "PUT /docs/{doc_id}/rows"
+        assert metrics.endpoint("GET", "http://docapi/openapi.json") == "GET /openapi.json"
+
+    def test_unknown_endpoints_share_label(self: Self) -> None:
+        """Адреса вне известных операций и неизвестные методы не создают новых рядов метрик."""
+        assert metrics.endpoint("GET", "http://docapi/unknown/abc") == "GET other"
+        assert metrics.endpoint("GET", "http://docapi/files/3f2b8c1e-9a4d-4e7b-8c6a-1d2e3f4a5b6c") == "GET other"
+        assert metrics.endpoint("FETCH", "http://docapi/x") == "OTHER other"
+        metrics.register_endpoints(f"/bulk/{i}" for i in range(metrics.MAX_ENDPOINTS + 1))
+        assert metrics.endpoint("GET", f"http://docapi/bulk/{metrics.MAX_ENDPOINTS}") == "GET other"
+
+    def test_stage_timeout_recorded(self: Self) -> None:
+        """Этап, прерванный по времени, учитывается с итогом `timeout`."""  # noqa: RUF002
+        before = metrics.STAGE_SECONDS.count(stage="step", outcome="timeout")
+        with document_deadline(10) as deadline:
+            deadline.stages = DeadlineSettings(step=0.05)
+            with pytest.raises(DeadlineExceededError):
+                run_stage("step", time.sleep, 1)
+        assert metrics.STAGE_SECONDS.count(stage="step", outcome="timeout") == before + 1
+
+    def test_http_endpoint(self: Self) -> None:
+        """Локальный сервер отдаёт метрики по адресу `/metrics`."""
+        server = metrics.serve(0)
+        try:
+            host, port = server.server_address[:2]
+            response = httpx.get(f"http://{host}:{port}/metrics")
+            missing = httpx.get(f"http://{host}:{port}/")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert response.headers["content-type"].startswith("application/openmetrics-text")
+        assert "# TYPE keyrates_document_seconds histogram" in response.text
+        assert missing.status_code == 404  # noqa: PLR2004
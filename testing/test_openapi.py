@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING, Self
+
+from src.core import metrics
+from src.core.openapi import OpenAPIIndex, get_index, openapi_slice
+
+if TYPE_CHECKING:
+    import pytest
+
+SPEC = {
+    "openapi": "3.1.0",
+    "paths": {
+        "/api/v1/docs": {
+            "post": {
+                "summary": "Upload document",
+                "requestBody": {
+                    "content": {
+                        "application/json": {
+                            "schema": {"$ref": "#/components/schemas/DocIn"},
+                            "example": {"name": "key_rate", "date": "2025-07-01"},
+                        },
+                    },
+                },
+            },
+            "get": {
+                "summary": "List documents",
+                "parameters": [{"name": "name", "in": "query", "required": True, "schema": {"type": "string"}}],
+            },
+        },
+        "/api/v1/attrs/all": {"get": {"summary": "All attributes"}},
+        "/api/v1/users": {"get": {"summary": "List users"}},
+        "/health": {"get": {"summary": "Health"}},
+    },
+    "components": {
+        "schemas": {
+            "DocIn": {
+                "type": "object",
+                "required": ["name", "date"],
+                "properties": {
+                    "name": {"type": "string"},
+                    "date": {"type": "string", "format": "date"},
+                    "comment": {"anyOf": [{"type": "string"}, {"type": "null"}]},
+                    "data": {"type": "array", "items": {"type": "object"}},
+                    "parent": {"$ref": "#/components/schemas/DocIn"},
+                },
+            },
+        },
+    },
+}
+TEXT = json.dumps(SPEC)
+
+
+class TestOpenAPIIndex:
+    """Тесты для сокращения документации OpenAPI."""
+
+    def test_resolve_refs(self: Self) -> None:
+        """Ссылки раскрываются, цикл заменяется на object."""
+        upload = next(op for op in OpenAPIIndex(SPEC).operations if op.method == "post")
+        assert upload.body is not None
+        assert upload.body["properties"]["parent"] == {"type": "object"}
+        assert "name*: string, date*: string(date), comment: string, data: [object], parent: object" in upload.render()
+
+    def test_select(self: Self) -> None:
+        """Выбираются только операции, подходящие под задачу."""
+        result = openapi_slice(TEXT, "upload documents, get attributes")
+        assert result is not None
+        assert "POST /api/v1/docs - Upload document" in result
+        assert 'example: {"name":"key_rate","date":"2025-07-01"}' in result
+        assert "GET /api/v1/attrs/all" in result
+        assert "/users" not in result
+        assert "/health" not in result
+        assert len(result) < len(TEXT)
+
+    def test_slice_paths_label_metrics(self: Self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Пути выбранных операций становятся метками инструментов, остальные пути - нет."""
+        monkeypatch.setattr(metrics, "_endpoints", ())
+        openapi_slice(TEXT, "upload documents, get attributes")
+        assert metrics.endpoint("post", "http://docapi/api/v1/docs?draft=1") == "POST /api/v1/docs"
+        assert metrics.endpoint("GET", "http://docapi/api/v1/users") == "GET other"
+
+    def test_cache(self: Self) -> None:
+        """Документ разбирается один раз."""
+        assert get_index(TEXT) is get_index(TEXT)
+
+    def test_invalid(self: Self) -> None:
+        """Неразобранный документ возвращается как есть."""
+        assert openapi_slice("<html>") == "<html>"
+        assert openapi_slice(None) is None
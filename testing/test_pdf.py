@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from io import BytesIO
+from typing import TYPE_CHECKING, Self
+
+import pytest
+
+from src.core import pdf
+from src.core.pdf import extract_pages, iter_pdf_pages, pdf_to_dict
+from testing.conftest import PageSpec, build_pdf
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+class TestPdfToDict:
+    """Тесты для функции pdf_to_dict."""
+
+    @pytest.mark.parametrize("wrap", [bytes, bytearray, memoryview, BytesIO])
+    def test_in_memory_sources(self: Self, rates_pdf: bytes, wrap: type) -> None:
+        """PDF читается из байтов и буферов без записи на диск."""
+        result = pdf_to_dict(wrap(rates_pdf))
+        assert [p["page_number"] for p in result["pages"]] == [1, 2, 3]
+        assert result["tables"][0]["columns"] == ["Term", "Rate", "Spread"]
+        assert result["tables"][0]["data"][0] == {"Term": "1M", "Rate": "20.50", "Spread": "0.15"}
+
+    def test_path_source(self: Self, rates_pdf: bytes, tmp_path: Path) -> None:
+        """Путь к файлу по-прежнему поддерживается."""
+        pdf_path = tmp_path / "rates.pdf"
+        pdf_path.write_bytes(rates_pdf)
+        assert pdf_to_dict(pdf_path) == pdf_to_dict(rates_pdf)
+
+
+class TestIterPdfPages:
+    """Тесты для потокового извлечения страниц."""
+
+    def test_yields_pages_in_order(self: Self, rates_pdf: bytes) -> None:
+        """Страницы выдаются по одной и в исходном порядке."""
+        pages = iter_pdf_pages(rates_pdf)
+        first = next(pages)
+        assert first["page_number"] == 1
+        assert first["tables"] == []
+        assert [p["page_number"] for p in pages] == [2, 3]
+
+    def test_rows_to_records(self: Self, rates_pdf: bytes) -> None:
+        """Строки таблицы превращаются в записи без промежуточного DataFrame."""
+        table = list(iter_pdf_pages(rates_pdf))[1]["tables"][0]
+        assert table["table_id"] == 1
+        assert table["data"] == [
+            {"Term": "1M", "Rate": "20.50", "Spread": "0.15"},
+            {"Term": "3M", "Rate": "20.75", "Spread": ""},
+        ]
+
+    def test_merged_and_repeated_headers(self: Self) -> None:
+        """Пустые и повторяющиеся заголовки не склеивают столбцы: ни одно значение не теряется."""
+        table = pdf._table_to_records(1, [["Срок", None, None, "Срок"], ["1M", "20.50", "0.15", "3M"]])  # noqa: SLF001
+        assert table["columns"] == ["Срок", "col_2", "col_3", "Срок_2"]
+        assert table["data"] == [{"Срок": "1M", "col_2": "20.50", "col_3": "0.15", "Срок_2": "3M"}]
+
+    def test_cached_by_content(self: Self, rates_pdf: bytes, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Один и тот же файл разбирается один раз, изменение настроек разбора сбрасывает кэш."""
+        first = pdf_to_dict(rates_pdf)
+        assert pdf_to_dict(bytearray(rates_pdf)) is first
+        monkeypatch.setattr(pdf.settings, "prefilter", True)
+        assert pdf_to_dict(rates_pdf) is not first
+
+    def test_dict_form_shares_tables(self: Self, rates_pdf: bytes) -> None:
+        """Список таблиц в pdf_to_dict ссылается на таблицы страниц без копирования."""
+        result = pdf_to_dict(rates_pdf)
+        assert result["tables"][0] is result["pages"][1]["tables"][0]
+
+
+class TestExtractPages:
+    """Тесты для параллельного извлечения страниц."""
+
+    def test_parallel_matches_serial(self: Self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Параллельный разбор возвращает те же страницы в исходном порядке."""
+        monkeypatch.setattr(pdf.settings, "min_pages_per_worker", 2)
+        content = build_pdf([PageSpec(lines=[f"Page {i}"], table=[["N"], [str(i)]]) for i in range(1, 8)])
+        serial = extract_pages(content, workers=1).pages
+        parallel = extract_pages(content, workers=3).pages
+        assert parallel == serial
+        assert [p["page_number"] for p in parallel] == list(range(1, 8))
+        assert parallel[6]["tables"][0]["data"] == [{"N": "7"}]
+
+    def test_small_document_stays_serial(self: Self, rates_pdf: bytes, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Для маленьких документов пул процессов не создаётся."""
+        monkeypatch.setattr(pdf, "_get_pool", None)
+        extraction = extract_pages(rates_pdf, workers=8)
+        assert len(extraction.pages) == 3  # noqa: PLR2004
+
+
+class TestPrefilter:
+    """Тесты для предварительного отбора страниц."""
+
+    def test_skips_table_search_only(self: Self, rates_pdf: bytes, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Таблицы ищутся на первой странице и странице с сеткой, текст разбирается на всех страницах."""  # noqa: RUF002
+        monkeypatch.setattr(pdf.settings, "prefilter", True)
+        result = pdf_to_dict(rates_pdf)
+        assert [p["page_number"] for p in result["pages"]] == [1, 2, 3]
+        assert all(p["text"] for p in result["pages"])
+        assert result["stats"] == {"total_pages": 3, "table_pages": 2, "skipped_pages": [3]}
+        assert len(result["tables"]) == 1
+
+    def test_keyword_hit(self: Self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Страница без линий, но с ключевым словом остаётся кандидатом, общие слова вроде `%` - нет."""  # noqa: RUF002
+        monkeypatch.setattr(pdf.settings, "prefilter", True)
+        content = build_pdf(
+            [PageSpec(lines=["Title"]), PageSpec(lines=["Key Rates 1M 20.50"]), PageSpec(lines=["Fee 1.5%"])],
+        )
+        assert pdf_to_dict(content)["stats"]["skipped_pages"] == [3]
+
+    def test_disabled_by_default(self: Self, rates_pdf: bytes) -> None:
+        """Без отбора разбираются все страницы."""
+        assert pdf_to_dict(rates_pdf)["stats"]["skipped_pages"] == []
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from typing import Self
+
+import pytest
+
+from src import pipeline
+from src.dao import jobs as jobs_module
+from src.dao.jobs import JobStage, JobStore
+from src.dto import FileDTO
+
+FIRST = FileDTO(type_="pdf", name="first.pdf", content=b"%PDF 1")
+SECOND = FileDTO(type_="pdf", name="second.pdf", content=b"%PDF 2")
+TIMEOUT = 5.0
+
+
+@pytest.fixture
+def store(monkeypatch: pytest.MonkeyPatch) -> JobStore:
+    """Хранилище в памяти процесса, подменяющее общее."""
+    store = JobStore()
+    monkeypatch.setattr(jobs_module, "jobs", store)
+    monkeypatch.setattr(pipeline, "jobs", store)
+    return store
+
+
+class SlowAgent:
+    """Агент, обработка первого файла которым ждёт разрешения.
+
+    Второй файл загружается только после начала обработки первого.
+    """
+
+    def __init__(self: Self) -> None:  # noqa: D107
+        self.events: list[str] = []
+        self.processing_first = threading.Event()
+        self.first_processed = threading.Event()
+        self.second_loaded = threading.Event()
+        self.release = threading.Event()
+
+    def load_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
+        if file_dto is SECOND:
+            assert self.processing_first.wait(TIMEOUT)
+        self.events.append(f"load {file_dto.name}")
+        if file_dto is SECOND:
+            self.second_loaded.set()
+        return None, file_dto.name
+
+    def process_file(self: Self, file_id: str) -> None:  # noqa: D102
+        self.events.append(f"process {file_id}")
+        if file_id == FIRST.name:
+            self.processing_first.set()
+            assert self.release.wait(TIMEOUT)
+            self.first_processed.set()
+        if file_id == "broken.pdf":
+            msg = "model failed"
+            raise RuntimeError(msg)
+
+    def delete_file(self: Self, file_id: str) -> None:  # noqa: D102
+        self.events.append(f"delete {file_id}")
+
+
+class TestPipeline:
+    """Тесты для конвейера заданий."""
+
+    def test_next_upload_overlaps_processing(self: Self, store: JobStore) -> None:
+        """Следующий файл загружается, пока модель обрабатывает текущий."""
+        agent = SlowAgent()
+        conveyor = pipeline.Pipeline(agent)  # type: ignore[arg-type]
+        first, second = store.add("mail", FIRST), store.add("mail", SECOND)
+        assert conveyor.submit(first)
+        assert conveyor.submit(second)
+        assert not conveyor.submit(second)
+
+        # Второй файл загружен, пока обработка первого ещё ждёт разрешения
+        assert agent.second_loaded.wait(TIMEOUT)
+        assert not agent.first_processed.is_set()
+        deadline = time.monotonic() + TIMEOUT
+        while conveyor.depths()["process"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert conveyor.depths() == {"upload": 0, "process": 1, "cleanup": 0}
+
+        agent.release.set()
+        assert conveyor.wait(TIMEOUT)
+        conveyor.close()
+        assert (first.stage, second.stage) == (JobStage.DONE, JobStage.DONE)
+        assert agent.events[-1] == "delete second.pdf"
+
+    def test_failed_processing_keeps_job(self: Self, store: JobStore) -> None:
+        """Ошибка обработки записывается в задание, файл всё равно удаляется."""
+        agent = SlowAgent()
+        job = store.add("mail", FileDTO(type_="pdf", name="broken.pdf", content=b"%PDF"))
+        conveyor = pipeline.Pipeline(agent)  # type: ignore[arg-type]
+        conveyor.submit(job)
+        assert conveyor.wait(TIMEOUT)
+        conveyor.close()
+        assert job.stage == JobStage.UPLOADED
+        assert job.error == "RuntimeError('model failed')"
+        assert agent.events == ["load broken.pdf", "process broken.pdf", "delete broken.pdf"]
+
+    def test_stage_error_does_not_stall(self: Self, store: JobStore, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Ошибка этапа обработки вне агента не останавливает конвейер: задание доходит до удаления."""
+
+        def broken_save(*_: object) -> None:
+            msg = "database is locked"
+            raise sqlite3.OperationalError(msg)
+
+        monkeypatch.setattr(store, "save_usage", broken_save)
+        agent = SlowAgent()
+        agent.release.set()
+        job = store.add("mail", FIRST)
+        conveyor = pipeline.Pipeline(agent)  # type: ignore[arg-type]
+        conveyor.submit(job)
+        assert conveyor.wait(TIMEOUT)
+        conveyor.close()
+        assert job.error == "OperationalError('database is locked')"
+        assert agent.events == ["load first.pdf", "process first.pdf", "delete first.pdf"]
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import json
+from typing import Self
+
+from src.core.pdf import _table_to_records, iter_pdf_pages, pdf_to_dict
+from src.core.prompt import estimate_tokens, format_table, pdf_to_prompt
+
+TABLE = {
+    "table_id": 1,
+    "columns": ["Срок", "Ставка", None],
+    "data": [{"Срок": "1M", "Ставка": "20.50", None: ""}, {"Срок": "", "Ставка": "", None: None}],
+}
+
+
+class TestFormatTable:
+    """Тесты для форматирования таблиц."""
+
+    def test_tsv_drops_empty_cells(self: Self) -> None:
+        """Пустые столбцы и строки не выводятся, числа не меняются."""
+        assert format_table(TABLE) == "Срок\tСтавка\n1M\t20.50"  # type: ignore[arg-type]
+
+    def test_json_rows(self: Self) -> None:
+        """JSON содержит заголовок один раз и массив строк."""
+        data = json.loads(format_table(TABLE, "json"))  # type: ignore[arg-type]
+        assert data == {"columns": ["Срок", "Ставка"], "rows": [["1M", "20.50"]]}
+
+    def test_merged_header_keeps_values(self: Self) -> None:
+        """Значения под объединённым заголовком сохраняются в исходном порядке."""
+        table = _table_to_records(1, [["Срок", None, None], ["1M", "20.50", "0.15"], ["3M", "", None]])
+        assert format_table(table) == "Срок\tcol_2\tcol_3\n1M\t20.50\t0.15\n3M"
+
+    def test_csv_quotes(self: Self) -> None:
+        """CSV экранирует запятые в ячейках."""
+        table = {"table_id": 1, "columns": ["A", "B"], "data": [{"A": "1,5", "B": "2"}]}
+        assert format_table(table, "csv") == 'A,B\n"1,5",2'  # type: ignore[arg-type]
+
+
+class TestPdfToPrompt:
+    """Тесты для компактного представления PDF."""
+
+    def test_tables_once_without_metadata(self: Self, rates_pdf: bytes) -> None:
+        """Каждая таблица выводится один раз, текст таблицы не дублируется."""
+        prompt = pdf_to_prompt(pdf_to_dict(rates_pdf))
+        assert prompt.tables == 1
+        assert prompt.text.count("20.50") == 1
+        assert "Term\tRate\tSpread\n1M\t20.50\t0.15\n3M\t20.75" in prompt.text
+        assert "Key rates from 01.07.2025" in prompt.text
+        assert prompt.dropped_lines == 3  # noqa: PLR2004
+
+    def test_smaller_than_json(self: Self, rates_pdf: bytes) -> None:
+        """Оценка токенов заметно меньше, чем у JSON."""  # noqa: RUF002
+        data = pdf_to_dict(rates_pdf)
+        prompt = pdf_to_prompt(data)
+        assert prompt.tokens == estimate_tokens(prompt.text)
+        assert prompt.tokens * 2 < estimate_tokens(json.dumps(data))
+
+    def test_streamed_pages(self: Self, rates_pdf: bytes) -> None:
+        """Страницы из iter_pdf_pages дают тот же результат."""
+        assert pdf_to_prompt(iter_pdf_pages(rates_pdf)) == pdf_to_prompt(pdf_to_dict(rates_pdf))
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Self
+
+import pytest
+
+from src.agents.router import (
+    AgentRouter,
+    Backend,
+    BackendSpec,
+    LatencyPolicy,
+    PriorityPolicy,
+    QuotaPolicy,
+)
+from src.core.intrfaces import BackendUnavailableError, QuotaExceededError
+from src.dao import jobs
+from src.dto import FileDTO
+
+FILE = FileDTO(type_="pdf", name="rates.pdf", content=b"%PDF")
+
+
+class FakeAgent:
+    """Агент, который обрабатывает файлы или падает с заданной ошибкой."""  # noqa: RUF002
+
+    def __init__(self: Self, error: Exception | None = None, upload_error: str | None = None) -> None:  # noqa: D107
+        self.error = error
+        self.upload_error = upload_error
+        self.loaded: list[str] = []
+        self.processed: list[str] = []
+        self.deleted: list[str] = []
+
+    def load_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
+        self.loaded.append(file_dto.name)
+        if self.upload_error is not None:
+            return self.upload_error, None
+        return None, file_dto.name
+
+    def process_file(self: Self, file_id: str) -> None:  # noqa: D102
+        if self.error is not None:
+            raise self.error
+        self.processed.append(file_id)
+
+    def delete_file(self: Self, file_id: str) -> None:  # noqa: D102
+        self.deleted.append(file_id)
+
+
+def _router(*agents: FakeAgent, policy: PriorityPolicy | LatencyPolicy | QuotaPolicy | None = None) -> AgentRouter:
+    backends = [Backend(BackendSpec("G", f"model-{i}"), agent) for i, agent in enumerate(agents)]
+    return AgentRouter(backends, policy or PriorityPolicy())
+
+
+def _process(router: AgentRouter) -> None:
+    _, file_id = router.load_file(FILE)
+    assert file_id is not None
+    router.process_file(file_id)
+    router.delete_file(file_id)
+
+
+class TestAgentRouter:
+    """Тесты для распределения документов между моделями."""
+
+    def test_failover_on_quota(self: Self) -> None:
+        """При исчерпании квоты документ уходит в следующую модель, а первая больше не выбирается."""  # noqa: RUF002
+        first, second = FakeAgent(QuotaExceededError("429")), FakeAgent()
+        router = _router(first, second)
+        _process(router)
+        assert second.processed == ["rates.pdf"]
+        assert first.deleted == ["rates.pdf"]
+        assert router.backends[0].stats.remaining == 0
+        assert [backend.agent for backend in router.candidates()] == [second]
+
+    def test_prefetch_on_load(self: Self) -> None:
+        """Файл загружается в лучшую модель сразу, при обработке повторно не загружается."""
+        first, second = FakeAgent(QuotaExceededError("429")), FakeAgent()
+        router = _router(first, second)
+        _, file_id = router.load_file(FILE)
+        assert file_id is not None
+        assert (first.loaded, second.loaded) == (["rates.pdf"], [])
+        router.process_file(file_id)
+        assert (first.loaded, second.loaded) == (["rates.pdf"], ["rates.pdf"])
+
+        _, file_id = router.load_file(FILE)
+        assert file_id is not None
+        router.delete_file(file_id)
+        assert second.deleted == ["rates.pdf", "rates.pdf"]
+
+    def test_failover_on_server_error(self: Self) -> None:
+        """Ошибка сервера учитывается в статистике, модель остаётся доступной."""
+        first, second = FakeAgent(BackendUnavailableError("503")), FakeAgent()
+        router = _router(first, second)
+        _process(router)
+        assert second.processed == ["rates.pdf"]
+        assert router.backends[0].stats.error_rate == 1.0
+        assert router.backends[0].stats.available
+
+    def test_failover_on_upload_error(self: Self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Если загрузка в модель не удалась, документ обрабатывает следующая модель."""
+        postponed: list[str] = []
+        monkeypatch.setattr(jobs, "postpone", postponed.append)
+        first, second = FakeAgent(upload_error="429 quota exceeded"), FakeAgent()
+        router = _router(first, second)
+        _process(router)
+        assert (first.processed, second.processed) == ([], ["rates.pdf"])
+        assert router.backends[0].stats.error_rate == 1.0
+        assert postponed == []
+
+        second.upload_error = "503"
+        _process(router)
+        assert postponed == ["G:model-0: 429 quota exceeded; G:model-1: 503"]
+
+    def test_other_errors_not_retried(self: Self) -> None:
+        """Ошибки, не связанные с моделью, не приводят к переключению."""  # noqa: RUF002
+        first, second = FakeAgent(KeyError("bug")), FakeAgent()
+        router = _router(first, second)
+        with pytest.raises(KeyError):
+            _process(router)
+        assert second.processed == []
+
+    def test_nothing_available(self: Self) -> None:
+        """Если все модели исчерпали квоту, обработка пропускается."""
+        agent = FakeAgent(QuotaExceededError("429", retry_after=60))
+        router = _router(agent)
+        _process(router)
+        _process(router)
+        assert router.candidates() == []
+
+    def test_latency_policy(self: Self) -> None:
+        """Быстрая модель выбирается раньше, ошибки ухудшают оценку."""
+        slow, fast, failing = FakeAgent(), FakeAgent(), FakeAgent()
+        router = _router(slow, fast, failing, policy=LatencyPolicy())
+        router.backends[0].stats.record(10.0, ok=True)
+        router.backends[1].stats.record(2.0, ok=True)
+        router.backends[2].stats.record(1.0, ok=True)
+        router.backends[2].stats.record(1.0, ok=False)
+        assert [backend.agent for backend in router.candidates()] == [fast, failing, slow]
+
+    def test_quota_policy_and_daily_limit(self: Self) -> None:
+        """Модель с большим остатком квоты выбирается первой, исчерпанная суточная квота исключает модель."""  # noqa: RUF002
+        small, large = FakeAgent(), FakeAgent()
+        router = AgentRouter(
+            [Backend(BackendSpec("G", None, 1), small), Backend(BackendSpec("S", None, 5), large)],
+            QuotaPolicy(),
+        )
+        assert router.candidates()[0].agent is large
+        router.backends[0].stats.use()
+        assert [backend.agent for backend in router.candidates()] == [large]
+
+    def test_async_path(self: Self) -> None:
+        """Асинхронная обработка использует те же правила переключения."""
+        first, second = FakeAgent(QuotaExceededError("429")), FakeAgent()
+        router = _router(first, second)
+
+        async def run() -> None:
+            _, file_id = await router.aload_file(FILE)
+            assert file_id is not None
+            await router.aprocess_file(file_id)
+
+        asyncio.run(run())
+        assert second.processed == ["rates.pdf"]
+
+    def test_parse_specs(self: Self) -> None:
+        """Список моделей из настроек."""
+        specs = BackendSpec.parse("g:gemini-2.5-flash:250, S ,")
+        assert specs == [BackendSpec("G", "gemini-2.5-flash", 250), BackendSpec("S")]
+        assert specs[0].name == "G:gemini-2.5-flash"
+        with pytest.raises(ValueError, match="Invalid backend spec"):
+            BackendSpec.parse("G:model:many")
+        with pytest.raises(ValueError, match="Unknown routing policy"):
+            AgentRouter.from_specs(specs, lambda _: FakeAgent(), "fastest")  # type: ignore[arg-type, return-value]
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from enum import Enum
+from http import HTTPMethod
+from typing import Annotated, Self
+
+from pydantic import Field
+
+from src.agents._gemini import tools as gemini_tools
+from src.agents._gemini.utils import func_to_gemi
+from src.core.tools import ToolRegistry, ToolResult
+
+
+class Color(Enum):
+    """Тестовый enum."""
+
+    RED = "red"
+    BLUE = "blue"
+
+
+registry = ToolRegistry(default_timeout=1)
+
+
+@registry.tool
+def paint(
+    color: Annotated[Color, Field(description="Color")],
+    times: Annotated[int, Field(description="Times")] = 1,
+) -> str:
+    """Paint something."""
+    return color.value * times
+
+
+@registry.tool(timeout=0.05)
+def slow(delay: Annotated[float, Field(description="Delay")]) -> float:
+    """Sleep."""
+    time.sleep(delay)
+    return delay
+
+
+@registry.tool
+async def apaint(color: Annotated[Color, Field(description="Color")]) -> str:
+    """Paint something asynchronously."""
+    await asyncio.sleep(0)
+    return color.value
+
+
+@registry.tool
+def broken() -> None:
+    """Fail always."""
+    msg = "boom"
+    raise RuntimeError(msg)
+
+
+class TestToolRegistry:
+    """Тесты для реестра инструментов."""
+
+    def test_declarations(self: Self) -> None:
+        """Описания строятся для всех зарегистрированных инструментов."""
+        declarations = registry.declarations(func_to_gemi)
+        assert [d.name for d in declarations] == ["paint", "slow", "apaint", "broken"]
+        assert "paint" in registry
+        assert len(registry) == 4  # noqa: PLR2004
+
+    def test_coercion(self: Self) -> None:
+        """Аргументы приводятся к типам из сигнатуры."""
+        result = registry.call("paint", {"color": "red", "times": "2"})
+        assert result.ok
+        assert result.value == "redred"
+
+    def test_validation_error(self: Self) -> None:
+        """Неверные аргументы отклоняются до вызова."""
+        result = registry.call("paint", {"color": "green", "times": "x"})
+        assert not result.ok
+        assert result.error == "validation"
+        assert [d["loc"] for d in result.details] == ["color", "times"]
+        assert result.error_response()["error"]["type"] == "validation"
+
+    def test_unknown_and_failed(self: Self) -> None:
+        """Неизвестный инструмент и исключение в инструменте возвращаются как ошибки."""
+        assert registry.call("missing", {}).error == "unknown_tool"
+        result = registry.call("broken", None)
+        assert result.error == "execution"
+        assert "boom" in result.message
+
+    def test_timeout(self: Self) -> None:
+        """Долгий инструмент прерывается по времени."""
+        result = registry.call("slow", {"delay": 0.5})
+        assert result.error == "timeout"
+        assert result.elapsed < 0.5  # noqa: PLR2004
+
+    def test_async(self: Self) -> None:
+        """Асинхронные инструменты вызываются из обоих вариантов."""
+        assert registry.call("apaint", {"color": "blue"}).value == "blue"
+        assert asyncio.run(registry.acall("apaint", {"color": "red"})).value == "red"
+        assert asyncio.run(registry.acall("paint", {"color": "red"})).value == "red"
+        assert asyncio.run(registry.acall("slow", {"delay": 0.5})).error == "timeout"
+
+    def test_hung_calls_do_not_starve(self: Self) -> None:
+        """Зависшие инструменты не занимают потоки, нужные следующим вызовам."""
+        for _ in range(6):
+            assert registry.call("slow", {"delay": 0.5}).error == "timeout"
+        result = registry.call("paint", {"color": "red"})
+        assert result.ok
+        assert result.elapsed < 0.3  # noqa: PLR2004
+
+    def test_http_method_case(self: Self) -> None:
+        """Метод HTTP-запроса принимается в любом регистре."""
+        prepared = gemini_tools.registry._prepare("http_request", {"method": "post", "url": "http://docapi"})  # noqa: SLF001
+        assert not isinstance(prepared, ToolResult)
+        assert prepared[1]["method"] == HTTPMethod.POST
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+from typing import Any, Self
+
+from src.agents._gemini.assistants import KeyRatesAgent
+from src.agents._gemini.uploads import KEEP_AFTER_USE, RETENTION, UploadCache
+from src.dto import FileDTO
+
+RATES = FileDTO(type_="pdf", name="rates.pdf", content=b"%PDF rates")
+COPY = FileDTO(type_="pdf", name="copy.pdf", content=b"%PDF rates")
+
+
+class FakeFiles:
+    """Файлы модели: загрузка, удаление и список хранимых файлов."""
+
+    def __init__(self: Self) -> None:  # noqa: D107
+        self.stored: list[str] = []
+        self.uploads = 0
+        self.deleted: list[str] = []
+        self.keep_deleted = False  # Удаление не срабатывает: файл остаётся в списке
+
+    def upload(self: Self, file: Any, config: Any) -> SimpleNamespace:  # noqa: ANN401, ARG002, D102
+        self.uploads += 1
+        uri = f"files/{self.uploads}"
+        self.stored.append(uri)
+        return SimpleNamespace(uri=uri)
+
+    def delete(self: Self, name: str) -> None:  # noqa: D102
+        self.deleted.append(name)
+        if not self.keep_deleted:
+            self.stored.remove(name)
+
+    def list(self: Self) -> list[SimpleNamespace]:  # noqa: D102
+        return [SimpleNamespace(uri=uri) for uri in self.stored]
+
+
+class Clock:
+    """Управляемое время."""
+
+    def __init__(self: Self) -> None:  # noqa: D107
+        self.now = 0.0
+
+    def __call__(self: Self) -> float:  # noqa: D102
+        return self.now
+
+
+class TestUploads:
+    """Тесты для повторного использования загруженных файлов."""
+
+    def test_agent_reuses_upload(self: Self) -> None:
+        """Одинаковое содержимое загружается один раз, удаление не задерживает обработку."""
+        files = FakeFiles()
+        agent = KeyRatesAgent("key", "http://docapi", "", "")
+        agent._model = SimpleNamespace(files=files)  # type: ignore[assignment]  # noqa: SLF001
+
+        _, first = agent.load_file(RATES)
+        _, second = agent.load_file(COPY)
+        assert first == second == "files/1"
+        agent.delete_file(first)  # type: ignore[arg-type]
+        agent.delete_file(second)  # type: ignore[arg-type]
+        assert files.uploads == 1
+        assert files.deleted == []
+
+        agent.close()
+        assert files.deleted == ["files/1"]
+
+    def test_reaper_waits_for_reuse(self: Self) -> None:
+        """Освобождённый файл удаляется, только если его не использовали заданное время."""  # noqa: RUF002
+        files, clock = FakeFiles(), Clock()
+        cache = UploadCache(files.delete, lambda: [file.uri for file in files.list()], clock=clock)
+        files.upload(None, None)
+        cache.add(RATES.content, "files/1")
+        cache.release("files/1")
+
+        clock.now = KEEP_AFTER_USE / 2
+        assert cache.reap() == 0
+        assert cache.acquire(COPY.content) == "files/1"
+        cache.release("files/1")
+        clock.now += KEEP_AFTER_USE
+        assert cache.reap() == 1
+        assert cache.acquire(COPY.content) is None
+
+    def test_failed_delete_is_retried(self: Self) -> None:
+        """Файл, оставшийся после удаления, удаляется при следующем проходе."""
+        files, clock = FakeFiles(), Clock()
+        cache = UploadCache(files.delete, lambda: [file.uri for file in files.list()], keep=0, clock=clock)
+        files.upload(None, None)
+        cache.add(RATES.content, "files/1")
+        cache.release("files/1")
+        files.keep_deleted = True
+        assert cache.reap() == 1
+
+        files.keep_deleted = False
+        cache.reap()
+        assert files.deleted == ["files/1", "files/1"]
+        assert files.stored == []
+
+    def test_expired_upload_not_reused(self: Self) -> None:
+        """Файл, который модель скоро удалит, не используется повторно."""
+        files, clock = FakeFiles(), Clock()
+        cache = UploadCache(files.delete, list, clock=clock)
+        files.upload(None, None)
+        cache.add(RATES.content, "files/1")
+        cache.release("files/1")
+        clock.now = RETENTION
+        assert cache.acquire(RATES.content) is None
+        assert cache.reap() == 1
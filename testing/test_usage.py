@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import datetime as dt
+from typing import TYPE_CHECKING, Self
+
+import pytest
+from google.genai import types as gtypes
+
+from src import pipeline
+from src.agents._gemini.assistants import _usage
+from src.core import usage
+from src.core.usage import BudgetExceededError, Price, Usage, document_usage, parse_prices, price_for, record
+from src.dao import jobs as jobs_module
+from src.dao.jobs import JobStage, JobStore
+from src.dto import FileDTO
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+FILE = FileDTO(type_="pdf", name="rates.pdf", content=b"%PDF")
+STEP = Usage(input=1000, cached=400, tool=100, output=200)
+
+
+@pytest.fixture
+def budget(monkeypatch: pytest.MonkeyPatch) -> usage.UsageSettings:
+    """Настройки учёта с известной ценой модели и без бюджета."""  # noqa: RUF002
+    settings = usage.UsageSettings(prices={"test-model": Price(1.0, 0.5, 4.0)})
+    monkeypatch.setattr(usage, "settings", settings)
+    return settings
+
+
+class SpendingAgent:
+    """Агент, каждый шаг которого расходует `STEP` токенов."""
+
+    def __init__(self: Self, steps: int) -> None:  # noqa: D107
+        self.steps = steps
+
+    def load_file(self: Self, file_dto: FileDTO) -> tuple[str | None, str | None]:  # noqa: D102
+        return None, file_dto.name
+
+    def process_file(self: Self, file_id: str) -> None:  # noqa: ARG002, D102
+        for _ in range(self.steps):
+            record("test", "test-model", STEP)
+
+    def delete_file(self: Self, file_id: str) -> None:  # noqa: D102
+        pass
+
+
+class TestUsage:
+    """Тесты для учёта токенов и стоимости."""
+
+    def test_step_cost_and_document_account(self: Self, budget: usage.UsageSettings) -> None:  # noqa: ARG002
+        """Кэшированные токены оплачиваются по своей цене, счёт документа и метрики отправителя растут."""
+        before = usage.TOKENS.value(backend="test", model="test-model", kind="cached")
+        with document_usage("bank@example.com", "rates.pdf") as account:
+            cost = record("test", "test-model", STEP)
+            record("test", "test-model", STEP)
+
+        assert cost == pytest.approx((600 * 1.0 + 400 * 0.5 + 200 * 4.0) / 1_000_000)
+        assert account.summary() == {
+            "input": 2000,
+            "cached": 800,
+            "tool": 200,
+            "output": 400,
+            "cost": round(2 * cost, 6),
+            "steps": 2,
+        }
+        assert usage.TOKENS.value(backend="test", model="test-model", kind="cached") == before + 800
+        assert usage.SENDER_COST.value(sender="bank@example.com") >= 2 * cost
+        assert record("test", "unknown-model", STEP) == 0
+
+    def test_prices(self: Self) -> None:
+        """Цена выбирается по самому длинному совпадению, цены из настроек проверяются."""
+        assert price_for("gemini-2.5-flash-lite-preview-06-17") == usage.PRICES["gemini-2.5-flash-lite"]
+        assert price_for("gemini-2.5-flash") == usage.PRICES["gemini-2.5-flash"]
+        assert parse_prices("GigaChat-2-Max=2/1/2, ") == {"GigaChat-2-Max": Price(2.0, 1.0, 2.0)}
+        with pytest.raises(ValueError, match="Invalid model price"):
+            parse_prices("GigaChat=2/1")
+
+    def test_gemini_step_usage(self: Self) -> None:
+        """Ответы функций в запросе Gemini оцениваются по тексту, рассуждения входят в ответ."""
+        metadata = gtypes.GenerateContentResponseUsageMetadata(
+            prompt_token_count=500,
+            cached_content_token_count=300,
+            candidates_token_count=20,
+            thoughts_token_count=30,
+        )
+        contents = [
+            gtypes.Part(text="prompt"),
+            gtypes.Part(function_response=gtypes.FunctionResponse(name="http_request", response={"data": "ok"})),
+        ]
+
+        step = _usage(metadata, contents)
+
+        assert (step.input, step.cached, step.output) == (500, 300, 50)
+        assert 0 < step.tool < step.input
+
+    def test_budget_stops_document_across_restarts(
+        self: Self,
+        budget: usage.UsageSettings,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """Расход прошлых запусков учитывается: документ сверх бюджета завершается неудачей без повторов."""
+        store = JobStore()
+        store.open(tmp_path / "jobs.sqlite3", dt.timedelta(hours=1))
+        monkeypatch.setattr(jobs_module, "jobs", store)
+        monkeypatch.setattr(pipeline, "jobs", store)
+        budget.document_tokens = 5 * STEP.total
+        job = store.add("Bank <Bank@Example.com>|2025-07-01|Ставки", FILE)
+
+        pipeline.process_job(SpendingAgent(steps=3), job)  # type: ignore[arg-type]
+        assert store.get(job.key).usage["steps"] == 3  # type: ignore[index, union-attr]  # noqa: PLR2004
+        # Документ обрабатывается повторно, например после сбоя при записи итога
+        store.update(job, JobStage.UPLOADED)
+
+        pipeline.process_job(SpendingAgent(steps=3), job)  # type: ignore[arg-type]
+
+        stored = store.get(job.key)
+        assert stored is not None
+        assert stored.stage == JobStage.FAILED
+        assert stored.error.startswith("token budget")  # type: ignore[union-attr]
+        assert stored.usage["steps"] == 6  # type: ignore[index]  # noqa: PLR2004
+        assert pipeline.sender(job.source) == "bank@example.com"
+        with pytest.raises(BudgetExceededError), document_usage(spent=stored.usage):
+            record("test", "test-model", STEP)
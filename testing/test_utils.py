@@ -8,6 +8,8 @@ from google.genai.types import FunctionDeclaration, Schema, Type
 from pydantic import BaseModel, Field
 
 from src.agents._gemini.utils import _generate_schema_from_python_type, func_to_gemi
+from src.agents._gigachat.utils import func_to_giga
+from src.core.tool_schema import compile_function, compile_type
 
 
 class TestEnum(Enum):
@@ -355,3 +357,93 @@ class TestEdgeCases:
         result = func_to_gemi(test_func)
         assert "multiline docstring" in result.description  # type: ignore
         assert "multiple lines" in result.description  # type: ignore
+
+
+class TestToolSchema:
+    """Тесты для общего описания инструментов."""
+
+    def test_compiled_once(self: Self) -> None:
+        """Описания типов и функций кэшируются, провайдеры отдают копии готового описания."""
+
+        def test_func(x: Annotated[TestModel, Field(description="Model parameter")]) -> str:
+            """Test function."""
+            return x.name
+
+        assert compile_type(TestModel) is compile_type(TestModel)
+        assert compile_function(test_func) is compile_function(test_func)
+        assert func_to_gemi(test_func) == func_to_gemi(test_func)
+        assert func_to_gemi(test_func) is not func_to_gemi(test_func)
+
+    def test_shared_defs(self: Self) -> None:
+        """Модель, встречающаяся несколько раз, описывается один раз в defs."""
+
+        def test_func(
+            first: Annotated[TestModel, Field(description="First model")],
+            second: Annotated[list[TestModel], Field(description="Other models")],
+        ) -> str:
+            """Function with repeated model."""
+            return first.name + str(second)
+
+        result = func_to_gemi(test_func)
+
+        assert result.parameters is not None
+        assert result.parameters.defs is not None
+        assert result.parameters.defs["TestModel"].properties is not None
+        assert "name" in result.parameters.defs["TestModel"].properties
+        assert result.parameters.properties is not None
+        assert result.parameters.properties["first"].ref == "#/$defs/TestModel"
+        assert result.parameters.properties["first"].description == "First model"
+        assert result.parameters.properties["second"].items is not None
+        assert result.parameters.properties["second"].items.ref == "#/$defs/TestModel"
+
+    def test_func_to_giga(self: Self) -> None:
+        """Описание для GigaChat строится из того же представления."""
+
+        def test_func(
+            status: Annotated[TestEnum, Field(description="Status")],
+            profile: Annotated[NestedModel | None, Field(default=None, description="Profile")],
+        ) -> str:
+            """Function for GigaChat."""
+            return status.value + str(profile)
+
+        result = func_to_giga(test_func, fine_tunes={"description": "Tuned"})
+
+        assert result.name == "test_func"
+        assert result.description == "Tuned"
+        assert result.parameters.required == ["status"]
+        props = result.parameters.properties
+        assert props["status"].enum == ["a", "b", "c"]
+        assert props["profile"].type_ == "object"
+        assert props["profile"].properties["test_model"].properties["age"].type_ == "integer"
+        assert props["profile"].required == ["nested_field", "test_model"]  # type: ignore[attr-defined]
+        assert props["profile"].properties["test_model"].required == ["name", "age"]  # type: ignore[attr-defined]
+
+    def test_giga_array_items_keep_required(self: Self) -> None:
+        """Элементы массива моделей описываются словарём с обязательными полями."""  # noqa: RUF002
+
+        def test_func(
+            models: Annotated[list[TestModel], Field(description="Models")],
+        ) -> None:
+            """Function for GigaChat."""
+
+        items = func_to_giga(test_func).dict(by_alias=True, exclude_none=True)["parameters"]["properties"]["models"]
+        assert items["items"]["type"] == "object"
+        assert items["items"]["required"] == ["name", "age"]
+
+    def test_cached_schema_is_not_shared(self: Self) -> None:
+        """Изменение полученного описания не затрагивает кэш и другие функции."""
+
+        def first(model: Annotated[TestModel, Field(description="Model")]) -> None:
+            """First."""
+
+        def second(model: Annotated[TestModel, Field(description="Model")]) -> None:
+            """Second."""
+
+        func_to_gemi(first).parameters.properties["model"].required.append("email")  # type: ignore[union-attr]
+        func_to_giga(first).parameters.properties["model"].required.append("email")  # type: ignore[attr-defined]
+
+        assert func_to_gemi(second).parameters.properties["model"].required == ["name", "age"]  # type: ignore[union-attr]
+        assert func_to_giga(first).parameters.properties["model"].required == ["name", "age"]  # type: ignore[attr-defined]
+        assert compile_type(TestModel).required == ("name", "age")
+        with pytest.raises(TypeError):
+            compile_type(TestModel).properties["name"] = compile_type(str)  # type: ignore[index]
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import datetime as dt
+import json
+import threading
+import time
+from typing import TYPE_CHECKING, Self
+
+from src.dao.warm_start import CACHE_VERSION, Bootstrap, WarmCache
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+SOURCES = {"attrs": "http://docapi/attrs", "names": "http://docapi/names"}
+
+
+class FakeServer:
+    """Сервер справочных данных со счётчиком запросов."""  # noqa: RUF002
+
+    def __init__(self: Self, delay: float = 0.0) -> None:  # noqa: D107
+        self.values = {"http://docapi/attrs": "a1", "http://docapi/names": "n1"}
+        self.calls: list[str] = []
+        self.delay = delay
+        self.threads: set[str] = set()
+
+    def __call__(self: Self, url: str) -> str | None:  # noqa: D102
+        self.calls.append(url)
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        return self.values.get(url)
+
+
+class TestWarmCache:
+    """Тесты для кэша справочных данных."""
+
+    def test_expired_entry_only_on_request(self: Self, tmp_path: Path) -> None:
+        """Значение с истёкшим сроком хранения возвращается, только если устаревшее допустимо."""  # noqa: RUF002
+        cache = WarmCache()
+        cache.open(tmp_path / "cache.json", dt.timedelta(0))
+        cache.put("gigachat-tools:abc", "ok")
+
+        assert cache.get("gigachat-tools:abc") is None
+        entry = cache.get("gigachat-tools:abc", stale=True)
+        assert entry is not None
+        assert not entry.fresh
+
+        cache.open(tmp_path / "cache.json", dt.timedelta(hours=1))
+        assert cache.get("gigachat-tools:abc") is not None
+
+
+class TestBootstrap:
+    """Тесты для справочных данных агента."""
+
+    def test_cold_start_fetches_in_parallel(self: Self, tmp_path: Path) -> None:
+        """Без кэша значения запрашиваются параллельно и сохраняются."""
+        cache = WarmCache()
+        cache.open(tmp_path / "cache.json", dt.timedelta(hours=1))
+        server = FakeServer(delay=0.2)
+        start = time.monotonic()
+        meta = Bootstrap(SOURCES, server, cache)
+        assert time.monotonic() - start < 0.35  # noqa: PLR2004
+        assert meta["attrs"] == "a1"
+        assert len(server.threads) == 2  # noqa: PLR2004
+
+        data = json.loads((tmp_path / "cache.json").read_text(encoding="utf-8"))
+        assert data["version"] == CACHE_VERSION
+        assert data["entries"]["http://docapi/names"]["value"] == "n1"
+
+    def test_warm_start_without_requests(self: Self, tmp_path: Path) -> None:
+        """После перезапуска свежие значения берутся из файла без запросов."""
+        cache = WarmCache()
+        cache.open(tmp_path / "cache.json", dt.timedelta(hours=1))
+        Bootstrap(SOURCES, FakeServer(), cache)
+
+        restarted = WarmCache()
+        restarted.open(tmp_path / "cache.json", dt.timedelta(hours=1))
+        server = FakeServer()
+        meta = Bootstrap(SOURCES, server, restarted)
+        assert meta["names"] == "n1"
+        assert server.calls == []
+        assert meta.refresh_in_background() is None
+
+    def test_stale_refreshed_in_background(self: Self, tmp_path: Path) -> None:
+        """Устаревшие значения доступны сразу и обновляются в фоне."""
+        cache = WarmCache()
+        cache.open(tmp_path / "cache.json", dt.timedelta(0))
+        Bootstrap(SOURCES, FakeServer(), cache)
+
+        server = FakeServer()
+        server.values["http://docapi/attrs"] = "a2"
+        meta = Bootstrap(SOURCES, server, cache)
+        assert meta["attrs"] == "a1"
+
+        changes: list[list[str]] = []
+        thread = meta.refresh_in_background(changes.append)
+        assert thread is not None
+        thread.join(timeout=5)
+        assert meta["attrs"] == "a2"
+        assert changes == [["attrs"]]
+
+    def test_unavailable_server_keeps_value(self: Self) -> None:
+        """Если сервер не ответил, остаётся прежнее значение."""
+        cache = WarmCache()
+        meta = Bootstrap(SOURCES, FakeServer(), cache)
+        assert meta.refresh(["attrs"]) == []
+        assert Bootstrap(SOURCES, lambda _: None, cache)["attrs"] == "a1"
+        assert Bootstrap(SOURCES, lambda _: None, WarmCache())["attrs"] is None
+
+    def test_version_mismatch_ignored(self: Self, tmp_path: Path) -> None:
+        """Файл другого формата не используется."""
+        path = tmp_path / "cache.json"
+        path.write_text(json.dumps({"version": -1, "entries": {"x": {"value": "1", "fetched_at": 0}}}))
+        cache = WarmCache()
+        cache.open(path, dt.timedelta(hours=1))
+        assert cache.get("x") is None